@@ -1,14 +1,40 @@
-from csv import DictWriter
+import argparse
+import asyncio
+import csv
+import multiprocessing
+import tomllib
+from pathlib import Path
 from random import choices
 from string import ascii_letters, digits
 
 import inquirer
 from inquirer.errors import ValidationError
 
-from app.schemas.company import CompanyWithJobCounts, CompanyWithLinkedinSlug
-from app.utils.cience import get_companies
-from app.utils.coresignal import enrich_company_with_coresignal_job_counts
-from app.utils.linkedin import enrich_company_with_linkedin_job_counts, setup_driver
+from app.core.config import settings
+from app.schemas.company import CompanyRecord, company_fields, job_count_keywords
+from app.utils.cience import fetch_engines, get_llm_cache
+from app.utils.job_cache import get_job_cache, get_new_job_counts
+from app.utils.journal import RunJournal
+from app.utils.metrics import metrics, write_json_report, write_prometheus_report
+from app.utils.output import MultiWriter, output_writers
+from app.utils.page_pruning import pruning_stats
+from app.utils.pipeline import run_pipeline
+from app.utils.refresh import get_delta_filename, get_refresh_filename, read_baseline_slugs, seed_job_cache, write_delta
+from app.utils.snapshot import snapshots
+
+# Revenue ranges companies can be searched for on cience
+revenues = [
+    "under-1m",
+    "1m-5m",
+    "5m-10m",
+    "10m-25m",
+    "25m-50m",
+    "50m-100m",
+    "100m-250m",
+    "250m-500m",
+    "500m-1b",
+    "over-1b",
+]
 
 
 def validate_numeric_input(_, choice) -> bool:
@@ -31,6 +57,48 @@ def validate_numeric_input(_, choice) -> bool:
     raise ValidationError(choice, "Input must be a number or empty")
 
 
+def get_journal_filename(filename: str) -> str:
+    """
+    Get the path of the journal of the run writing to a given output file.
+
+    Args:
+        filename: The path of the output file.
+
+    Returns:
+        The path of the journal file, next to the output file.
+    """
+    return f"{filename}.journal"
+
+
+def check_job_count_keywords(params: dict, filename: str | Path | None = None):
+    """
+    Make sure an earlier run is continued with the keywords it counted jobs for, since its rows have a job count column
+    for each of them.
+
+    Args:
+        params: The parameters of the earlier run, from its journal or work queue.
+        filename: The path of the CSV file of the earlier run. Its header is checked too, for runs started before the
+            keywords were kept in their parameters.
+
+    Raises:
+        SystemExit: If the keywords of the earlier run are not the JOB_COUNT_KEYWORDS setting.
+    """
+    keywords = params.get("keywords")
+    fieldnames = None
+    if filename and Path(filename).exists():
+        with open(filename, newline="") as file:
+            fieldnames = next(csv.reader(file), None)
+
+    if (keywords is not None and keywords != list(job_count_keywords)) or (
+        fieldnames is not None and fieldnames != company_fields
+    ):
+        raise SystemExit(
+            f"The job counts of {filename or 'the run'} were counted for other keywords than JOB_COUNT_KEYWORDS "
+            f"({', '.join(job_count_keywords)}), set it to the keywords of the run"
+            + (f" ({', '.join(keywords)})" if keywords else "")
+        )
+
+
 def take_input():
     """
     Prompt the user for input regarding the industry group, revenue range, and the number of pages to search.
@@ -44,21 +112,7 @@ def take_input():
     print()
 
     # Ask for the revenue range from a predefined list of choices
-    revenue = inquirer.list_input(
-        message="What revenue range do you want to search for?",
-        choices=[
-            "under-1m",
-            "1m-5m",
-            "5m-10m",
-            "10m-25m",
-            "25m-50m",
-            "50m-100m",
-            "100m-250m",
-            "250m-500m",
-            "500m-1b",
-            "over-1b",
-        ],
-    )
+    revenue = inquirer.list_input(message="What revenue range do you want to search for?", choices=revenues)
     print()
 
     # Ask for the maximum number of pages to search and validate the input
@@ -77,127 +131,468 @@ def take_input():
     return industry_group, revenue, max_pages
 
 
-def fetch_companies_from_cience(
-    industry_group: str, revenue: str, max_pages: int = None
-) -> list[CompanyWithLinkedinSlug]:
+def fetch_enriched_companies_from_linkedin(companies: list[CompanyRecord]) -> list[CompanyRecord]:
     """
-    Fetch a list of companies from the Cience database for a given industry group and revenue range.
+    Fetch job counts for a list of companies from LinkedIn.
 
     Args:
-        industry_group: The industry group to search within.
-        revenue: The revenue range to filter companies.
-        max_pages: The maximum number of result pages to fetch. Defaults to None for all pages.
+        companies: A list of CompanyRecord objects to fetch job counts for.
 
     Returns:
-        A list of CompanyWithLinkedinSlug objects representing the companies found.
+        A list of the CompanyRecord objects that were enriched with job counts.
     """
-    # Print a header for the operation
+    # Selenium is only needed, and only has to be installed, when job counts are fetched from LinkedIn
+    from app.utils.linkedin import enrich_companies_with_linkedin_job_counts
+
     print("----------------------------------------------------")
-    print("Fetching companies from cience.com")
+    print("Fetching job counts from linkedin")
     print("----------------------------------------------------")
 
-    # Use the get_companies function to fetch companies based on the specified criteria
-    companies = get_companies(industry_group, revenue, max_pages)
+    # Look up the job counts that are still fresh from earlier runs
+    job_cache = get_job_cache()
+    cached_counts = job_cache.get_many(
+        "linkedin", [company.linkedin_slug for company in companies if company.linkedin_slug], list(job_count_keywords)
+    )
+
+    # If company has no LinkedIn slug, skip it
+    for company in companies:
+        if not company.linkedin_slug:
+            print("Skipping", company.company_name, "because it has no linkedin slug")
+    companies = [company for company in companies if company.linkedin_slug]
+
+    print("Setting up", settings.LINKEDIN_WORKERS, "browsers to search on linkedin", end="\n\n")
+
+    enriched_companies = []
+    results = enrich_companies_with_linkedin_job_counts(companies, cached_counts)
+    for i, (company, result) in enumerate(results):
+        if isinstance(result, Exception):
+            print("Skipping", company.company_name, "because its job counts could not be fetched:", repr(result))
+            continue
 
-    # Display the number of companies found
-    print("\nFound", len(companies), "companies", end="\n\n")
+        enriched_companies.append(result)
+        print("Fetched job counts for", company.company_name, "(", i + 1, "/", len(companies), ")")
 
-    return companies
+    # Store the fetched job counts for later runs
+    job_cache.set_many(
+        "linkedin",
+        {
+            company.linkedin_slug: get_new_job_counts(company, cached_counts.get(company.linkedin_slug))
+            for company in enriched_companies
+        },
+    )
 
+    print("\nFound", len(enriched_companies), "enriched companies", end="\n\n")
+
+    return enriched_companies
 
-def fetch_enriched_companies_from_linkedin(companies: list[CompanyWithLinkedinSlug]) -> list[CompanyWithJobCounts]:
+
+def get_batch_searches(args: argparse.Namespace) -> tuple[list[list[str]], int | None]:
     """
-    Fetch job counts for a list of companies from LinkedIn.
+    Get the searches of a batch run from the command line arguments and the job spec file they point to.
+
+    Arguments given on the command line take precedence over the ones in the job spec file.
 
     Args:
-        companies: A list of CompanyWithLinkedinSlug objects to fetch job counts for.
+        args: The parsed command line arguments.
 
     Returns:
-        A list of CompanyWithJobCounts objects representing the companies with job counts.
+        tuple: A tuple containing every [industry group, revenue range] pair to search for, and the maximum number of
+            pages to search for each of them.
     """
-    print("----------------------------------------------------")
-    print("Fetching job counts from linkedin")
-    print("----------------------------------------------------")
+    spec = {}
+    if args.spec:
+        with open(args.spec, "rb") as file:
+            spec = tomllib.load(file)
 
-    driver = setup_driver()
-    print("Setup browser to search on linkedin", end="\n\n")
+    industry_groups = args.industry or spec.get("industries", [])
+    if not industry_groups:
+        raise SystemExit("No industry groups to search for, pass --industry or set industries in the job spec file")
 
-    enriched_companies = []
-    for i, company in enumerate(companies):
-        # If company has no LinkedIn slug, skip it
-        if not company.linkedin_slug:
-            print("Skipping", company.company_name, "because it has no linkedin slug")
-            continue
+    batch_revenues = args.revenue or spec.get("revenues", "all")
+    if isinstance(batch_revenues, str):
+        batch_revenues = [batch_revenues]
+    if "all" in batch_revenues:
+        batch_revenues = revenues
+    for revenue in batch_revenues:
+        if revenue not in revenues:
+            raise SystemExit(f"Unknown revenue range {revenue}, choose from: all, {', '.join(revenues)}")
 
-        # Fetch job counts for the current company
-        enriched_companies.append(enrich_company_with_linkedin_job_counts(driver, company))
-        print("Fetched job counts for", company.company_name, "(", i + 1, "/", len(companies), ")")
+    max_pages = args.max_pages if args.max_pages is not None else spec.get("max_pages")
 
-    # Clean up the driver
-    driver.quit()
-    print("\nFound", len(enriched_companies), "enriched companies", end="\n\n")
+    # Drop duplicates, keeping the order of the searches
+    industry_groups = dict.fromkeys(industry_group.lower().replace(" ", "-") for industry_group in industry_groups)
+    batch_revenues = dict.fromkeys(batch_revenues)
+    searches = [[industry_group, revenue] for industry_group in industry_groups for revenue in batch_revenues]
 
-    return enriched_companies
+    return searches, max_pages
 
 
-def fetch_enriched_companies_from_coresignal(companies: list[CompanyWithLinkedinSlug]) -> list[CompanyWithJobCounts]:
+def get_searches(args: argparse.Namespace) -> tuple[list[list[str]], int | None]:
     """
-    Fetch job counts for a list of companies from Coresignal.
+    Get the searches of a new run, from the command line arguments in batch mode, or by prompting the user otherwise.
 
     Args:
-        companies: A list of CompanyWithLinkedinSlug objects to fetch job counts for.
+        args: The parsed command line arguments.
 
     Returns:
-        A list of CompanyWithJobCounts objects representing the companies with job counts.
+        tuple: A tuple containing every [industry group, revenue range] pair to search for, and the maximum number of
+            pages to search for each of them.
     """
-    print("----------------------------------------------------")
-    print("Fetching job counts from Coresignal")
-    print("----------------------------------------------------")
+    if args.industry or args.spec:
+        # Search for every combination of industry group and revenue range without prompting
+        return get_batch_searches(args)
 
-    enriched_companies = []
-    for i, company in enumerate(companies):
-        enriched_companies.append(enrich_company_with_coresignal_job_counts(company))
-        print("Fetched job counts for", company.company_name, "(", i + 1, "/", len(companies), ")")
+    industry_group, revenue, max_pages = take_input()
+    return [[industry_group, revenue]], max_pages
 
-    print("\nFound", len(enriched_companies), "enriched companies", end="\n\n")
 
-    return enriched_companies
+def get_output_filename(searches: list[list[str]]) -> str:
+    """
+    Generate the path of the CSV file of a new run.
+
+    Args:
+        searches: Every [industry group, revenue range] pair searched for by the run.
+
+    Returns:
+        The path of the CSV file, with one file for all the searches of a batch.
+    """
+    name = "_".join(searches[0]) if len(searches) == 1 else "batch"
+    return f"data/companies_{name}_{''.join(choices(ascii_letters + digits, k=10))}.csv"
+
+
+def write_profile(filename: str, companies: int, prometheus_file: str = None):
+    """
+    Write the performance report of a profiled run.
+
+    Args:
+        filename: The path of the output file of the run. The JSON report is written next to it.
+        companies: The number of companies written by the run.
+        prometheus_file: The path of a Prometheus textfile to also write the report to, if any.
+    """
+    report = metrics.get_report(companies, caches={"llm": get_llm_cache(), "job_counts": get_job_cache()})
 
+    write_json_report(report, f"{filename}.profile.json")
+    print(f"Performance report written to {filename}.profile.json")
 
-def write_enriched_companies_to_file(enriched_companies: list[CompanyWithJobCounts]):
+    if prometheus_file:
+        write_prometheus_report(report, prometheus_file)
+        print(f"Prometheus metrics written to {prometheus_file}")
+
+
+def fetch_and_enrich_companies(journal: RunJournal, prometheus_file: str = None, fetch_engine: str = None):
     """
-    Write the list of enriched companies to a CSV file.
+    Fetch the companies for every industry group and revenue range searched by a run from cience, enrich them with job
+    counts from Coresignal, and write them to a CSV file as they are enriched.
 
     Args:
-        enriched_companies: A list of CompanyWithJobCounts objects to write to file.
+        journal: The journal of the run, holding the output file and the parameters of the run.
+        prometheus_file: The path of a Prometheus textfile to write the performance report of a profiled run to.
+        fetch_engine: The engine to fetch results pages with, "browser" or "http", defaults to the CIENCE_FETCH_ENGINE
+            setting.
     """
     print("----------------------------------------------------")
-    print("Writing to file")
+    print("Fetching companies from cience.com and job counts from Coresignal")
     print("----------------------------------------------------")
 
-    # Generate filename
-    filename = f"data/companies_{industry_group}_{revenue}_{''.join(choices(ascii_letters + digits, k=10))}.csv"
+    filename = journal.params["output"]
+
+    baseline = journal.params.get("baseline")
+    if baseline:
+        # Reuse the slugs of the companies of the earlier run, and its job counts that are not too old
+        journal.slugs = {**read_baseline_slugs(baseline), **journal.slugs}
+        get_job_cache().ttl = journal.params["max_age_hours"] * 60 * 60
+
+    # Created outside of the try, so the error of a writer that can't be created, e.g. for an unknown format, is raised
+    # as it is instead of being hidden by the report on the rows written
+    writer = MultiWriter(filename, journal.params.get("formats"), append=True)
+    try:
+        with writer:
+            asyncio.run(run_pipeline(journal, writer, fetch_engine=fetch_engine))
+    except KeyboardInterrupt:
+        print("\nRun interrupted after writing", writer.rows, "companies to", filename)
+        print("Resume it with: --resume", filename)
+        raise SystemExit(130)
+    except Exception:
+        print("\nRun failed after writing", writer.rows, "companies to", filename)
+        print("Resume it with: --resume", filename, end="\n\n")
+        raise
+    finally:
+        journal.close()
+
+        # Report on interrupted runs too, since they are often the slow ones
+        if metrics.enabled:
+            write_profile(filename, writer.rows, prometheus_file)
+
+    print("\nFound", writer.rows, "enriched companies")
+    if writer.rows > 0:
+        print(f"List written to {', '.join(map(str, writer.filenames))} successfully")
+    if pruning_stats.pages:
+        print(pruning_stats.describe())
+
+    if baseline:
+        delta_filename = get_delta_filename(filename)
+        changes = write_delta(baseline, filename, delta_filename)
+        print(
+            f"Compared to {baseline}: {changes['added']} added, {changes['removed']} removed and {changes['changed']} "
+            f"changed companies, written to {delta_filename}"
+        )
+        job_cache = get_job_cache()
+        print("Job counts reused:", job_cache.hits, "fetched again:", job_cache.misses)
+
+
+def start_refresh(args: argparse.Namespace) -> RunJournal:
+    """
+    Start a run refreshing the CSV file of an earlier run.
 
-    # Open a file in write mode, and create a writer with the fieldnames from the first company
-    with open(filename, "w") as file:
-        writer = DictWriter(file, fieldnames=enriched_companies[0].model_dump().keys())
+    The refresh searches for the same industry groups and revenue ranges as the earlier run, unless others are given on
+    the command line, and writes to a new file next to it. The job counts of the earlier run are stored in the job count
+    cache, so only the counts older than --max-age are fetched again.
 
-        # Write the header with the fieldnames
-        writer.writeheader()
+    Args:
+        args: The parsed command line arguments.
+
+    Returns:
+        The journal of the refresh.
+    """
+    baseline_journal = get_journal_filename(args.refresh)
+    params = RunJournal.load(baseline_journal).params if Path(baseline_journal).exists() else {}
+    check_job_count_keywords(params, args.refresh)
+
+    if args.industry or args.spec:
+        searches, max_pages = get_batch_searches(args)
+        formats = args.format or []
+    elif params:
+        searches, max_pages = params["searches"], params["max_pages"]
+        formats = args.format or params.get("formats") or []
+    else:
+        raise SystemExit(f"No journal found for {args.refresh}, pass the searches to refresh with --industry or --spec")
+
+    filename = get_refresh_filename(args.refresh)
+    if Path(filename).exists():
+        raise SystemExit(f"{filename} already exists, resume it with: --resume {filename}")
+
+    seeded = seed_job_cache(args.refresh)
+    print("Read the job counts of", seeded, "companies from", args.refresh, end="\n\n")
+
+    return RunJournal.create(
+        get_journal_filename(filename),
+        searches=searches,
+        max_pages=max_pages,
+        output=filename,
+        formats=formats,
+        baseline=args.refresh,
+        max_age_hours=args.max_age if args.max_age is not None else settings.JOB_CACHE_TTL_HOURS,
+        keywords=list(job_count_keywords),
+    )
 
-        # Write each company to the file
-        for company in enriched_companies:
-            writer.writerow(company.model_dump())
 
-    print(f"List written to {filename} successfully")
+def run_sharded(args: argparse.Namespace):
+    """
+    Work on a sharded run with the workers started on this machine, and merge its results once every task is done.
+
+    The run is started with the searches of the command line arguments if its work queue does not exist yet, and
+    resumed otherwise, trying the tasks that were given up on again.
+
+    Args:
+        args: The parsed command line arguments.
+    """
+    from app.utils.sharding import merge_results, run_worker
+    from app.utils.work_queue import WorkQueue
+
+    if Path(args.queue).exists():
+        queue = WorkQueue(args.queue)
+        check_job_count_keywords(queue.params)
+        if not args.merge and (retried := queue.retry_failed()):
+            print("Trying", retried, "failed tasks again")
+    elif args.merge:
+        raise SystemExit(f"No sharded run found in {args.queue}")
+    else:
+        searches, max_pages = get_searches(args)
+        queue = WorkQueue.create(
+            args.queue,
+            searches=searches,
+            max_pages=max_pages,
+            output=get_output_filename(searches),
+            formats=args.format or [],
+            keywords=list(job_count_keywords),
+        )
+
+    if not args.merge:
+        print("----------------------------------------------------")
+        print("Fetching companies from cience.com and job counts from Coresignal with", args.workers, "workers")
+        print("----------------------------------------------------")
+
+        if args.workers == 1:
+            run_worker(args.queue, fetch_engine=args.fetch_engine)
+        else:
+            # Start the workers from a clean interpreter, since threads don't survive forking
+            context = multiprocessing.get_context("spawn")
+            workers = [
+                context.Process(target=run_worker, args=(args.queue, None, args.fetch_engine, args.workers))
+                for _ in range(args.workers)
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+    if not queue.is_finished():
+        print("\nThe run still has tasks claimed by other workers, merge it with: --queue", args.queue, "--merge")
+        return
+
+    for task, error in queue.get_failures():
+        print("Gave up on", task.kind, task.key, "after", error)
+
+    rows, filenames = merge_results(queue)
+    print("\nFound", rows, "enriched companies")
+    if rows > 0:
+        print(f"List written to {', '.join(map(str, filenames))} successfully")
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parse the command line arguments.
+
+    Returns:
+        The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(prog="python -m app", description="Scrape companies and their job counts")
+    parser.add_argument(
+        "--resume",
+        metavar="FILE",
+        help="resume an interrupted run, given the CSV file it was writing to",
+    )
+    parser.add_argument(
+        "--industry",
+        action="append",
+        help="industry group to search for without prompting, can be repeated to search for several",
+    )
+    parser.add_argument(
+        "--revenue",
+        action="append",
+        choices=["all", *revenues],
+        help="revenue range to search for with every industry group, can be repeated, defaults to all",
+    )
+    parser.add_argument(
+        "--max-pages",
+        type=int,
+        help="maximum number of result pages to search through for each search, defaults to all",
+    )
+    parser.add_argument(
+        "--spec",
+        metavar="FILE",
+        help="TOML job spec file with the industries, revenues and max_pages to search for",
+    )
+    parser.add_argument(
+        "--format",
+        action="append",
+        choices=list(output_writers),
+        help="also write the companies to a file in this format next to the CSV file, can be repeated",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="measure the time spent in each stage and write a JSON performance report next to the CSV file",
+    )
+    parser.add_argument(
+        "--prometheus",
+        metavar="FILE",
+        help="also write the performance report to a Prometheus textfile, implies --profile",
+    )
+    parser.add_argument(
+        "--refresh",
+        metavar="FILE",
+        help="refresh the CSV file of an earlier run, only fetching job counts older than --max-age again, and write "
+        "the updated list and a delta file of the added, removed and changed companies next to it",
+    )
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        metavar="HOURS",
+        help="age in hours after which the job counts of a refreshed company are fetched again, defaults to "
+        "JOB_CACHE_TTL_HOURS",
+    )
+    parser.add_argument(
+        "--fetch-engine",
+        choices=fetch_engines,
+        help="fetch results pages with a headless browser, or with plain HTTP requests falling back to the browser for "
+        "pages that need JavaScript, defaults to CIENCE_FETCH_ENGINE",
+    )
+    parser.add_argument(
+        "--snapshot",
+        metavar="DIR",
+        help="record the cience pages fetched by the run to a compressed snapshot in this directory, adding to it if "
+        "it exists",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="DIR",
+        help="fetch the cience pages of the run from the snapshot in this directory instead of from cience, without "
+        "starting a browser",
+    )
+    parser.add_argument(
+        "--queue",
+        metavar="FILE",
+        help="work on a sharded run with every worker given this work queue file, starting it if it does not exist",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes to start on this machine for a sharded run, defaults to 1",
+    )
+    parser.add_argument(
+        "--merge",
+        action="store_true",
+        help="only merge the results of the finished sharded run in --queue into its output files",
+    )
+
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    industry_group, revenue, max_pages = take_input()
+    args = parse_args()
 
-    companies = fetch_companies_from_cience(industry_group, revenue, max_pages)
+    if args.profile or args.prometheus:
+        metrics.enable()
 
-    enriched_companies = fetch_enriched_companies_from_coresignal(companies)
+    if args.snapshot and args.replay:
+        raise SystemExit("--snapshot and --replay can't be used together")
+    if args.queue and (args.snapshot or args.replay):
+        raise SystemExit("Snapshots are recorded and replayed by a single process, use them without --queue")
+    if args.queue and (args.profile or args.prometheus):
+        raise SystemExit("Performance reports measure a single process, use --profile and --prometheus without --queue")
 
-    if len(enriched_companies) > 0:
-        write_enriched_companies_to_file(enriched_companies)
+    if args.queue:
+        # Share the run with the workers of other processes or containers through its work queue
+        run_sharded(args)
+    else:
+        if args.resume:
+            # Continue the run that was writing to the given file
+            journal = RunJournal.load(get_journal_filename(args.resume))
+            check_job_count_keywords(journal.params, journal.params["output"])
+        elif args.refresh:
+            journal = start_refresh(args)
+        else:
+            searches, max_pages = get_searches(args)
+            filename = get_output_filename(searches)
+            journal = RunJournal.create(
+                get_journal_filename(filename),
+                searches=searches,
+                max_pages=max_pages,
+                output=filename,
+                formats=args.format or [],
+                keywords=list(job_count_keywords),
+            )
+
+        if args.snapshot or args.replay:
+            snapshots.open(args.snapshot or args.replay, replay=bool(args.replay))
+
+        try:
+            fetch_and_enrich_companies(journal, args.prometheus, args.fetch_engine)
+        finally:
+            if snapshots.recording:
+                print(snapshots.recorded, "pages recorded to the snapshot", snapshots.path)
+            elif snapshots.replaying:
+                print(snapshots.replayed, "pages replayed from the snapshot", snapshots.path)
+            snapshots.close()
@@ -8,6 +8,72 @@ class Settings(BaseSettings):
     LI_AT_COOKIE: str = ''
     CORESIGNAL_API_KEY: str = ''
 
+    # Base URLs of the services the scraper talks to, overridden to run against local stand-ins such as the benchmarks
+    CIENCE_URL: str = "https://www.cience.com"
+    CORESIGNAL_URL: str = "https://api.coresignal.com"
+    OPENAI_BASE_URL: Optional[str] = None
+
+    # Keywords the number of active jobs of each company is fetched for, each written to a column named after it, e.g.
+    # "Machine Learning" to machine_learning_jobs
+    JOB_COUNT_KEYWORDS: list[str] = ["AI", "Engineer", "IT"]
+    # Whether to first search for any active job of a company, and skip the search for each keyword when it has none
+    JOB_COUNT_PROBE: bool = True
+    # Companies with at most this many active jobs on Coresignal have their jobs collected and matched against the
+    # keywords locally, when that takes fewer requests than a search for each keyword. 0 turns it off
+    CORESIGNAL_COLLECT_MAX_JOBS: int = 0
+
+    # Seconds to wait for a response from any outbound HTTP request before giving up
+    REQUEST_TIMEOUT: float = 30
+    # Number of times a failed or rate limited HTTP request is retried
+    HTTP_MAX_RETRIES: int = 3
+    # Maximum number of requests per second to a host, with overrides for specific hosts as a JSON object
+    HTTP_RATE_LIMIT: float = 10
+    HTTP_RATE_LIMITS: dict[str, float] = {}
+    # Number of failures in a row after which requests to a host stop, and the seconds before trying it again
+    CIRCUIT_BREAKER_THRESHOLD: int = 5
+    CIRCUIT_BREAKER_COOLDOWN: float = 30
+    # Number of companies whose job counts are counted with a single Elasticsearch DSL query to Coresignal, instead of
+    # a search for each company and keyword. 0 turns it off
+    CORESIGNAL_BATCH_SIZE: int = 0
+    # Maximum number of Coresignal requests in flight at the same time
+    CORESIGNAL_CONCURRENCY: int = 8
+    # How cience results pages are fetched: "browser" loads them in a headless browser, "http" fetches them with plain
+    # HTTP requests and only loads the pages that need JavaScript in the browser
+    CIENCE_FETCH_ENGINE: str = "browser"
+    # Maximum number of cience company details pages fetched at the same time
+    CIENCE_CONCURRENCY: int = 8
+    # Number of logged in browsers enriching companies from LinkedIn at the same time, and the number of times a
+    # company is retried on a new browser when its browser crashes or is logged out
+    LINKEDIN_WORKERS: int = 2
+    LINKEDIN_MAX_RETRIES: int = 1
+    # Whether to count LinkedIn jobs by opening the job search results directly, with images, fonts, media and
+    # stylesheets blocked, instead of through the search box of the company page
+    LINKEDIN_FAST_MODE: bool = True
+    # Maximum number of seconds to wait for a LinkedIn page to show what is waited for
+    LINKEDIN_TIMEOUT: float = 10
+    # Maximum number of pages sent to the LLM at the same time, and the number of retries for a failed page
+    LLM_CONCURRENCY: int = 8
+    LLM_MAX_RETRIES: int = 5
+    # Whether to send only the company listing block of a page to the LLM, and the maximum estimated number of tokens
+    # of the part of a page sent in one call. Longer pages are split into chunks extracted at the same time
+    LLM_PRUNE_PAGES: bool = True
+    LLM_CHUNK_MAX_TOKENS: int = 3000
+    # Maximum number of items waiting between two stages of the pipeline
+    PIPELINE_QUEUE_SIZE: int = 100
+    # Number of tasks each worker of a sharded run works on at the same time, the number of seconds a worker holds a
+    # task for without renewing its lease, and the number of times a task is tried before it is given up on
+    SHARD_CONCURRENCY: int = 8
+    SHARD_LEASE_SECONDS: float = 60
+    SHARD_MAX_ATTEMPTS: int = 3
+
+    # Directory to keep caches between runs in
+    CACHE_DIR: str = "data/cache"
+    # Maximum size of the LLM extraction cache in megabytes, and the number of days an extraction is reused for
+    LLM_CACHE_MAX_SIZE_MB: int = 256
+    LLM_CACHE_MAX_AGE_DAYS: int = 30
+    # Number of hours a job count fetched for a company is reused for
+    JOB_CACHE_TTL_HOURS: float = 24
+
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
 
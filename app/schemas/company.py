@@ -1,4 +1,10 @@
-from pydantic import BaseModel, Field
+import re
+from dataclasses import dataclass
+from operator import attrgetter
+
+from pydantic import BaseModel, Field, create_model
+
+from app.core.config import settings
 
 
 class Company(BaseModel):
@@ -18,7 +24,105 @@ class CompanyList(BaseModel):
     companies: list[Company] = Field(description="A list of companies")
 
 
-class CompanyWithJobCounts(CompanyWithLinkedinSlug):
-    ai_jobs: int = Field(description="The number of job postings for AI")
-    engineer_jobs: int = Field(description="The number of job postings for Engineer")
-    it_jobs: int = Field(description="The number of job postings for IT")
+def get_job_count_field(keyword: str) -> str:
+    """
+    Get the name of the field holding the job count of a keyword.
+
+    Args:
+        keyword: The keyword searched for.
+
+    Returns:
+        The name of the field, e.g. "machine_learning_jobs" for "Machine Learning".
+    """
+    return re.sub(r"[^a-z0-9]+", "_", keyword.lower()).strip("_") + "_jobs"
+
+
+# The job count field of each keyword searched for
+job_count_keywords = {keyword: get_job_count_field(keyword) for keyword in settings.JOB_COUNT_KEYWORDS}
+if len(set(job_count_keywords.values())) != len(settings.JOB_COUNT_KEYWORDS):
+    raise ValueError(f"JOB_COUNT_KEYWORDS has keywords with the same job count field: {settings.JOB_COUNT_KEYWORDS}")
+
+# The job count fields depend on the keywords searched for, so the model is built from them
+CompanyWithJobCounts = create_model(
+    "CompanyWithJobCounts",
+    __base__=CompanyWithLinkedinSlug,
+    **{
+        field: (int, Field(description=f"The number of job postings for {keyword}"))
+        for keyword, field in job_count_keywords.items()
+    },
+)
+
+# The fields of the output file, in order
+company_fields = list(CompanyWithJobCounts.model_fields)
+
+# Get the values of a company that are not job counts, in the order of company_fields
+get_company_details = attrgetter(*CompanyWithLinkedinSlug.model_fields)
+
+
+@dataclass(slots=True)
+class CompanyRecord:
+    """
+    A company on its way through a run, from its extraction to the output file.
+
+    Companies are validated with the models above where they enter a run, by the listing parser, the LLM and when the
+    output file of an interrupted run is read. Within a run they are kept as slotted records, which take a fraction of
+    the memory of a model, and job counts are set on them in place instead of copying them into a new model.
+    """
+
+    company_name: str
+    industry: str
+    location: str
+    revenue: str
+    employees: str
+    cience_details_page: str
+    linkedin_slug: str = ""
+    # The job count of each keyword, in the order of job_count_keywords
+    job_counts: tuple[int, ...] | None = None
+
+    @classmethod
+    def from_row(cls, row: dict[str, str]) -> "CompanyRecord":
+        """
+        Validate a row of an output file and read it as a record.
+
+        Args:
+            row: The values of the row, by field name.
+
+        Returns:
+            The record of the company.
+        """
+        company = CompanyWithJobCounts(**row).model_dump()
+        job_counts = tuple(company.pop(field) for field in job_count_keywords.values())
+
+        return cls(**company, job_counts=job_counts)
+
+    def get_job_counts(self) -> dict[str, int]:
+        """
+        Get the job counts of the company.
+
+        Returns:
+            The job counts of the company, by keyword.
+        """
+        return dict(zip(job_count_keywords, self.job_counts or ()))
+
+    def set_job_counts(self, job_counts: dict[str, int]) -> "CompanyRecord":
+        """
+        Set the job counts of the company.
+
+        Args:
+            job_counts: The job counts of the company, by keyword.
+
+        Returns:
+            The record itself, enriched with the job counts.
+        """
+        self.job_counts = tuple(job_counts[keyword] for keyword in job_count_keywords)
+
+        return self
+
+    def to_row(self) -> tuple:
+        """
+        Get the values of the enriched record in the order of company_fields, to write them to an output file.
+
+        Returns:
+            The values of the record.
+        """
+        return *get_company_details(self), *self.job_counts
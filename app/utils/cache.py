@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Any
+
+
+class DiskCache:
+    """
+    A persistent cache of JSON values on disk, with one file per key.
+
+    Entries older than max_age seconds are treated as missing, and the least recently used entries are evicted once
+    the cache grows over max_size bytes.
+    """
+
+    # Number of writes between two eviction passes
+    eviction_interval = 100
+
+    def __init__(self, directory: str | Path, max_size: int, max_age: float):
+        """
+        Open the cache stored in a directory, creating it if it does not exist yet.
+
+        Args:
+            directory: The directory to store the cache entries in.
+            max_size: The maximum total size of the cache entries in bytes.
+            max_age: The maximum age of a cache entry in seconds.
+        """
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.max_age = max_age
+
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = Lock()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.evict()
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """
+        Build a cache key from the hash of some content.
+
+        Args:
+            *parts: The pieces of content that identify the cached value.
+
+        Returns:
+            The hex digest of the hash of the parts.
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Any | None:
+        """
+        Get a value from the cache.
+
+        Args:
+            key: The key of the value.
+
+        Returns:
+            The cached value, or None if it is not cached or has expired.
+        """
+        path = self._path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+                raise FileNotFoundError(path)
+
+            value = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # Mark the entry as recently used, so it is evicted last. The age of an entry is measured from its last use.
+        # The entry may have been evicted since it was read, by this process or another one, which is not an error.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        """
+        Store a value in the cache.
+
+        Args:
+            key: The key of the value.
+            value: The value to store, which has to be serializable to JSON.
+        """
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+
+        # Write to a temporary file first, so a crash never leaves a partially written entry behind
+        temporary_path = path.with_suffix(f".{os.getpid()}.{id(value)}.tmp")
+        temporary_path.write_text(json.dumps(value), encoding="utf-8")
+        os.replace(temporary_path, path)
+
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.eviction_interval == 0
+
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the expired entries, and then the least recently used entries until the cache fits in max_size.
+        """
+        now = time.time()
+        entries = []
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+
+            if now - stat.st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+
+            path.unlink(missing_ok=True)
+            total_size -= size
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        The share of lookups that were served from the cache.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -1,72 +1,372 @@
 import asyncio
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
 from html import unescape
-
-import requests
-from crawl4ai import AsyncWebCrawler
-from langchain_openai import ChatOpenAI
+from itertools import accumulate
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+from urllib.parse import urlsplit
+from weakref import WeakKeyDictionary
 
 from app.core.config import settings
-from app.schemas.company import CompanyList, CompanyWithLinkedinSlug
+from app.schemas.company import CompanyList, CompanyRecord
+from app.utils.cache import DiskCache
+from app.utils.html_markdown import html_to_markdown
+from app.utils.http import client, get_retry_delay, parse_retry_after
+from app.utils.listing_parser import get_company_spans, parse_companies_from_page_content
+from app.utils.metrics import metrics
+from app.utils.page_pruning import (
+    estimate_tokens,
+    merge_chunk_companies,
+    prune_page_content,
+    pruning_stats,
+    pruning_version,
+    split_page_content,
+)
+from app.utils.snapshot import snapshots
+
+if TYPE_CHECKING:
+    from crawl4ai import AsyncWebCrawler
+
+# The LLM extracting companies from the pages the listing parser can't read
+llm_model = "gpt-4o"
+
+# Host of the OpenAI API, sharing its rate limiter and circuit breaker with every other request to it
+openai_host = urlsplit(settings.OPENAI_BASE_URL).netloc if settings.OPENAI_BASE_URL else "api.openai.com"
+
+# The engines pages can be fetched with, see CienceFetcher
+fetch_engines = ("browser", "http")
+
+# LinkedIn company page link, capturing the slug, except for the page of CIENCE itself linked from every page footer
+linkedin_slug_pattern = re.compile(
+    r"https://(?:www\.)?linkedin\.com/company/(?!(?i:cience)(?:[/'\"\s)?#<>]|$))([^/'\"\s)?#<>]+)"
+)
+company_details_page_pattern = re.compile(re.escape(settings.CIENCE_URL) + r"/company/[^\s)'\"<>]+")
+
+
+def get_cience_page_url(industry_group: str, revenue: str, page: int) -> str:
+    """
+    Build the URL of a search results page from the Cience database.
+
+    Args:
+        industry_group: The industry group of the search.
+        revenue: The revenue threshold of the search.
+        page: The number of the results page.
+
+    Returns:
+        The URL of the results page.
+    """
+    return f"{settings.CIENCE_URL}/companies-database/united-states/{industry_group}/revenue-{revenue}?page={page}"
+
+
+def fetch_cience_page(url: str) -> str | None:
+    """
+    Fetch a search results page from the Cience database.
+
+    Args:
+        url: The URL of the results page.
 
-model = ChatOpenAI(api_key=settings.OPENAI_API_KEY, model="gpt-4o", temperature=0)
+    Returns:
+        The HTML of the page, or None if the page does not exist.
+    """
+    if snapshots.replaying:
+        status, page_html = snapshots.get(url)
+    else:
+        res = client.get(url)
+        status, page_html = res.status_code, res.text
+        if snapshots.recording:
+            snapshots.put(url, status, page_html)
+
+    if status == 404 or "404 Not Found" in page_html:
+        return None
+
+    # Make links absolute, so the page can later be converted to markdown without knowing where it came from
+    return re.sub(r"""(href=["'])/(?!/)""", rf"\g<1>{settings.CIENCE_URL}/", page_html)
+
+
+def get_last_page_hint(page_html: str) -> int:
+    """
+    Find the highest page number linked from the pagination control of a results page.
+
+    Args:
+        page_html: The HTML of the results page.
+
+    Returns:
+        The highest linked page number, or 1 if the page has no pagination links.
+    """
+    return max((int(page) for page in re.findall(r"[?&]page=(\d+)", page_html)), default=1)
 
 
-def get_cience_pages(industry_group: str, revenue: str, max_pages: int = None) -> list[str]:
+@metrics.timed("discover")
+def get_cience_pages(industry_group: str, revenue: str, max_pages: int = None) -> tuple[list[str], dict[str, str]]:
     """
     Fetch the list of pages from Cience database for the given industry group and revenue.
 
+    Instead of fetching every page in sequence, the last page is found by jumping to the last page linked from the
+    pagination control of the first page, probing exponentially further pages until one is missing, and then binary
+    searching between the last page found and the first page missing.
+
     Args:
         industry_group: The industry group to fetch pages for.
         revenue: The revenue threshold to fetch pages for.
         max_pages: The maximum number of pages to fetch, defaults to None.
 
     Returns:
-        A list of URLs of the pages from Cience database.
+        A tuple of the list of URLs of the pages from Cience database, and the HTML of the pages that were already
+        fetched while searching, keyed by URL.
     """
-    pages = []
-
-    page = 1
-    while True:
-        url = f"https://www.cience.com/companies-database/united-states/{industry_group}/revenue-{revenue}?page={page}"
-        res = requests.get(url)
-        if "404 Not Found" not in res.text:
-            pages.append(url)
-            page += 1
-            if max_pages and page > max_pages:
-                print("Found", len(pages), "pages for", industry_group, "companies with revenue", revenue)
-                break
+    bodies: dict[str, str] = {}
+    probed: dict[int, bool] = {}
+
+    def page_exists(page: int) -> bool:
+        if page not in probed:
+            url = get_cience_page_url(industry_group, revenue, page)
+            body = fetch_cience_page(url)
+            probed[page] = body is not None
+            if body is not None:
+                bodies[url] = body
+
+        return probed[page]
+
+    if not page_exists(1):
+        print("Found 0 pages for", industry_group, "companies with revenue", revenue)
+        return [], {}
+
+    # The highest page known to exist, and the lowest page known to be missing
+    last_found, first_missing = 1, None
+
+    # Start from the last page the pagination control links to, since it usually is the last page or close to it
+    hint = get_last_page_hint(bodies[get_cience_page_url(industry_group, revenue, 1)])
+    if max_pages:
+        hint = min(hint, max_pages)
+    if hint > 1:
+        if page_exists(hint):
+            last_found = hint
         else:
-            print("Found", len(pages), "pages for", industry_group, "companies with revenue", revenue)
+            first_missing = hint
+
+    # Probe further pages with exponentially growing steps until a missing page is found
+    step = 1
+    while first_missing is None:
+        probe = last_found + step
+        if max_pages and probe > max_pages:
+            # Pages beyond the maximum are treated as missing without fetching them
+            if page_exists(max_pages):
+                last_found, first_missing = max_pages, max_pages + 1
+            else:
+                first_missing = max_pages
             break
 
-    return pages
+        if page_exists(probe):
+            last_found = probe
+            step *= 2
+        else:
+            first_missing = probe
+
+    # Binary search for the last page between the last page found and the first page missing
+    while first_missing - last_found > 1:
+        middle = (last_found + first_missing) // 2
+        if page_exists(middle):
+            last_found = middle
+        else:
+            first_missing = middle
+
+    pages = [get_cience_page_url(industry_group, revenue, page) for page in range(1, last_found + 1)]
+    print(
+        "Found", len(pages), "pages for", industry_group, "companies with revenue", revenue, "in", len(probed), "probes"
+    )
+
+    return pages, bodies
+
 
+class CienceFetcher:
+    """
+    Fetch pages from the Cience database as markdown with the fetch engine of a run.
+
+    The "browser" engine loads every page in a headless browser with crawl4ai. The "http" engine fetches pages with the
+    shared HTTP client and converts them to markdown in-process, and only loads a page in the browser when its HTML
+    has no link to a company details page, since it then needs JavaScript to show its companies. The browser is only
+    started once a page needs it.
+    """
 
-async def get_cience_page_contents(pages: list[str]) -> list[str]:
+    def __init__(self, engine: str = None):
+        """
+        Args:
+            engine: The fetch engine, "browser" or "http", defaults to the CIENCE_FETCH_ENGINE setting.
+        """
+        self.engine = engine or settings.CIENCE_FETCH_ENGINE
+        if self.engine not in fetch_engines:
+            raise ValueError(f"Unknown fetch engine {self.engine!r}, expected one of {', '.join(fetch_engines)}")
+
+        self._crawler: "AsyncWebCrawler | None" = None
+        self._crawler_lock = asyncio.Lock()
+
+    async def __aenter__(self) -> "CienceFetcher":
+        if self.engine == "browser" and not snapshots.replaying:
+            await self.get_crawler()
+
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._crawler is not None:
+            crawler, self._crawler = self._crawler, None
+            await crawler.__aexit__(*exc_info)
+
+    async def get_crawler(self) -> "AsyncWebCrawler":
+        """
+        Get the browser crawler of the fetcher, starting it if no page needed it yet.
+
+        Returns:
+            The started crawler.
+        """
+        async with self._crawler_lock:
+            if self._crawler is None:
+                # The crawler starts a browser, so it is only imported once a page needs it
+                from crawl4ai import AsyncWebCrawler
+
+                crawler = AsyncWebCrawler()
+                await crawler.__aenter__()
+                self._crawler = crawler
+
+        return self._crawler
+
+    async def fetch_with_browser(self, page: str, prefetched: str = None) -> str:
+        """
+        Fetch a page as markdown with the browser.
+
+        Args:
+            page: The URL of the page to fetch.
+            prefetched: The HTML of the page, if it was already fetched. It is converted to markdown without being
+                fetched again.
+
+        Returns:
+            The markdown content of the page.
+        """
+        if snapshots.replaying:
+            return replay_page_content(page, prefetched)
+
+        crawler = await self.get_crawler()
+        result = await crawler.arun(f"raw:{prefetched}" if prefetched else page)
+        if snapshots.recording:
+            snapshots.put(page, 200, result.markdown, kind="markdown")
+
+        return result.markdown
+
+    async def fetch(self, page: str, prefetched: str = None) -> str:
+        """
+        Fetch a page as markdown with the engine of the fetcher.
+
+        Args:
+            page: The URL of the page to fetch.
+            prefetched: The HTML of the page, if it was already fetched. It is converted to markdown without being
+                fetched again.
+
+        Returns:
+            The markdown content of the page.
+        """
+        if self.engine == "browser":
+            return await self.fetch_with_browser(page, prefetched)
+
+        page_html = prefetched or await asyncio.to_thread(fetch_cience_page, page)
+        page_content = html_to_markdown(page_html, page) if page_html else ""
+        if company_details_page_pattern.search(page_content):
+            metrics.count("pages_fetched_with_http")
+            return page_content
+
+        # The companies of the page are rendered by JavaScript, so load it in the browser
+        metrics.count("pages_fetched_with_browser")
+        return await self.fetch_with_browser(page)
+
+
+def replay_page_content(page: str, prefetched: str = None) -> str:
+    """
+    Get the markdown content of a page from the snapshot the run is replayed from.
+
+    The markdown the browser converted the page to is used if it was recorded. Otherwise the recorded HTML of the page
+    is converted in-process, so a replayed run never starts the browser.
+
+    Args:
+        page: The URL of the page.
+        prefetched: The HTML of the page, if it was already read from the snapshot.
+
+    Returns:
+        The markdown content of the page.
+    """
+    recorded = snapshots.find(page, kind="markdown")
+    if recorded is not None:
+        return recorded[1]
+
+    page_html = prefetched or fetch_cience_page(page)
+    return html_to_markdown(page_html, page) if page_html else ""
+
+
+async def get_cience_page_contents(
+    pages: list[str], prefetched: dict[str, str] = None, engine: str = None
+) -> list[str]:
     """
     Fetch the content of a list of pages from the Cience database as markdown.
 
     Args:
         pages: A list of URLs of the pages to fetch.
+        prefetched: The HTML of pages that were already fetched, keyed by URL. These are converted to markdown
+            without being fetched again.
+        engine: The fetch engine, "browser" or "http", defaults to the CIENCE_FETCH_ENGINE setting.
 
     Returns:
-        A list of markdown content of the pages.
+        A list of markdown content of the pages, in the same order as the pages.
     """
-    contents: list[str] = []
+    prefetched = prefetched or {}
+
+    if (engine or settings.CIENCE_FETCH_ENGINE) == "http" or snapshots.replaying:
+        semaphore = asyncio.Semaphore(settings.CIENCE_CONCURRENCY)
+
+        async with CienceFetcher(engine) as fetcher:
+
+            async def fetch(page: str) -> str:
+                async with semaphore:
+                    return await fetcher.fetch(page, prefetched.get(page))
+
+            return list(await asyncio.gather(*(fetch(page) for page in pages)))
+
+    # crawl4ai converts HTML passed as a "raw:" URL directly, instead of fetching the page again
+    targets = [f"raw:{prefetched[page]}" if page in prefetched else page for page in pages]
+
+    from crawl4ai import AsyncWebCrawler
 
     # Use the AsyncWebCrawler to fetch the pages in parallel
     async with AsyncWebCrawler() as crawler:
-        results = await crawler.arun_many(pages)
+        results = await crawler.arun_many(targets)
+
+        # Results are not guaranteed to be in the order of the targets, so match them back by URL
+        contents_by_target = {result.url: result.markdown for result in results}
 
-        # Extract the HTML content from each page
-        for result in results:
-            contents.append(result.markdown)
+    contents = [contents_by_target.get(target, "") for target in targets]
+    if snapshots.recording:
+        for page, page_content in zip(pages, contents):
+            snapshots.put(page, 200, page_content, kind="markdown")
 
     return contents
 
 
-structured_llm = model.with_structured_output(CompanyList)
+@metrics.timed("crawl")
+async def get_cience_page_content(fetcher: CienceFetcher, page: str, prefetched: str = None) -> str:
+    """
+    Fetch the content of a single page from the Cience database as markdown.
+
+    Args:
+        fetcher: The CienceFetcher to fetch the page with.
+        page: The URL of the page to fetch.
+        prefetched: The HTML of the page, if it was already fetched. It is converted to markdown without being fetched
+            again.
+
+    Returns:
+        The markdown content of the page.
+    """
+    return await fetcher.fetch(page, prefetched)
+
+
 input_prompt = """
 Content: ```{page_content}```
 
@@ -83,23 +383,119 @@ Do **not** include CIENCE.
 Return only a JSON list of objects, with no additional text.
 """
 
+# Bound the number of extractions sent to the LLM at the same time in each event loop
+llm_semaphores: WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = WeakKeyDictionary()
+
+
+def get_llm_cache_key(page_content: str) -> str:
+    """
+    Build the LLM cache key for the content of a page.
+
+    The content is normalized by collapsing whitespace, and the key changes whenever the prompt, the model or the way
+    the page is pruned and chunked before it is sent to the LLM does.
+
+    Args:
+        page_content: The markdown content of the page as a string.
+
+    Returns:
+        The cache key.
+    """
+    if settings.LLM_PRUNE_PAGES:
+        pruning = f"pruned:{pruning_version}:{settings.LLM_CHUNK_MAX_TOKENS}"
+    else:
+        pruning = "whole"
+
+    return DiskCache.make_key(llm_model, input_prompt, pruning, " ".join(page_content.split()))
+
+
+@cache
+def get_llm_cache() -> DiskCache:
+    """
+    Get the cache of the companies extracted by the LLM, keyed by the page content, the prompt and the model.
+
+    Opening the cache creates its directory and evicts its old entries, so it is only opened the first time it is used.
+
+    Returns:
+        The cache.
+    """
+    return DiskCache(
+        Path(settings.CACHE_DIR) / "llm",
+        max_size=settings.LLM_CACHE_MAX_SIZE_MB * 1024 * 1024,
+        max_age=settings.LLM_CACHE_MAX_AGE_DAYS * 24 * 60 * 60,
+    )
+
+
+@cache
+def get_structured_llm() -> Any:
+    """
+    Get the LLM extracting companies from the content of a page as structured output.
 
+    langchain and the OpenAI client take a while to import, and most pages are read by the listing parser, so they are
+    only loaded the first time a page has to go through the LLM.
+
+    Returns:
+        The runnable returning the raw response of the LLM next to the parsed CompanyList, to read the token usage from.
+    """
+    from langchain_openai import ChatOpenAI
+
+    # Retries are handled by invoke_llm, so rate limits can be shared across all concurrent extractions
+    model = ChatOpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        base_url=settings.OPENAI_BASE_URL,
+        model=llm_model,
+        temperature=0,
+        timeout=settings.REQUEST_TIMEOUT,
+        max_retries=0,
+    )
+
+    return model.with_structured_output(CompanyList, include_raw=True)
+
+
+@metrics.timed("slug")
 def get_linkedin_slug(company_details_page_url: str) -> str:
     """
     Extract the LinkedIn company slug from the content of the company details page.
 
+    The page is streamed, and the download stops as soon as the slug is found.
+
     Args:
         company_details_page_url: The URL to the company details page on cience.
 
     Returns:
         The LinkedIn company slug.
     """
-
-    # Fetch the company details page
-    company_details_page = requests.get(company_details_page_url)
-
-    # Use a regular expression to search for the LinkedIn company slug in the page content
-    matches = re.search(r"https://linkedin.com/company/([^/'\"]+)", company_details_page.text)
+    if snapshots.replaying:
+        # The snapshot holds the part of the page that was read when it was recorded, up to the slug
+        _, buffer = snapshots.get(company_details_page_url)
+        matches = linkedin_slug_pattern.search(buffer)
+        return unescape(matches.group(1)) if matches is not None else ""
+
+    # Stream the company details page
+    with client.get(company_details_page_url, stream=True) as response:
+        response.encoding = response.encoding or "utf-8"
+
+        buffer = ""
+        read = []
+        try:
+            for chunk in response.iter_content(chunk_size=16384, decode_unicode=True):
+                buffer += chunk
+                if snapshots.recording:
+                    read.append(chunk)
+
+                # Use a regular expression to search for the LinkedIn company slug in the content read so far, and
+                # stop reading as soon as it is found, unless the match runs up to the end of the chunk and may be cut
+                # off
+                matches = linkedin_slug_pattern.search(buffer)
+                if matches is not None and matches.end() < len(buffer):
+                    return unescape(matches.group(1))
+
+                # Keep only the end of the buffer, in case the slug is split between two chunks
+                buffer = buffer[matches.start() if matches is not None else -256 :]
+        finally:
+            if snapshots.recording:
+                snapshots.put(company_details_page_url, response.status_code, "".join(read))
+
+    matches = linkedin_slug_pattern.search(buffer)
 
     # If the slug was not found, return an empty string
     if matches is None:
@@ -109,56 +505,288 @@ def get_linkedin_slug(company_details_page_url: str) -> str:
     return unescape(matches.group(1))
 
 
-def get_companies_from_page_content(page_content: str) -> list[CompanyWithLinkedinSlug]:
+def get_linkedin_slug_from_page_content(page_content: str, company_details_page_url: str) -> str:
+    """
+    Extract the LinkedIn company slug of a company from the markdown content of a search results page, if the page
+    links to it.
+
+    Only the lines of the company are searched, from its table row or card heading to where the next company starts,
+    or to the end of the listing for the last company, see get_company_spans.
+
+    Args:
+        page_content: The markdown content of the page as a string.
+        company_details_page_url: The URL to the company details page on cience.
+
+    Returns:
+        The LinkedIn company slug, or an empty string if the page does not link to it.
+    """
+    if company_details_page_url not in page_content:
+        return ""
+
+    lines = page_content.splitlines(keepends=True)
+    offsets = [0, *accumulate(map(len, lines))]
+    for start, end in get_company_spans(lines):
+        if company_details_page_url in page_content[offsets[start] : offsets[end]]:
+            matches = linkedin_slug_pattern.search(page_content, offsets[start], offsets[end])
+            return unescape(matches.group(1)) if matches is not None else ""
+
+    return ""
+
+
+def get_linkedin_slugs(company_details_page_urls: list[str], page_content: str = "") -> list[str]:
+    """
+    Get the LinkedIn company slugs for a list of companies.
+
+    Slugs are taken from the search results page content when it links to them. The remaining slugs are extracted
+    from the company details pages, fetching up to CIENCE_CONCURRENCY pages at the same time.
+
+    Args:
+        company_details_page_urls: The URLs to the company details pages on cience.
+        page_content: The markdown content of the search results page that listed the companies.
+
+    Returns:
+        The LinkedIn company slugs, in the same order as the URLs.
+    """
+    slugs = [get_linkedin_slug_from_page_content(page_content, url) for url in company_details_page_urls]
+
+    # Fetch the details pages of the companies whose slug was not on the results page
+    missing = [i for i, slug in enumerate(slugs) if not slug]
+    if missing:
+        with ThreadPoolExecutor(max_workers=settings.CIENCE_CONCURRENCY) as executor:
+            urls = [company_details_page_urls[i] for i in missing]
+            for i, slug in zip(missing, executor.map(get_linkedin_slug, urls)):
+                slugs[i] = slug
+
+    return slugs
+
+
+@metrics.timed("llm")
+async def invoke_llm(page_content: str) -> list[dict]:
+    """
+    Extract the details of the companies in the markdown content of a page with the LLM.
+
+    At most LLM_CONCURRENCY extractions run at the same time. Calls go through the rate limiter and circuit breaker
+    shared by every request to OpenAI, so a rate limited call slows down every extraction. Failed calls are retried
+    with jittered exponential backoff up to LLM_MAX_RETRIES times.
+
+    Args:
+        page_content: The markdown content of the page as a string.
+
+    Returns:
+        The details of each company as a dict.
+    """
+    from openai import APIConnectionError, InternalServerError, RateLimitError
+
+    structured_llm = get_structured_llm()
+
+    loop = asyncio.get_running_loop()
+    if loop not in llm_semaphores:
+        llm_semaphores[loop] = asyncio.Semaphore(settings.LLM_CONCURRENCY)
+
+    limiter = client.get_limiter(openai_host)
+    breaker = client.get_breaker(openai_host)
+
+    async with llm_semaphores[loop]:
+        for attempt in range(1, settings.LLM_MAX_RETRIES + 2):
+            breaker.check(openai_host)
+            await limiter.acquire_async()
+
+            started_at = time.monotonic()
+            try:
+                response = await structured_llm.ainvoke(input_prompt.format(page_content=page_content))
+            except RateLimitError as e:
+                metrics.record_request(openai_host, e.status_code, time.monotonic() - started_at)
+                if attempt > settings.LLM_MAX_RETRIES:
+                    raise
+
+                limiter.throttled(parse_retry_after(e.response.headers.get("retry-after")))
+                print("Rate limited by OpenAI, retrying attempt", attempt + 1)
+                continue
+            except (APIConnectionError, InternalServerError) as e:
+                metrics.record_request(openai_host, type(e).__name__, time.monotonic() - started_at)
+                breaker.failed()
+                if attempt > settings.LLM_MAX_RETRIES:
+                    raise
+
+                print("OpenAI request failed with", type(e).__name__, "retrying attempt", attempt + 1)
+                await asyncio.sleep(get_retry_delay(attempt))
+                continue
+
+            metrics.record_request(openai_host, 200, time.monotonic() - started_at)
+            breaker.succeeded()
+            limiter.succeeded()
+
+            usage = response["raw"].usage_metadata
+            if usage:
+                metrics.record_tokens(llm_model, usage["input_tokens"], usage["output_tokens"])
+
+            if response["parsing_error"] is not None:
+                raise response["parsing_error"]
+
+            return response["parsed"].model_dump()["companies"]
+
+
+async def invoke_llm_on_page(page_content: str) -> list[dict]:
+    """
+    Extract the details of the companies in the markdown content of a page with the LLM, sending it only the company
+    listing block of the page.
+
+    Unless LLM_PRUNE_PAGES is turned off, the content is pruned to its company listing block with compacted links, and
+    split into chunks of at most LLM_CHUNK_MAX_TOKENS tokens that are extracted at the same time and merged.
+
+    Args:
+        page_content: The markdown content of the page as a string.
+
+    Returns:
+        The details of each company as a dict, in page order.
+    """
+    if not settings.LLM_PRUNE_PAGES:
+        return await invoke_llm(page_content)
+
+    pruned_content = prune_page_content(page_content)
+    chunks = split_page_content(pruned_content, settings.LLM_CHUNK_MAX_TOKENS)
+
+    tokens_before, tokens_after = estimate_tokens(page_content), sum(map(estimate_tokens, chunks))
+    pruning_stats.pages += 1
+    pruning_stats.chunks += len(chunks)
+    pruning_stats.tokens_before += tokens_before
+    pruning_stats.tokens_after += tokens_after
+    metrics.count("llm_page_tokens_before_pruning", tokens_before)
+    metrics.count("llm_page_tokens_after_pruning", tokens_after)
+
+    if len(chunks) == 1:
+        return await invoke_llm(chunks[0])
+
+    return merge_chunk_companies(await asyncio.gather(*(invoke_llm(chunk) for chunk in chunks)))
+
+
+@metrics.timed("extract")
+async def extract_companies_from_page_content(page_content: str) -> tuple[list[dict], str]:
+    """
+    Extract the details of the companies in the markdown content of a page.
+
+    The page is parsed with the listing parser first, and is only sent to the LLM if the parser could not parse it
+    reliably.
+
+    Args:
+        page_content: The markdown content of the page as a string.
+
+    Returns:
+        A tuple of the details of each company as a dict, and the method that extracted them ("parser", "cache" or
+        "llm").
+    """
+    parsed_companies = parse_companies_from_page_content(page_content)
+    if parsed_companies is not None:
+        metrics.count("pages_extracted_with_parser")
+        return [company.model_dump() for company in parsed_companies], "parser"
+
+    # Reuse the result of an earlier extraction of the same content
+    cache_key = get_llm_cache_key(page_content)
+    cached_companies = get_llm_cache().get(cache_key)
+    if cached_companies is not None:
+        metrics.count("pages_extracted_with_cache")
+        return cached_companies, "cache"
+
+    companies = await invoke_llm_on_page(page_content)
+    get_llm_cache().set(cache_key, companies)
+    metrics.count("pages_extracted_with_llm")
+
+    return companies, "llm"
+
+
+async def get_companies_from_page_content(page_content: str) -> tuple[list[CompanyRecord], str]:
     """
-    Extract companies from the markdown content of a page as a list of CompanyWithLinkedinSlug objects.
+    Extract companies from the markdown content of a page as a list of CompanyRecord objects.
 
     Args:
         page_content: The markdown content of the page as a string.
 
     Returns:
-        A list of CompanyWithLinkedinSlug objects.
+        A tuple of the list of CompanyRecord objects, and the method that extracted them ("parser", "cache"
+        or "llm").
     """
-    response = structured_llm.invoke(input_prompt.format(page_content=page_content))
+    extracted_companies, method = await extract_companies_from_page_content(page_content)
+
+    # Resolve the LinkedIn slugs of all companies on the page at the same time
+    slugs = await asyncio.to_thread(
+        get_linkedin_slugs, [company["cience_details_page"] for company in extracted_companies], page_content
+    )
 
     companies = []
-    for company in response.model_dump()["companies"]:
-        companies.append(
-            CompanyWithLinkedinSlug(**company, linkedin_slug=get_linkedin_slug(company["cience_details_page"]))
-        )
+    for company, slug in zip(extracted_companies, slugs):
+        companies.append(CompanyRecord(**company, linkedin_slug=slug))
 
-    return companies
+    return companies, method
 
 
-def get_companies(industry_group: str, revenue: str, max_pages: int = None) -> list[CompanyWithLinkedinSlug]:
+async def get_companies_async(industry_group: str, revenue: str, max_pages: int = None) -> list[CompanyRecord]:
     """
     Fetch the list of companies from the Cience database for the given industry group and revenue.
 
+    Companies are extracted from all pages at the same time, and returned in page order.
+
     Args:
         industry_group: The industry group to fetch companies for.
         revenue: The revenue threshold to fetch companies for.
         max_pages: The maximum number of search result pages to check, defaults to going through all pages.
 
     Returns:
-        A list of CompanyWithLinkedinSlug objects.
+        A list of CompanyRecord objects.
     """
     # Fetch the list of pages from Cience database
-    pages = get_cience_pages(industry_group, revenue, max_pages)
+    pages, prefetched = await asyncio.to_thread(get_cience_pages, industry_group, revenue, max_pages)
 
-    # Fetch the content of the pages as markdown
-    contents = asyncio.run(get_cience_page_contents(pages))
+    # Fetch the content of the pages as markdown, reusing the pages already fetched while searching
+    contents = await get_cience_page_contents(pages, prefetched)
 
-    companies = []
-    for i, page_content in enumerate(contents):
+    methods = {"parser": 0, "cache": 0, "llm": 0}
+
+    async def get_companies_from_page(i: int, page_content: str) -> list[CompanyRecord]:
         # Extract companies from each page content
-        print("\nParsing page", i + 1, "of", len(contents))
-        companies_from_content = get_companies_from_page_content(page_content)
-        companies.extend(companies_from_content)
-        print("Extracted", len(companies_from_content), "companies from page", i + 1, "of", len(contents))
+        companies_from_content, method = await get_companies_from_page_content(page_content)
+        methods[method] += 1
+        print(
+            "Extracted", len(companies_from_content), "companies from page", i + 1, "of", len(contents), "with", method
+        )
+
+        return companies_from_content
+
+    print("\nParsing", len(contents), "pages")
+    results = await asyncio.gather(*(get_companies_from_page(i, content) for i, content in enumerate(contents)))
+    companies = [company for companies_from_content in results for company in companies_from_content]
+
+    print(
+        "\nParsed",
+        methods["parser"],
+        "pages with the listing parser,",
+        methods["cache"],
+        "pages from the LLM cache and",
+        methods["llm"],
+        "pages with the LLM",
+    )
+    llm_cache = get_llm_cache()
+    print("LLM cache:", llm_cache.hits, "hits,", llm_cache.misses, "misses")
+    if pruning_stats.pages:
+        print(pruning_stats.describe())
 
     return companies
 
 
+def get_companies(industry_group: str, revenue: str, max_pages: int = None) -> list[CompanyRecord]:
+    """
+    Fetch the list of companies from the Cience database for the given industry group and revenue.
+
+    Args:
+        industry_group: The industry group to fetch companies for.
+        revenue: The revenue threshold to fetch companies for.
+        max_pages: The maximum number of search result pages to check, defaults to going through all pages.
+
+    Returns:
+        A list of CompanyRecord objects.
+    """
+    return asyncio.run(get_companies_async(industry_group, revenue, max_pages))
+
+
 if __name__ == "__main__":
     # industry_group = "internet"
     # revenue = "over-1b"
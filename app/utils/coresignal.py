@@ -1,11 +1,23 @@
 import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import Iterable, Iterator
 
 import requests
 
 from app.core.config import settings
-from app.schemas.company import CompanyWithJobCounts, CompanyWithLinkedinSlug
+from app.schemas.company import CompanyRecord, job_count_keywords
+from app.utils.http import client
+from app.utils.job_cache import get_job_cache, get_new_job_counts
+from app.utils.metrics import metrics
 
-url = "https://api.coresignal.com/cdapi/v1/linkedin/job/search/filter"
+url = f"{settings.CORESIGNAL_URL}/cdapi/v1/linkedin/job/search/filter"
+collect_url = f"{settings.CORESIGNAL_URL}/cdapi/v1/linkedin/job/collect"
+es_dsl_url = f"{settings.CORESIGNAL_URL}/cdapi/v1/linkedin/job/search/es_dsl"
+
+# A word of a text, as split by Elasticsearch's standard analyzer, see get_tokens
+token_pattern = re.compile(r"\w+(?:[.'’]\w+)*")
 
 headers = {
     "Content-Type": "application/json",
@@ -14,6 +26,68 @@ headers = {
 }
 
 
+def get_company_url(company_linkedin_slug: str) -> str:
+    """
+    Get the LinkedIn URL of a company, the way Coresignal matches jobs to companies.
+
+    Args:
+        company_linkedin_slug: The LinkedIn company slug.
+
+    Returns:
+        The URL of the company's LinkedIn page.
+    """
+    return f"https://www.linkedin.com/company/{company_linkedin_slug}"
+
+
+def send_job_search(company_linkedin_slug: str, keyword_description: str = None) -> requests.Response:
+    """
+    Search for the active jobs of a given company on LinkedIn using the Coresignal API.
+
+    Args:
+        company_linkedin_slug: The LinkedIn company slug.
+        keyword_description: The keyword description to search for, or None to search for any active job.
+
+    Returns:
+        The response of the search, holding the IDs of the jobs found.
+
+    Raises:
+        requests.RequestException: If the search failed, including when Coresignal kept rate limiting it.
+    """
+    search = {
+        "company_linkedin_url": get_company_url(company_linkedin_slug),
+        "deleted": False,
+        "application_active": True,
+    }
+    if keyword_description is not None:
+        search["keyword_description"] = keyword_description
+
+    response = client.post(url, headers=headers, data=json.dumps(search))
+
+    # Fail on errors such as an expired API key, instead of reporting 0 jobs
+    response.raise_for_status()
+
+    return response
+
+
+def get_total_results(response: requests.Response) -> int:
+    """
+    Get the number of jobs found by a search.
+
+    Args:
+        response: The response of the search.
+
+    Returns:
+        The number of job postings found.
+    """
+    # Get the number of job postings from the response headers
+    job_count = response.headers.get("x-total-results")
+    # If the job count is not a number or is empty, return 0
+    if not job_count or not job_count.isnumeric():
+        return 0
+
+    return int(job_count)
+
+
 def search_jobs(
     company_linkedin_slug: str,
     keyword_description: str,
@@ -27,50 +101,293 @@ def search_jobs(
 
     Returns:
         The number of job postings found.
+
+    Raises:
+        requests.RequestException: If the search failed, including when Coresignal kept rate limiting it.
     """
-    payload = json.dumps(
-        {
-            "company_linkedin_url": f"https://www.linkedin.com/company/{company_linkedin_slug}",
-            "keyword_description": keyword_description,
-            "deleted": False,
-            "application_active": True,
-        }
+    return get_total_results(send_job_search(company_linkedin_slug, keyword_description))
+
+
+def collect_job(job_id: int) -> dict:
+    """
+    Collect a job posting using the Coresignal API.
+
+    Args:
+        job_id: The Coresignal ID of the job.
+
+    Returns:
+        The job posting, with its title and description.
+
+    Raises:
+        requests.RequestException: If the job could not be collected.
+    """
+    response = client.get(f"{collect_url}/{job_id}", headers=headers)
+    response.raise_for_status()
+
+    return response.json()
+
+
+def get_tokens(text: str) -> list[str]:
+    """
+    Split a text into lowercase words, the way Elasticsearch's standard analyzer does for the fields Coresignal
+    searches.
+
+    Words are runs of letters and digits, keeping the apostrophes and periods within them, as in "it's" or "node.js".
+
+    Args:
+        text: The text.
+
+    Returns:
+        The words of the text, in order.
+    """
+    return [token.lower() for token in token_pattern.findall(text)]
+
+
+def count_keyword_matches(jobs: list[dict], keywords: list[str]) -> dict[str, int]:
+    """
+    Count the job postings matching each keyword, like a keyword_description search does.
+
+    A job matches a keyword if its description holds the words of the keyword next to each other, as a phrase, ignoring
+    case. The title of the job is not searched.
+
+    Args:
+        jobs: The job postings, as collected.
+        keywords: The keywords to count the jobs of.
+
+    Returns:
+        The number of matching job postings, by keyword.
+    """
+    # Join the words with spaces, so a phrase is matched as a sequence of whole words
+    descriptions = [f" {' '.join(get_tokens(job.get('description') or ''))} " for job in jobs]
+    job_counts = {}
+    for keyword in keywords:
+        phrase = f" {' '.join(get_tokens(keyword))} "
+        job_counts[keyword] = sum(1 for description in descriptions if phrase.strip() and phrase in description)
+
+    return job_counts
+
+
+def get_job_counts(company_linkedin_slug: str, keywords: list[str]) -> dict[str, int]:
+    """
+    Get the number of active jobs of a company for each keyword, with as few requests as the company allows.
+
+    When there is more than one keyword to search for, a single search for any active job is sent first. A company
+    without active jobs gets 0 for every keyword without searching for them, and a company with at most
+    CORESIGNAL_COLLECT_MAX_JOBS active jobs, and fewer than there are keywords, has its jobs collected and matched
+    against the keywords locally. Otherwise each keyword is searched for.
+
+    Args:
+        company_linkedin_slug: The LinkedIn company slug.
+        keywords: The keywords to get the job counts of.
+
+    Returns:
+        The number of job postings found, by keyword.
+
+    Raises:
+        requests.RequestException: If a search failed, including when Coresignal kept rate limiting it.
+    """
+    if settings.JOB_COUNT_PROBE and len(keywords) > 1:
+        response = send_job_search(company_linkedin_slug)
+        total = get_total_results(response)
+
+        if total == 0:
+            metrics.count("coresignal_searches_skipped", len(keywords))
+            return dict.fromkeys(keywords, 0)
+
+        if total <= settings.CORESIGNAL_COLLECT_MAX_JOBS and total < len(keywords):
+            # The body of a search is the list of the IDs of the jobs found
+            jobs = [collect_job(job_id) for job_id in response.json()]
+            metrics.count("coresignal_searches_skipped", len(keywords))
+            return count_keyword_matches(jobs, keywords)
+
+    return {keyword: search_jobs(company_linkedin_slug, keyword) for keyword in keywords}
+
+
+def get_batch_query(company_linkedin_slugs: list[str], keywords: list[str]) -> dict:
+    """
+    Build an Elasticsearch DSL query counting the active jobs of several companies for each keyword.
+
+    The query matches the active jobs of every company, without returning them, and aggregates them by company and
+    then by keyword. Like a keyword_description search, a keyword matches a phrase of the description only, analyzed
+    by the description field, so the counts are the same as the ones of the searches.
+
+    Args:
+        company_linkedin_slugs: The LinkedIn company slugs.
+        keywords: The keywords to count the jobs of.
+
+    Returns:
+        The body of the query.
+    """
+    return {
+        "size": 0,
+        "query": {
+            "bool": {
+                "filter": [
+                    {"terms": {"company_url": [get_company_url(slug) for slug in company_linkedin_slugs]}},
+                    {"term": {"deleted": False}},
+                    {"term": {"application_active": True}},
+                ]
+            }
+        },
+        "aggs": {
+            "companies": {
+                "terms": {"field": "company_url", "size": len(company_linkedin_slugs)},
+                "aggs": {
+                    "keywords": {
+                        "filters": {
+                            "filters": {keyword: {"match_phrase": {"description": keyword}} for keyword in keywords}
+                        }
+                    }
+                },
+            }
+        },
+    }
+
+
+def get_batch_job_counts(company_linkedin_slugs: list[str], keywords: list[str]) -> dict[str, dict[str, int]]:
+    """
+    Get the number of active jobs of several companies for each keyword with a single Elasticsearch DSL query.
+
+    Args:
+        company_linkedin_slugs: The LinkedIn company slugs.
+        keywords: The keywords to get the job counts of.
+
+    Returns:
+        The number of job postings found, by slug and then by keyword. Companies without active jobs get 0 for every
+        keyword.
+
+    Raises:
+        requests.RequestException: If the query failed, including when Coresignal kept rate limiting it.
+    """
+    slugs_by_url = {get_company_url(slug): slug for slug in company_linkedin_slugs}
+    job_counts = {slug: dict.fromkeys(keywords, 0) for slug in company_linkedin_slugs}
+
+    response = client.post(
+        es_dsl_url, headers=headers, data=json.dumps(get_batch_query(list(slugs_by_url.values()), keywords))
     )
-    response = requests.request("POST", url, headers=headers, data=payload)
+    response.raise_for_status()
 
-    # Get the number of job postings from the response headers
-    job_count = response.headers.get("x-total-results")
-    # If the job count is not a number or is empty, return 0
-    if not job_count or not job_count.isnumeric():
-        return 0
+    for bucket in response.json()["aggregations"]["companies"]["buckets"]:
+        slug = slugs_by_url.get(bucket["key"])
+        if slug is not None:
+            keyword_buckets = bucket["keywords"]["buckets"]
+            job_counts[slug] = {keyword: keyword_buckets[keyword]["doc_count"] for keyword in keywords}
 
-    return int(job_count)
+    return job_counts
 
 
+@metrics.timed("coresignal")
 def enrich_company_with_coresignal_job_counts(
-    company: CompanyWithLinkedinSlug,
-) -> CompanyWithJobCounts:
+    company: CompanyRecord, cached_counts: dict[str, int] = None
+) -> CompanyRecord:
+    """
+    Enrich a CompanyRecord object with job counts for the company.
+
+    The method takes a CompanyRecord object and gets the number of job postings
+    on LinkedIn for the given company and each keyword of the JOB_COUNT_KEYWORDS
+    setting, skipping the keyword searches when the company has no active jobs.
+    It sets the job counts on the record in place.
+
+    :param company: A CompanyRecord object to enrich with job counts.
+    :param cached_counts: Job counts already known for the company, by keyword. These are not searched again.
+    :return: The same CompanyRecord object, with the job counts.
+    """
+    job_counts = dict(cached_counts or {})
+    missing_keywords = [keyword for keyword in job_count_keywords if keyword not in job_counts]
+    if missing_keywords:
+        job_counts.update(get_job_counts(company.linkedin_slug, missing_keywords))
+
+    return company.set_job_counts(job_counts)
+
+
+@metrics.timed("coresignal")
+def enrich_company_batch_with_coresignal_job_counts(
+    companies: list[CompanyRecord], cached_counts: list[dict[str, int] | None]
+) -> list[CompanyRecord]:
+    """
+    Enrich a batch of CompanyRecord objects with job counts, with a single Coresignal request for the whole batch.
+
+    :param companies: The CompanyRecord objects to enrich with job counts.
+    :param cached_counts: Job counts already known for each company, by keyword. These are not searched again.
+    :return: The same CompanyRecord objects, with the job counts.
+    """
+    cached_counts = [counts or {} for counts in cached_counts]
+    missing_keywords = [
+        keyword for keyword in job_count_keywords if any(keyword not in counts for counts in cached_counts)
+    ]
+
+    fetched_counts = {}
+    if missing_keywords:
+        slugs = {
+            company.linkedin_slug: None
+            for company, counts in zip(companies, cached_counts)
+            if any(keyword not in counts for keyword in job_count_keywords)
+        }
+        fetched_counts = get_batch_job_counts(list(slugs), missing_keywords)
+
+    return [
+        company.set_job_counts({**fetched_counts.get(company.linkedin_slug, {}), **counts})
+        for company, counts in zip(companies, cached_counts)
+    ]
+
+
+def enrich_companies_with_coresignal_job_counts(
+    companies: Iterable[CompanyRecord], concurrency: int = None
+) -> Iterator[CompanyRecord]:
     """
-    Enrich a CompanyWithLinkedinSlug object with job counts for the company.
+    Enrich a list of CompanyRecord objects with job counts, enriching several companies at the same time.
+
+    Companies are enriched by a pool of worker threads sharing the keep-alive HTTP client, one at a time or in batches
+    of CORESIGNAL_BATCH_SIZE companies, and the results are yielded in the same order as the input companies. Fresh
+    job counts in the job count cache are looked up for all companies before enrichment starts, and the fetched counts
+    are written back to it together once enrichment ends.
 
-    The method takes a CompanyWithLinkedinSlug object and searches for job postings
-    on LinkedIn for the given company and job titles "AI", "Engineer", and "IT".
-    It extracts the number of job postings for each job title and returns a
-    CompanyWithJobCounts object with the job counts.
+    Args:
+        companies: The CompanyRecord objects to enrich with job counts.
+        concurrency: The maximum number of companies to enrich at the same time, defaults to the
+            CORESIGNAL_CONCURRENCY setting.
 
-    :param company: A CompanyWithLinkedinSlug object to enrich with job counts.
-    :return: A CompanyWithJobCounts object with the job counts.
+    Yields:
+        Each CompanyRecord object enriched with its job counts, in input order.
     """
-    return CompanyWithJobCounts(
-        **company.model_dump(),
-        ai_jobs=search_jobs(company.linkedin_slug, "AI"),
-        engineer_jobs=search_jobs(company.linkedin_slug, "Engineer"),
-        it_jobs=search_jobs(company.linkedin_slug, "IT"),
+    companies = list(companies)
+    cached_counts = get_job_cache().get_many(
+        "coresignal",
+        [company.linkedin_slug for company in companies if company.linkedin_slug],
+        list(job_count_keywords),
     )
 
+    def enrich(company: CompanyRecord) -> CompanyRecord:
+        return enrich_company_with_coresignal_job_counts(company, cached_counts.get(company.linkedin_slug))
+
+    def enrich_batch(batch: list[CompanyRecord]) -> list[CompanyRecord]:
+        return enrich_company_batch_with_coresignal_job_counts(
+            batch, [cached_counts.get(company.linkedin_slug) for company in batch]
+        )
+
+    new_counts = {}
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency or settings.CORESIGNAL_CONCURRENCY) as executor:
+            batch_size = settings.CORESIGNAL_BATCH_SIZE
+            if batch_size:
+                batches = [companies[i : i + batch_size] for i in range(0, len(companies), batch_size)]
+                enriched_companies = chain.from_iterable(executor.map(enrich_batch, batches))
+            else:
+                enriched_companies = executor.map(enrich, companies)
+
+            for enriched_company in enriched_companies:
+                if enriched_company.linkedin_slug:
+                    new_counts[enriched_company.linkedin_slug] = get_new_job_counts(
+                        enriched_company, cached_counts.get(enriched_company.linkedin_slug)
+                    )
+
+                yield enriched_company
+    finally:
+        get_job_cache().set_many("coresignal", new_counts)
+
 
 if __name__ == "__main__":
-    company = CompanyWithLinkedinSlug(
+    company = CompanyRecord(
         company_name="Opus",
         industry="Internet",
         location="United States, Illinois",
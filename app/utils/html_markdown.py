@@ -0,0 +1,227 @@
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+# Elements whose content is never shown as text
+skipped_tags = {"head", "script", "style", "noscript", "template", "svg", "iframe", "canvas", "select"}
+
+# Elements that start a new block of text
+block_tags = {
+    "address",
+    "article",
+    "aside",
+    "blockquote",
+    "dd",
+    "details",
+    "div",
+    "dl",
+    "dt",
+    "fieldset",
+    "figcaption",
+    "figure",
+    "footer",
+    "form",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "header",
+    "hr",
+    "li",
+    "main",
+    "nav",
+    "ol",
+    "p",
+    "pre",
+    "section",
+    "summary",
+    "ul",
+}
+
+# Inline elements written as markdown emphasis
+emphasis_tags = {"b": "**", "strong": "**", "i": "*", "em": "*"}
+
+# Elements without content or an end tag
+void_tags = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+class MarkdownConverter(HTMLParser):
+    """
+    Convert an HTML page to markdown as the page is fed to it, the way the browser crawler does for the listing parser
+    and the LLM: headings, paragraphs, lists, emphasis, links and images, and tables as pipe tables.
+
+    The converter does not run scripts, so pages rendered by JavaScript come out without their content.
+    """
+
+    def __init__(self, base_url: str = ""):
+        """
+        Args:
+            base_url: The URL of the page, to make the URLs of its links and images absolute.
+        """
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+
+        # The finished blocks of the page
+        self.blocks: list[str] = []
+        # The pieces of inline text being collected, the innermost link or table cell last
+        self._buffers: list[list[str]] = [[]]
+        # The URLs of the links being collected, innermost last
+        self._links: list[str | None] = []
+        # The rows of the table being collected, or None outside of tables
+        self._rows: list[list[str]] | None = None
+        self._row: list[str] | None = None
+        self._skipped = 0
+        self._lists: list[str] = []
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]):
+        if tag in skipped_tags:
+            if tag not in void_tags:
+                self._skipped += 1
+            return
+        if self._skipped:
+            return
+
+        attributes = dict(attrs)
+        if tag in block_tags:
+            self._end_block()
+            if tag in ("ul", "ol"):
+                self._lists.append(tag)
+            elif tag == "li":
+                self._write("- " if not self._lists or self._lists[-1] == "ul" else "1. ")
+            elif re.fullmatch(r"h[1-6]", tag):
+                self._write("#" * int(tag[1]) + " ")
+        elif tag == "br":
+            self._write("\n" if self._rows is None else " ")
+        elif tag == "a":
+            href = attributes.get("href")
+            self._links.append(urljoin(self.base_url, href) if href and not href.startswith("javascript:") else None)
+            self._buffers.append([])
+        elif tag == "img":
+            if src := attributes.get("src"):
+                self._write(f"![{clean_inline(attributes.get('alt') or '')}]({urljoin(self.base_url, src)})")
+        elif tag in emphasis_tags:
+            self._write(emphasis_tags[tag])
+        elif tag == "table":
+            self._end_block()
+            self._rows = []
+        elif tag == "tr" and self._rows is not None:
+            self._end_row()
+            self._row = []
+        elif tag in ("td", "th") and self._row is not None:
+            # A cell ends where the next one starts, even without an end tag
+            self._end_cells()
+            self._buffers.append([])
+
+    def handle_endtag(self, tag: str):
+        if tag in skipped_tags:
+            self._skipped = max(self._skipped - 1, 0)
+            return
+        if self._skipped:
+            return
+
+        if tag in block_tags:
+            if tag in ("ul", "ol") and self._lists:
+                self._lists.pop()
+            self._end_block()
+        elif tag == "a" and self._links:
+            url = self._links.pop()
+            text = clean_inline("".join(self._buffers.pop()))
+            self._write(f"[{text}]({url})" if url else text)
+        elif tag in emphasis_tags:
+            self._write(emphasis_tags[tag])
+        elif tag in ("td", "th") and self._row is not None and len(self._buffers) > 1:
+            self._row.append(clean_inline("".join(self._buffers.pop())).replace("|", "\\|"))
+        elif tag == "tr":
+            self._end_row()
+        elif tag == "table" and self._rows is not None:
+            self._end_row()
+            rows, self._rows = self._rows, None
+            self._write_table(rows)
+
+    def handle_data(self, data: str):
+        if not self._skipped:
+            self._write(data)
+
+    def close(self):
+        super().close()
+        self._end_row()
+        if self._rows:
+            rows, self._rows = self._rows, None
+            self._write_table(rows)
+        self._end_block()
+
+    def _write(self, text: str):
+        self._buffers[-1].append(text)
+
+    def _end_block(self):
+        # Block boundaries inside a table cell or link only separate words
+        if len(self._buffers) > 1:
+            self._write(" ")
+            return
+
+        lines = (clean_inline(line) for line in "".join(self._buffers[0]).split("\n"))
+        block = "\n".join(line for line in lines if line and line not in ("-", "1.", "**", "*"))
+        if block and not re.fullmatch(r"#+", block):
+            self.blocks.append(block)
+        self._buffers[0] = []
+
+    def _end_row(self):
+        if self._row is not None and self._rows is not None:
+            self._end_cells()
+            if any(self._row):
+                self._rows.append(self._row)
+        self._row = None
+
+    def _end_cells(self):
+        # Close the cells left open by the page, in the order they were opened
+        cells = self._buffers[1:]
+        del self._buffers[1:]
+        self._row.extend(clean_inline("".join(cell)).replace("|", "\\|") for cell in cells)
+
+    def _write_table(self, rows: list[list[str]]):
+        if not rows:
+            return
+
+        width = max(len(cells) for cells in rows)
+        lines = []
+        for i, cells in enumerate(rows):
+            lines.append("| " + " | ".join(cells + [""] * (width - len(cells))) + " |")
+            # Markdown tables need a separator after their first row, whether it is a header or not
+            if i == 0:
+                lines.append("|" + "|".join(["---"] * width) + "|")
+
+        self._end_block()
+        self.blocks.append("\n".join(lines))
+
+
+def clean_inline(text: str) -> str:
+    """
+    Collapse the whitespace of a piece of inline text, keeping line breaks.
+
+    Args:
+        text: The text.
+
+    Returns:
+        The text with runs of spaces collapsed into one, and no spaces around line breaks.
+    """
+    return "\n".join(" ".join(line.split()) for line in text.split("\n")).strip()
+
+
+def html_to_markdown(html: str, base_url: str = "") -> str:
+    """
+    Convert an HTML page to markdown in-process, without a browser.
+
+    Args:
+        html: The HTML of the page.
+        base_url: The URL of the page, to make the URLs of its links and images absolute.
+
+    Returns:
+        The markdown content of the page, with blocks separated by blank lines.
+    """
+    converter = MarkdownConverter(base_url)
+    converter.feed(html)
+    converter.close()
+
+    return "\n\n".join(converter.blocks)
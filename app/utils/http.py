@@ -0,0 +1,340 @@
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+from random import uniform
+from threading import Lock
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.core.config import settings
+from app.utils.metrics import metrics
+
+
+class ThrottledError(requests.HTTPError):
+    """
+    Raised when a host keeps rate limiting a request after every retry.
+    """
+
+
+class CircuitOpenError(requests.RequestException):
+    """
+    Raised instead of sending a request to a host that failed too many times in a row.
+    """
+
+
+class RateLimiter:
+    """
+    A token bucket limiting the rate of requests to a host, adapting to the rate the host tolerates.
+
+    The rate is halved every time the host rate limits a request, and every request is paused until the time the host
+    asked to wait for. The rate then grows back slowly as requests succeed, up to the configured maximum.
+    """
+
+    # Factor the rate grows by with each successful request
+    increase = 1.05
+
+    def __init__(self, max_rate: float, burst: int = 1, min_rate: float = 0.1):
+        """
+        Args:
+            max_rate: The maximum number of requests per second.
+            burst: The number of requests that can be sent at once after an idle period.
+            min_rate: The minimum number of requests per second the rate can be lowered to.
+        """
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.burst = burst
+        self.rate = max_rate
+
+        self._next_slot = 0.0
+        self._resume_at = 0.0
+        self._lock = Lock()
+
+    def reserve(self) -> float:
+        """
+        Reserve the next free slot for a request.
+
+        Returns:
+            The number of seconds to wait before sending the request.
+        """
+        with self._lock:
+            now = time.monotonic()
+
+            # After an idle period, up to burst requests can be sent at once
+            slot = max(self._next_slot, now - (self.burst - 1) / self.rate, self._resume_at)
+            self._next_slot = slot + 1 / self.rate
+
+            return max(0.0, slot - now)
+
+    def acquire(self):
+        """
+        Block until a request can be sent.
+        """
+        time.sleep(self.reserve())
+
+    async def acquire_async(self):
+        """
+        Wait until a request can be sent, without blocking the event loop.
+        """
+        await asyncio.sleep(self.reserve())
+
+    def throttled(self, retry_after: float = None):
+        """
+        Record a rate limited response, lowering the rate and pausing every request.
+
+        Args:
+            retry_after: The number of seconds the host asked to wait for, if it did.
+        """
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+            # Add jitter, so the paused requests don't all resume at the same moment
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self._resume_at = max(self._resume_at, time.monotonic() + pause + uniform(0, 1 / self.rate))
+
+    def succeeded(self):
+        """
+        Record a successful response, growing the rate back towards the maximum.
+        """
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate * self.increase)
+
+
+class CircuitBreaker:
+    """
+    Stop sending requests to a host after too many failures in a row.
+
+    Once open, the circuit fails every request until the cooldown has passed. It then lets one request through, and
+    closes again if that request succeeds.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        """
+        Args:
+            threshold: The number of failures in a row that open the circuit.
+            cooldown: The number of seconds the circuit stays open for.
+        """
+        self.threshold = threshold
+        self.cooldown = cooldown
+
+        self.failures = 0
+        self._open_until = 0.0
+        self._lock = Lock()
+
+    def check(self, host: str):
+        """
+        Check that a request can be sent.
+
+        Args:
+            host: The host the circuit is for, used in the error message.
+
+        Raises:
+            CircuitOpenError: If the circuit is open.
+        """
+        with self._lock:
+            if self.failures < self.threshold:
+                return
+
+            now = time.monotonic()
+            if now < self._open_until:
+                raise CircuitOpenError(f"{host} failed {self.failures} times in a row, not sending more requests")
+
+            # Let this request through to test the host, and keep the circuit open for the others
+            self._open_until = now + self.cooldown
+
+    def failed(self):
+        """
+        Record a failed request, opening the circuit once the threshold is reached.
+        """
+        with self._lock:
+            self.failures += 1
+            if self.failures == self.threshold:
+                self._open_until = time.monotonic() + self.cooldown
+
+    def succeeded(self):
+        """
+        Record a successful request, closing the circuit.
+        """
+        with self._lock:
+            self.failures = 0
+
+
+def get_retry_delay(attempt: int, base_delay: float = 1.0, max_delay: float = 60.0) -> float:
+    """
+    Get the time to wait before retrying a failed request, with jittered exponential backoff.
+
+    Args:
+        attempt: The number of the attempt that failed, starting from 1.
+        base_delay: The delay in seconds the backoff starts from.
+        max_delay: The longest delay in seconds.
+
+    Returns:
+        The number of seconds to wait.
+    """
+    return uniform(0, min(base_delay * 2**attempt, max_delay))
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Parse the value of a Retry-After header.
+
+    Args:
+        value: The header value, either a number of seconds or an HTTP date.
+
+    Returns:
+        The number of seconds to wait, or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+
+    if value.strip().isnumeric():
+        return float(value)
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient:
+    """
+    A client shared by every outbound HTTP request, on top of one keep-alive requests session.
+
+    Each host gets its own adaptive rate limiter and circuit breaker. Every request has a timeout, and requests that
+    fail to connect, time out, are rate limited or get a server error are retried with jittered exponential backoff.
+
+    Rate limiters and circuit breakers are kept per process. Processes sharing a host's rate limit, like the workers of
+    a sharded run, set rate_limit_share to the part of it each of them may use.
+    """
+
+    def __init__(self, pool_size: int):
+        """
+        Args:
+            pool_size: The maximum number of connections kept open to each host.
+        """
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=pool_size))
+        self.session.mount("http://", HTTPAdapter(pool_connections=10, pool_maxsize=pool_size))
+
+        # The part of the configured rate limits this process may use
+        self.rate_limit_share = 1.0
+
+        self._limiters: dict[str, RateLimiter] = {}
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = Lock()
+
+    def get_limiter(self, host: str) -> RateLimiter:
+        """
+        Get the rate limiter of a host.
+
+        Args:
+            host: The host name.
+
+        Returns:
+            The rate limiter, created with this process' share of the host's rate limit from the settings on first use.
+        """
+        with self._lock:
+            if host not in self._limiters:
+                max_rate = settings.HTTP_RATE_LIMITS.get(host, settings.HTTP_RATE_LIMIT) * self.rate_limit_share
+                self._limiters[host] = RateLimiter(max_rate, burst=max(1, int(max_rate)))
+
+            return self._limiters[host]
+
+    def get_breaker(self, host: str) -> CircuitBreaker:
+        """
+        Get the circuit breaker of a host.
+
+        Args:
+            host: The host name.
+
+        Returns:
+            The circuit breaker, created on first use.
+        """
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(
+                    settings.CIRCUIT_BREAKER_THRESHOLD, settings.CIRCUIT_BREAKER_COOLDOWN
+                )
+
+            return self._breakers[host]
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request, waiting for the host's rate limit and retrying it if it fails.
+
+        Responses with a client error other than 429 are returned as they are, for the caller to handle.
+
+        Args:
+            method: The HTTP method.
+            url: The URL to send the request to.
+            **kwargs: Other arguments for requests.Session.request. The timeout defaults to REQUEST_TIMEOUT.
+
+        Returns:
+            The response.
+
+        Raises:
+            ThrottledError: If the host still rate limited the request after every retry.
+            CircuitOpenError: If the host failed too many requests in a row.
+            requests.RequestException: If the request still failed after every retry.
+        """
+        host = urlsplit(url).netloc
+        limiter = self.get_limiter(host)
+        breaker = self.get_breaker(host)
+        kwargs.setdefault("timeout", settings.REQUEST_TIMEOUT)
+
+        for attempt in range(1, settings.HTTP_MAX_RETRIES + 2):
+            is_last_attempt = attempt > settings.HTTP_MAX_RETRIES
+
+            breaker.check(host)
+            limiter.acquire()
+
+            started_at = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.record_request(host, type(e).__name__, time.monotonic() - started_at)
+                breaker.failed()
+                if is_last_attempt:
+                    raise
+
+                time.sleep(get_retry_delay(attempt))
+                continue
+
+            metrics.record_request(host, response.status_code, time.monotonic() - started_at)
+
+            if response.status_code == 429:
+                limiter.throttled(parse_retry_after(response.headers.get("retry-after")))
+                response.close()
+                if is_last_attempt:
+                    raise ThrottledError(f"{host} is still rate limiting requests to {url}", response=response)
+
+                continue
+
+            if response.status_code >= 500:
+                breaker.failed()
+                if is_last_attempt:
+                    response.raise_for_status()
+
+                response.close()
+                time.sleep(get_retry_delay(attempt))
+                continue
+
+            breaker.succeeded()
+            limiter.succeeded()
+            return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """
+        Send a GET request. See request.
+        """
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """
+        Send a POST request. See request.
+        """
+        return self.request("POST", url, **kwargs)
+
+
+client = HttpClient(pool_size=max(settings.CIENCE_CONCURRENCY, settings.CORESIGNAL_CONCURRENCY))
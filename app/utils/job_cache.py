@@ -0,0 +1,138 @@
+import sqlite3
+import time
+from functools import cache
+from pathlib import Path
+from threading import Lock
+from typing import Iterable
+
+from app.core.config import settings
+from app.schemas.company import CompanyRecord
+
+
+class JobCountCache:
+    """
+    A persistent store of the job counts fetched for each (source, LinkedIn slug, keyword), backed by SQLite.
+
+    Counts older than the TTL are treated as missing, so they are fetched again.
+    """
+
+    # Maximum number of parameters in a single SQLite query
+    max_variables = 900
+
+    def __init__(self, path: str | Path, ttl: float):
+        """
+        Open the store in a database file, creating it if it does not exist yet.
+
+        Args:
+            path: The path of the SQLite database file.
+            ttl: The number of seconds a job count stays fresh for.
+        """
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = Lock()
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS job_counts (
+                    source TEXT NOT NULL,
+                    slug TEXT NOT NULL,
+                    keyword TEXT NOT NULL,
+                    job_count INTEGER NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    PRIMARY KEY (source, slug, keyword)
+                )
+                """
+            )
+
+    def get_many(self, source: str, slugs: Iterable[str], keywords: list[str]) -> dict[str, dict[str, int]]:
+        """
+        Look up the fresh job counts of many companies at once.
+
+        Args:
+            source: The source the counts were fetched from, e.g. "coresignal" or "linkedin".
+            slugs: The LinkedIn company slugs.
+            keywords: The keywords to look up the counts for.
+
+        Returns:
+            The fresh job counts found, by slug and then by keyword. Slugs without any fresh count are left out.
+        """
+        slugs = list(dict.fromkeys(slugs))
+        counts: dict[str, dict[str, int]] = {}
+        oldest = time.time() - self.ttl
+
+        with self._lock:
+            for start in range(0, len(slugs), self.max_variables):
+                chunk = slugs[start : start + self.max_variables]
+                rows = self._connection.execute(
+                    f"""
+                    SELECT slug, keyword, job_count FROM job_counts
+                    WHERE source = ? AND fetched_at >= ? AND slug IN ({", ".join("?" * len(chunk))})
+                    """,
+                    [source, oldest, *chunk],
+                )
+                for slug, keyword, job_count in rows:
+                    if keyword in keywords:
+                        counts.setdefault(slug, {})[keyword] = job_count
+
+            found = sum(len(slug_counts) for slug_counts in counts.values())
+            self.hits += found
+            self.misses += len(slugs) * len(keywords) - found
+
+        return counts
+
+    def set_many(self, source: str, counts: dict[str, dict[str, int]], fetched_at: float = None):
+        """
+        Store the job counts of many companies at once.
+
+        When the time the counts were fetched at is given, such as for the counts of an earlier run, counts already
+        stored are kept, since they were stored with the time they were actually fetched at.
+
+        Args:
+            source: The source the counts were fetched from, e.g. "coresignal" or "linkedin".
+            counts: The job counts, by slug and then by keyword.
+            fetched_at: The time the counts were fetched at, as a timestamp, defaults to now.
+        """
+        rows = [
+            (source, slug, keyword, job_count, fetched_at or time.time())
+            for slug, slug_counts in counts.items()
+            for keyword, job_count in slug_counts.items()
+        ]
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                f"INSERT OR {'IGNORE' if fetched_at else 'REPLACE'} INTO job_counts VALUES (?, ?, ?, ?, ?)", rows
+            )
+
+
+def get_new_job_counts(company: CompanyRecord, cached_counts: dict[str, int] | None) -> dict[str, int]:
+    """
+    Get the job counts of an enriched company that were fetched, rather than taken from the cache.
+
+    Args:
+        company: The enriched company.
+        cached_counts: The job counts of the company that were taken from the cache, by keyword.
+
+    Returns:
+        The fetched job counts, by keyword.
+    """
+    cached_counts = cached_counts or {}
+    return {keyword: count for keyword, count in company.get_job_counts().items() if keyword not in cached_counts}
+
+
+@cache
+def get_job_cache() -> JobCountCache:
+    """
+    Get the job count cache of the run.
+
+    Opening the cache creates its database, so it is only opened the first time it is used.
+
+    Returns:
+        The cache.
+    """
+    return JobCountCache(Path(settings.CACHE_DIR) / "job_counts.sqlite3", ttl=settings.JOB_CACHE_TTL_HOURS * 60 * 60)
@@ -0,0 +1,137 @@
+import json
+from pathlib import Path
+from typing import Any, TextIO
+
+
+class RunJournal:
+    """
+    An append-only record of the progress of a run, used to resume the run if it is interrupted.
+
+    The journal is a file of JSON lines. The first line holds the parameters of the run, and every following line
+    records a step that was completed: the number of result pages found for a search, a page whose companies were all
+    written, or a LinkedIn slug that was resolved. Every line is flushed as soon as it is written, so the journal
+    survives a crash.
+
+    A run is made of one or more searches, each an [industry_group, revenue] pair in the "searches" parameter, and
+    pages are identified by the index of their search and their index within it.
+    """
+
+    def __init__(self, path: str | Path, params: dict[str, Any]):
+        """
+        Args:
+            path: The path of the journal file.
+            params: The parameters of the run.
+        """
+        self.path = Path(path)
+        self.params = params
+
+        self.page_counts: dict[int, int] = {}
+        self.completed_pages: set[tuple[int, int]] = set()
+        self.slugs: dict[str, str] = {}
+
+        self._file: TextIO | None = None
+
+    @classmethod
+    def create(cls, path: str | Path, **params: Any) -> "RunJournal":
+        """
+        Start the journal of a new run.
+
+        Args:
+            path: The path of the journal file.
+            **params: The parameters of the run.
+
+        Returns:
+            The new journal.
+        """
+        journal = cls(path, params)
+        journal._append(params)
+        return journal
+
+    @classmethod
+    def load(cls, path: str | Path) -> "RunJournal":
+        """
+        Load the journal of an interrupted run to resume it.
+
+        Args:
+            path: The path of the journal file.
+
+        Returns:
+            The journal, with the steps completed so far.
+        """
+        with open(path) as file:
+            lines = file.read().splitlines()
+
+        params = json.loads(lines[0])
+        if "searches" not in params:
+            # Journals of runs started before batch mode hold a single search
+            params["searches"] = [[params.pop("industry_group"), params.pop("revenue")]]
+
+        journal = cls(path, params)
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # The run was interrupted while writing this line
+                continue
+
+            if "pages" in entry:
+                journal.page_counts[entry.get("search", 0)] = entry["pages"]
+            elif "page" in entry:
+                journal.completed_pages.add((entry.get("search", 0), entry["page"]))
+            elif "slug" in entry:
+                journal.slugs[entry["url"]] = entry["slug"]
+
+        return journal
+
+    def _append(self, entry: dict[str, Any]):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a")
+
+            # Start on a new line, in case the run was interrupted in the middle of writing one
+            if self._file.tell() > 0 and not self.path.read_text().endswith("\n"):
+                self._file.write("\n")
+
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def record_page_count(self, search: int, page_count: int):
+        """
+        Record the number of result pages found for a search of the run.
+
+        Args:
+            search: The index of the search.
+            page_count: The number of result pages.
+        """
+        self.page_counts[search] = page_count
+        self._append({"search": search, "pages": page_count})
+
+    def record_completed_page(self, search: int, page: int):
+        """
+        Record that every company from a result page was written.
+
+        Args:
+            search: The index of the search the page belongs to.
+            page: The index of the result page within the search.
+        """
+        self.completed_pages.add((search, page))
+        self._append({"search": search, "page": page})
+
+    def record_slug(self, company_details_page_url: str, slug: str):
+        """
+        Record the LinkedIn slug resolved for a company.
+
+        Args:
+            company_details_page_url: The URL to the company details page on cience.
+            slug: The LinkedIn company slug.
+        """
+        self.slugs[company_details_page_url] = slug
+        self._append({"url": company_details_page_url, "slug": slug})
+
+    def close(self):
+        """
+        Close the journal file.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -1,7 +1,12 @@
+import re
+from queue import Queue
+from threading import Event, Thread
 from traceback import print_exception
+from typing import Iterator
+from urllib.parse import quote
 
 from selenium import webdriver
-from selenium.common import StaleElementReferenceException, TimeoutException
+from selenium.common import StaleElementReferenceException, TimeoutException, WebDriverException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.firefox.options import Options
 from selenium.webdriver.firefox.service import Service
@@ -10,23 +15,54 @@ from selenium.webdriver.support.wait import WebDriverWait
 from webdriver_manager.firefox import GeckoDriverManager
 
 from app.core.config import settings
-from app.schemas.company import CompanyWithJobCounts, CompanyWithLinkedinSlug
+from app.schemas.company import CompanyRecord, job_count_keywords
+from app.utils.metrics import metrics
 
+# The numeric id of a company, as linked from its LinkedIn page
+company_id_pattern = re.compile(r"(?:f_C=|urn:li:fsd_company:|urn:li:company:)(\d+)")
 
-def setup_driver() -> webdriver.Firefox:
+# Elements of the job search results page showing the number of results, or that there are none
+job_count_selector = ".jobs-search-results-list__subtitle"
+no_jobs_selector = ".jobs-search-no-results-banner, .jobs-search-two-pane__no-results-banner--expand"
+
+# Firefox preferences blocking the resources that are not needed to read job counts
+resource_blocking_preferences = {
+    "permissions.default.image": 2,
+    "permissions.default.stylesheet": 2,
+    "browser.display.use_document_fonts": 0,
+    "gfx.downloadable_fonts.enabled": False,
+    "media.autoplay.default": 5,
+    "media.mediasource.enabled": False,
+}
+
+
+@metrics.timed("linkedin_setup")
+def setup_driver(fast_mode: bool = None) -> webdriver.Firefox:
     """
     Set up a Selenium WebDriver session with Firefox and log into LinkedIn using the LI_AT cookie.
 
     The session is set up to be headless, and the cookie is added to the session to log in to LinkedIn.
     The method returns the active WebDriver session.
 
+    In fast mode, images, fonts, media and stylesheets are not loaded, and navigation returns as soon as the document
+    is parsed instead of waiting for every resource.
+
+    :param fast_mode: Whether to set up the session for fast mode, defaults to the LINKEDIN_FAST_MODE setting.
     :return: A Selenium WebDriver session with Firefox and a logged-in LinkedIn session.
     :rtype: webdriver.Firefox
     """
+    if fast_mode is None:
+        fast_mode = settings.LINKEDIN_FAST_MODE
+
     options = Options()
     options.add_argument("--disable-blink-features=AutomationControlled")
     options.add_argument("--headless")
 
+    if fast_mode:
+        options.page_load_strategy = "eager"
+        for name, value in resource_blocking_preferences.items():
+            options.set_preference(name, value)
+
     driver = webdriver.Firefox(service=Service(GeckoDriverManager().install()), options=options)
 
     # Open LinkedIn and login using the cookie
@@ -36,7 +72,9 @@ def setup_driver() -> webdriver.Firefox:
 
     # Wait for the page to load
     WebDriverWait(driver, 10).until(
-        expected_conditions.visibility_of_element_located((By.CSS_SELECTOR, ".profile-card"))
+        expected_conditions.presence_of_element_located((By.CSS_SELECTOR, ".profile-card"))
+        if fast_mode
+        else expected_conditions.visibility_of_element_located((By.CSS_SELECTOR, ".profile-card"))
     )
 
     return driver  # Keep this session active
@@ -50,15 +88,14 @@ def get_jobs_for_title(driver: webdriver.Firefox, original_window: str, job_titl
     It searches for job postings with the given title, waits for the results page to load,
     extracts the number of job postings, closes the results tab, and switches back to the original tab.
 
-    If an exception occurs during the process, the method will return 0.
+    If an exception occurs during the process, the results tab is closed and the exception is raised, so that a
+    failed search is not taken for a company without jobs.
 
     :param driver: An active WebDriver session
     :param original_window: The original window handle
     :param job_title: The job title to search for
     :return: The number of job postings found
     """
-    job_count = 0
-
     try:
         wait = WebDriverWait(driver, 5)
 
@@ -94,15 +131,12 @@ def get_jobs_for_title(driver: webdriver.Firefox, original_window: str, job_titl
         except TimeoutException:
             return 0
 
-    except Exception as e:
-        print_exception(e)
-
     finally:
         # Close the results tab and switch back to the original tab
         driver.close()
         driver.switch_to.window(original_window)
 
-        return job_count
+    return job_count
 
 
 def get_jobs(driver: webdriver.Firefox, company_handle: str, job_titles: list[str]) -> dict[str, int]:
@@ -117,6 +151,7 @@ def get_jobs(driver: webdriver.Firefox, company_handle: str, job_titles: list[st
     :param company_handle: The LinkedIn company handle to search for job postings.
     :param job_titles: The job titles to search for.
     :return: The number of job postings found for the given company and job titles.
+    :raises Exception: If the job postings could not be searched, so the failure is not cached as a count of 0.
     """
 
     job_counts = {title: 0 for title in job_titles}
@@ -153,40 +188,241 @@ def get_jobs(driver: webdriver.Firefox, company_handle: str, job_titles: list[st
     except Exception as e:
         print(f"Error searching jobs for {company_handle}:")
         print_exception(e)
-        return job_counts
+        raise
+
+
+def get_job_count_from_search(driver: webdriver.Firefox, company_id: str, job_title: str) -> int:
+    """
+    Open the LinkedIn job search results for a company and job title in the current tab, and return the number of
+    job postings found.
+
+    The method returns as soon as the results page shows either the number of results or that there are none.
+
+    :param driver: An active WebDriver session
+    :param company_id: The numeric LinkedIn id of the company
+    :param job_title: The job title to search for
+    :return: The number of job postings found
+    """
+    driver.get(f"https://www.linkedin.com/jobs/search/?f_C={company_id}&keywords={quote(job_title)}")
+
+    result = WebDriverWait(driver, settings.LINKEDIN_TIMEOUT).until(
+        expected_conditions.any_of(
+            expected_conditions.presence_of_element_located((By.CSS_SELECTOR, job_count_selector)),
+            expected_conditions.presence_of_element_located((By.CSS_SELECTOR, no_jobs_selector)),
+        )
+    )
+
+    try:
+        count = result.text.split(" ")[0].replace(",", "")
+    except StaleElementReferenceException:
+        # The subtitle is first rendered and then removed when there are no matching jobs
+        return 0
+
+    return int(count) if count.isnumeric() else 0
+
+
+def get_jobs_from_search(driver: webdriver.Firefox, company_handle: str, job_titles: list[str]) -> dict[str, int]:
+    """
+    Search for job postings on LinkedIn for a given company and job titles, without going through the company page.
+
+    The method loads the company's job listings page once to find the company's numeric id, or that it has no jobs,
+    and then opens the job search results for each job title directly in the same tab. If the id can't be found,
+    it falls back to searching through the company page.
+
+    :param driver: An active WebDriver session
+    :param company_handle: The LinkedIn company handle to search for job postings.
+    :param job_titles: The job titles to search for.
+    :return: The number of job postings found for the given company and job titles.
+    :raises Exception: If the job postings could not be searched, so the failure is not cached as a count of 0.
+    """
+    job_counts = {title: 0 for title in job_titles}
+
+    try:
+        driver.get(f"https://www.linkedin.com/company/{company_handle}/jobs")
+
+        # Wait until the page links the company's id, or says that there are no jobs or that the page isn't available
+        page_source = WebDriverWait(driver, settings.LINKEDIN_TIMEOUT).until(
+            lambda d: (
+                d.page_source
+                if company_id_pattern.search(d.page_source)
+                or "There are no jobs right now" in d.page_source
+                or "This LinkedIn Page isn’t available" in d.page_source
+                else False
+            )
+        )
+
+        # If there are no jobs or the LinkedIn slug is incorrect, return 0
+        if "There are no jobs right now" in page_source or "This LinkedIn Page isn’t available" in page_source:
+            return job_counts
+
+        company_id = company_id_pattern.search(page_source).group(1)
+    except TimeoutException:
+        print(f"Could not find the LinkedIn id of {company_handle}, searching through the company page instead")
+        return get_jobs(driver, company_handle, job_titles)
+
+    try:
+        for job_title in job_titles:
+            job_counts[job_title] = get_job_count_from_search(driver, company_id, job_title)
+    except Exception as e:
+        print(f"Error searching {job_title} jobs for {company_handle}:")
+        print_exception(e)
+        raise
+
+    return job_counts
 
 
+@metrics.timed("linkedin")
 def enrich_company_with_linkedin_job_counts(
-    driver: webdriver.Firefox, company: CompanyWithLinkedinSlug
-) -> CompanyWithJobCounts:
+    driver: webdriver.Firefox, company: CompanyRecord, cached_counts: dict[str, int] = None
+) -> CompanyRecord:
     """
-    Enrich a CompanyWithLinkedinSlug object with job counts for the company.
+    Enrich a CompanyRecord object with job counts for the company.
 
-    The method takes a CompanyWithLinkedinSlug object and a Selenium WebDriver session as input,
-    searches for job postings on LinkedIn for the given company and job titles "AI", "Engineer", and "IT",
-    extracts the number of job postings for each job title,
-    and returns a CompanyWithJobCounts object with the job counts.
+    The method takes a CompanyRecord object and a Selenium WebDriver session as input,
+    searches for job postings on LinkedIn for the given company and each keyword of the JOB_COUNT_KEYWORDS setting,
+    extracts the number of job postings for each keyword,
+    and sets them on the record in place.
 
     :param driver: A Selenium WebDriver session.
-    :param company: A CompanyWithLinkedinSlug object to enrich with job counts.
-    :return: A CompanyWithJobCounts object with the job counts.
-    """
-    # Get the job counts for the company
-    results = get_jobs(driver, company.linkedin_slug, ["AI", "Engineer", "IT"])
-
-    # Create a CompanyWithJobCounts object with the job counts
-    return CompanyWithJobCounts(
-        **company.model_dump(),
-        ai_jobs=results["AI"],
-        engineer_jobs=results["Engineer"],
-        it_jobs=results["IT"],
-    )
+    :param company: A CompanyRecord object to enrich with job counts.
+    :param cached_counts: Job counts already known for the company, by keyword. These are not searched again.
+    :return: The same CompanyRecord object, with the job counts.
+    :raises Exception: If a job count could not be fetched.
+    """
+    results = dict(cached_counts or {})
+
+    # Get the job counts for the company that are not known yet
+    missing_keywords = [keyword for keyword in job_count_keywords if keyword not in results]
+    if missing_keywords:
+        search = get_jobs_from_search if settings.LINKEDIN_FAST_MODE else get_jobs
+        results.update(search(driver, company.linkedin_slug, missing_keywords))
+
+    # Set the job counts on the record, once all of them are known
+    return company.set_job_counts(results)
+
+
+def is_driver_usable(driver: webdriver.Firefox) -> bool:
+    """
+    Check whether a WebDriver session is still running and logged in to LinkedIn.
+
+    :param driver: A Selenium WebDriver session.
+    :return: False if the browser crashed, or LinkedIn redirected it to a login or security check page.
+    """
+    try:
+        current_url = driver.current_url
+    except WebDriverException:
+        return False
+
+    return not any(page in current_url for page in ("/login", "/authwall", "/checkpoint", "/uas/"))
+
+
+def quit_driver(driver: webdriver.Firefox | None):
+    """
+    Quit a WebDriver session, ignoring errors from a browser that already crashed.
+
+    :param driver: A Selenium WebDriver session, or None.
+    """
+    if driver is None:
+        return
+
+    try:
+        driver.quit()
+    except WebDriverException:
+        pass
+
+
+def run_linkedin_worker(tasks: Queue, results: Queue, stop: Event):
+    """
+    Enrich companies taken from a work queue with job counts from LinkedIn, using a browser of its own.
+
+    The browser is set up and logged in once, and reused for every company. If it crashes or is logged out while
+    enriching a company, it is replaced with a new one and the company is retried, up to LINKEDIN_MAX_RETRIES times.
+    Failures only affect the company being enriched, which is reported with its exception instead of a result.
+
+    :param tasks: The queue of (company, cached job counts) to enrich, ending with None.
+    :param results: The queue to put (company, enriched company or the exception that failed it) on.
+    :param stop: An event set to stop the worker before the tasks run out.
+    """
+    driver = None
+
+    try:
+        while not stop.is_set():
+            task = tasks.get()
+            if task is None:
+                return
+
+            company, cached_counts = task
+            result = None
+            for attempt in range(settings.LINKEDIN_MAX_RETRIES + 1):
+                try:
+                    if driver is None:
+                        driver = setup_driver()
+
+                    result = enrich_company_with_linkedin_job_counts(driver, company, cached_counts)
+                    if is_driver_usable(driver):
+                        break
+
+                    result = RuntimeError("The browser crashed or was logged out")
+                except Exception as e:
+                    result = e
+
+                print("Replacing the browser after it failed on", company.company_name, "with", repr(result))
+                metrics.count("linkedin_browsers_replaced")
+                quit_driver(driver)
+                driver = None
+
+            results.put((company, result))
+    finally:
+        quit_driver(driver)
+
+
+def enrich_companies_with_linkedin_job_counts(
+    companies: list[CompanyRecord],
+    cached_counts: dict[str, dict[str, int]] = None,
+    workers: int = None,
+) -> Iterator[tuple[CompanyRecord, CompanyRecord | Exception]]:
+    """
+    Enrich a list of companies with job counts from LinkedIn, using a pool of logged in browsers.
+
+    Each worker of the pool sets up its own browser, takes companies from a shared work queue, and replaces its
+    browser if it crashes or is logged out. Results are yielded as soon as each company is enriched.
+
+    :param companies: The CompanyRecord objects to enrich with job counts.
+    :param cached_counts: Job counts already known for the companies, by slug and then by keyword.
+    :param workers: The number of browsers to use, defaults to the LINKEDIN_WORKERS setting.
+    :return: An iterator of tuples of each company and the same company enriched with job counts, or the exception that
+        prevented enriching it.
+    """
+    cached_counts = cached_counts or {}
+    workers = min(workers or settings.LINKEDIN_WORKERS, len(companies))
+
+    tasks: Queue = Queue()
+    results: Queue = Queue()
+    stop = Event()
+
+    for company in companies:
+        tasks.put((company, cached_counts.get(company.linkedin_slug)))
+    for _ in range(workers):
+        tasks.put(None)
+
+    threads = [Thread(target=run_linkedin_worker, args=(tasks, results, stop), daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        for _ in companies:
+            yield results.get()
+    finally:
+        # Stop the workers if the caller stopped early, and wait for them to quit their browsers
+        stop.set()
+        for thread in threads:
+            thread.join()
 
 
 if __name__ == "__main__":
     driver = setup_driver()
 
-    company = CompanyWithLinkedinSlug(
+    company = CompanyRecord(
         company_name="Opus",
         industry="Internet",
         location="United States, Illinois",
@@ -0,0 +1,285 @@
+import re
+
+from pydantic import ValidationError
+
+from app.core.config import settings
+from app.schemas.company import Company
+
+# Markdown link to a company details page on cience, capturing the link text and the URL
+details_link_pattern = re.compile(
+    r"(?<!!)\[([^\]]*)\]\((" + re.escape(settings.CIENCE_URL) + r"/company/[^\s)]+)(?:\s+\"[^\"]*\")?\)"
+)
+
+# Any markdown link or image, capturing the link text
+markdown_link_pattern = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+
+# Markdown heading, capturing its level
+heading_pattern = re.compile(r"\s*(#{1,6})\s")
+
+# Number of lines a company spans when a page lists a single company, and there is no other company to measure by
+default_company_lines = 12
+
+# Aliases of the labels / table headers used on the listing pages for each company field
+field_labels = {
+    "company_name": ("company", "company name", "name"),
+    "industry": ("industry",),
+    "location": ("location", "headquarters", "hq"),
+    "revenue": ("revenue", "annual revenue"),
+    "employees": ("employees", "employee count", "number of employees", "company size", "size"),
+}
+
+
+def clean_text(text: str) -> str:
+    """
+    Strip markdown formatting from a piece of text.
+
+    Args:
+        text: The markdown text.
+
+    Returns:
+        The plain text, with links replaced by their text and emphasis removed.
+    """
+    text = markdown_link_pattern.sub(r"\1", text)
+    text = re.sub(r"[*_`#>]+", "", text)
+    text = text.replace("\\|", "|")
+    return " ".join(text.split())
+
+
+def get_field_for_label(label: str) -> str | None:
+    """
+    Find the company field a label or table header refers to.
+
+    Args:
+        label: The label, as plain text.
+
+    Returns:
+        The name of the company field, or None if the label is not known.
+    """
+    label = label.lower().strip(" :")
+    for field, aliases in field_labels.items():
+        if label in aliases:
+            return field
+
+    return None
+
+
+def split_table_row(line: str) -> list[str]:
+    """
+    Split a markdown table row into its cells, respecting escaped pipes.
+
+    Args:
+        line: The table row.
+
+    Returns:
+        The raw markdown content of each cell.
+    """
+    cells = re.split(r"(?<!\\)\|", line.strip())
+
+    # Drop the empty cells before the leading pipe and after the trailing pipe
+    if cells and not cells[0].strip():
+        cells = cells[1:]
+    if cells and not cells[-1].strip():
+        cells = cells[:-1]
+
+    return [cell.strip() for cell in cells]
+
+
+def get_heading_level(line: str) -> int | None:
+    """
+    Get the level of a markdown heading.
+
+    Args:
+        line: The line of markdown.
+
+    Returns:
+        The number of "#" of the heading, or None if the line is not a heading.
+    """
+    heading = heading_pattern.match(line)
+    return len(heading.group(1)) if heading is not None else None
+
+
+def get_company_spans(lines: list[str]) -> list[tuple[int, int]]:
+    """
+    Find the lines of each company listed on a listing page.
+
+    A company listed in a table starts at the row linking to its details page. A company listed in a card starts at
+    the heading before its first details page link, such as "### Acme Corp" before "[View profile](...)", or at the link
+    when the cards have no headings. Each company ends where the next one starts. The last company ends where its table
+    ends, or after as many lines as the longest company before it, cut short by a heading that starts another section.
+
+    Args:
+        lines: The lines of the markdown content of the page.
+
+    Returns:
+        The index of the first line of each company and of the line after its last line, in page order.
+    """
+    # The first line linking to the details page of each company, since a card may link to it more than once
+    anchors = []
+    details_page = None
+    for i, line in enumerate(lines):
+        link = details_link_pattern.search(line)
+        if link is not None and link.group(2) != details_page:
+            anchors.append(i)
+            details_page = link.group(2)
+    if not anchors:
+        return []
+
+    def find_start(k: int, stop: int) -> int:
+        # A table row starts its company, and a card starts at the nearest heading above its link, if any
+        if lines[anchors[k]].lstrip().startswith("|"):
+            return anchors[k]
+        return next((i for i in range(anchors[k], stop, -1) if get_heading_level(lines[i])), anchors[k])
+
+    starts = [find_start(k, anchors[k - 1]) for k in range(1, len(anchors))]
+    # The first company has no company before it to bound the search, so its heading is looked for within as many
+    # lines as the other companies have between their heading and their link, and only if they have headings
+    offsets = [anchor - start for anchor, start in zip(anchors[1:], starts) if get_heading_level(lines[start])]
+    if offsets or len(anchors) == 1:
+        offset = max(offsets, default=default_company_lines)
+        starts.insert(0, find_start(0, max(anchors[0] - offset - 1, -1)))
+    else:
+        starts.insert(0, anchors[0])
+
+    ends = [*starts[1:], len(lines)]
+    last_start, last_anchor = starts[-1], anchors[-1]
+    if lines[last_anchor].lstrip().startswith("|"):
+        end = last_anchor + 1
+        while end < len(lines) and lines[end].lstrip().startswith("|"):
+            end += 1
+    else:
+        company_lines = max((b - a for a, b in zip(starts, starts[1:])), default=default_company_lines)
+        end = min(last_start + company_lines, len(lines))
+        # A heading of the level of the company headings or above starts another section of the page
+        level = get_heading_level(lines[last_start]) or 6
+        end = next((i for i in range(last_anchor + 1, end) if (get_heading_level(lines[i]) or 7) <= level), end)
+    ends[-1] = end
+
+    return list(zip(starts, ends))
+
+
+def parse_table(page_content: str) -> list[dict[str, str]]:
+    """
+    Parse companies from the markdown tables of a listing page.
+
+    Args:
+        page_content: The markdown content of the page.
+
+    Returns:
+        The fields of each company found in a table row with a details page link.
+    """
+    companies = []
+    columns: dict[int, str] = {}
+
+    for line in page_content.splitlines():
+        if not line.lstrip().startswith("|"):
+            columns = {}
+            continue
+
+        cells = split_table_row(line)
+
+        # Skip the separator row between the header and the body
+        if all(re.fullmatch(r":?-{3,}:?", cell) for cell in cells if cell):
+            continue
+
+        link = details_link_pattern.search(line)
+        if link is None:
+            # A row without a details page link is a header row, so map its columns to company fields
+            columns = {i: field for i, cell in enumerate(cells) if (field := get_field_for_label(clean_text(cell)))}
+            continue
+
+        company = {"company_name": clean_text(link.group(1)), "cience_details_page": link.group(2)}
+        for i, field in columns.items():
+            if i < len(cells) and field != "company_name":
+                company[field] = clean_text(cells[i])
+        companies.append(company)
+
+    return companies
+
+
+def parse_blocks(page_content: str) -> list[dict[str, str]]:
+    """
+    Parse companies from a listing page where each company is a block of labelled lines after its details page link.
+
+    Labels are either on the same line as their value ("Industry: Internet") or on the line before it.
+
+    Args:
+        page_content: The markdown content of the page.
+
+    Returns:
+        The fields of each company block found.
+    """
+    companies = []
+    company: dict[str, str] | None = None
+    pending_field = None
+
+    for line in page_content.splitlines():
+        link = details_link_pattern.search(line)
+        if link is not None and (company is None or link.group(2) != company["cience_details_page"]):
+            company = {"company_name": clean_text(link.group(1)), "cience_details_page": link.group(2)}
+            companies.append(company)
+            pending_field = None
+            continue
+
+        text = clean_text(line)
+        if company is None or not text:
+            continue
+
+        # The value of a label found on the previous line
+        if pending_field is not None:
+            company.setdefault(pending_field, text)
+            pending_field = None
+            continue
+
+        label, separator, value = text.partition(":")
+        field = get_field_for_label(label)
+        if field is not None and field != "company_name":
+            if separator and value.strip():
+                company.setdefault(field, value.strip())
+            else:
+                pending_field = field
+
+    return companies
+
+
+def parse_companies_from_page_content(page_content: str) -> list[Company] | None:
+    """
+    Parse companies from the markdown content of a cience listing page without using an LLM.
+
+    The page is parsed as a table of companies if it has one, and as blocks of labelled lines otherwise. The result is
+    only returned if it passes validation: at least one company was found, every company has all of its fields, and
+    every company details page linked from the page belongs to a parsed company.
+
+    Args:
+        page_content: The markdown content of the page as a string.
+
+    Returns:
+        A list of Company objects, or None if the page could not be parsed reliably.
+    """
+    linked_pages = {match.group(2) for match in details_link_pattern.finditer(page_content)}
+    if not linked_pages:
+        return None
+
+    for parse in (parse_table, parse_blocks):
+        parsed = parse(page_content)
+
+        # Every company linked from the page has to be parsed, and each one only once
+        parsed_pages = [company["cience_details_page"] for company in parsed]
+        if len(parsed_pages) != len(set(parsed_pages)) or set(parsed_pages) != linked_pages:
+            continue
+
+        # Every company has to have every field
+        if any(set(company) != set(Company.model_fields) for company in parsed):
+            continue
+
+        try:
+            companies = [Company(**company) for company in parsed]
+        except ValidationError:
+            continue
+
+        # Every field has to have a value, and CIENCE itself is not a company to list
+        if all(all(company.model_dump().values()) for company in companies) and not any(
+            company.company_name.lower() == "cience" for company in companies
+        ):
+            return companies
+
+    return None
@@ -0,0 +1,330 @@
+import inspect
+import json
+import os
+import time
+from bisect import bisect_left
+from functools import wraps
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable
+
+
+class Metrics:
+    """
+    Performance measurements of a run: the time spent in each stage, the requests sent to each host with their latency,
+    the tokens used by the LLM, and counts of other events.
+
+    Nothing is recorded until the metrics are enabled, so measuring costs next to nothing when a run is not profiled.
+    Every method can be called from any thread.
+    """
+
+    # Upper bounds in seconds of the buckets of the request latency histograms
+    latency_buckets = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self):
+        self.enabled = False
+        self.started_at = time.monotonic()
+
+        self.stages: dict[str, dict[str, float]] = {}
+        self.hosts: dict[str, dict[str, Any]] = {}
+        self.tokens: dict[str, dict[str, int]] = {}
+        self.counters: dict[str, int] = {}
+
+        self._lock = Lock()
+
+    def enable(self):
+        """
+        Start recording measurements, timing the run from now.
+        """
+        self.enabled = True
+        self.started_at = time.monotonic()
+
+    def record_stage(self, stage: str, started_at: float, ended_at: float):
+        """
+        Record a call of a stage.
+
+        Args:
+            stage: The name of the stage.
+            started_at: The time.monotonic() value the call started at.
+            ended_at: The time.monotonic() value the call ended at.
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            stats = self.stages.setdefault(
+                stage, {"calls": 0, "busy_seconds": 0.0, "first_started_at": started_at, "last_ended_at": ended_at}
+            )
+            stats["calls"] += 1
+            stats["busy_seconds"] += ended_at - started_at
+            stats["first_started_at"] = min(stats["first_started_at"], started_at)
+            stats["last_ended_at"] = max(stats["last_ended_at"], ended_at)
+
+    def timed(self, stage: str) -> Callable[[Callable], Callable]:
+        """
+        Decorate a function, sync or async, to record every call of it as a call of a stage.
+
+        Args:
+            stage: The name of the stage.
+
+        Returns:
+            The decorator.
+        """
+
+        def decorator(function: Callable) -> Callable:
+            if inspect.iscoroutinefunction(function):
+
+                @wraps(function)
+                async def async_wrapper(*args, **kwargs):
+                    started_at = time.monotonic()
+                    try:
+                        return await function(*args, **kwargs)
+                    finally:
+                        self.record_stage(stage, started_at, time.monotonic())
+
+                return async_wrapper
+
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                started_at = time.monotonic()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record_stage(stage, started_at, time.monotonic())
+
+            return wrapper
+
+        return decorator
+
+    def record_request(self, host: str, status: int | str, seconds: float):
+        """
+        Record a request sent to a host.
+
+        Args:
+            host: The host the request was sent to.
+            status: The status code of the response, or the name of the error if there was no response.
+            seconds: The time it took to get the response.
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            stats = self.hosts.setdefault(
+                host, {"requests": 0, "statuses": {}, "seconds": 0.0, "buckets": [0] * (len(self.latency_buckets) + 1)}
+            )
+            stats["requests"] += 1
+            stats["statuses"][str(status)] = stats["statuses"].get(str(status), 0) + 1
+            stats["seconds"] += seconds
+            stats["buckets"][bisect_left(self.latency_buckets, seconds)] += 1
+
+    def record_tokens(self, model: str, input_tokens: int, output_tokens: int):
+        """
+        Record the tokens used by a call to an LLM.
+
+        Args:
+            model: The name of the model.
+            input_tokens: The number of tokens in the prompt.
+            output_tokens: The number of tokens in the completion.
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            stats = self.tokens.setdefault(model, {"calls": 0, "input_tokens": 0, "output_tokens": 0})
+            stats["calls"] += 1
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+
+    def count(self, event: str, amount: int = 1):
+        """
+        Count an event.
+
+        Args:
+            event: The name of the event.
+            amount: The number of times the event happened.
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self.counters[event] = self.counters.get(event, 0) + amount
+
+    def get_report(self, companies: int, caches: dict[str, Any] = None) -> dict[str, Any]:
+        """
+        Build the report of the measurements recorded so far.
+
+        Args:
+            companies: The number of companies written by the run.
+            caches: The caches used by the run, by name, to report the hit rates of. Each needs hits and misses
+                attributes.
+
+        Returns:
+            The report, made of JSON serializable values only.
+        """
+        elapsed = time.monotonic() - self.started_at
+
+        with self._lock:
+            stages = {
+                stage: {
+                    "calls": stats["calls"],
+                    # The time from the first call starting to the last call ending, with calls running concurrently
+                    "wall_seconds": round(stats["last_ended_at"] - stats["first_started_at"], 3),
+                    # The total time spent in calls, which is larger than the wall time when calls run concurrently
+                    "busy_seconds": round(stats["busy_seconds"], 3),
+                    "mean_seconds": round(stats["busy_seconds"] / stats["calls"], 3),
+                }
+                for stage, stats in self.stages.items()
+            }
+            hosts = {
+                host: {
+                    "requests": stats["requests"],
+                    "statuses": dict(stats["statuses"]),
+                    "mean_seconds": round(stats["seconds"] / stats["requests"], 3),
+                    "total_seconds": round(stats["seconds"], 3),
+                    "latency_histogram": {
+                        str(bound): count
+                        for bound, count in zip([*self.latency_buckets, "+Inf"], stats["buckets"], strict=True)
+                    },
+                }
+                for host, stats in self.hosts.items()
+            }
+            tokens = {model: dict(stats) for model, stats in self.tokens.items()}
+            counters = dict(self.counters)
+
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "companies": companies,
+            "companies_per_second": round(companies / elapsed, 3) if elapsed > 0 else 0.0,
+            "stages": stages,
+            "hosts": hosts,
+            "llm_tokens": tokens,
+            "caches": {
+                name: {
+                    "hits": cache.hits,
+                    "misses": cache.misses,
+                    "hit_rate": (
+                        round(cache.hits / (cache.hits + cache.misses), 3) if cache.hits + cache.misses else None
+                    ),
+                }
+                for name, cache in (caches or {}).items()
+            },
+            "counters": counters,
+        }
+
+
+def write_json_report(report: dict[str, Any], path: str | Path):
+    """
+    Write a run report to a JSON file.
+
+    Args:
+        report: The report, as built by Metrics.get_report.
+        path: The path of the JSON file.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2) + "\n")
+
+
+def format_prometheus_labels(**labels: Any) -> str:
+    """
+    Format labels of a Prometheus sample.
+
+    Args:
+        **labels: The values of the labels, by name.
+
+    Returns:
+        The labels between braces, escaped as the Prometheus text format requires.
+    """
+    escaped = {
+        name: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for name, value in labels.items()
+    }
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped.items()) + "}"
+
+
+def write_prometheus_report(report: dict[str, Any], path: str | Path, prefix: str = "company_scraper"):
+    """
+    Write a run report to a file in the Prometheus text format, for the node exporter textfile collector.
+
+    The file is written next to its final path and then moved there, so the collector never reads a partial file.
+
+    Args:
+        report: The report, as built by Metrics.get_report.
+        path: The path of the file, which should end in ".prom" to be picked up by the collector.
+        prefix: The prefix of the names of the metrics.
+    """
+    lines = []
+
+    def add(name: str, kind: str, help_text: str, samples: list[tuple[dict[str, Any], float]]):
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{prefix}_{name}{format_prometheus_labels(**labels) if labels else ''} {value}")
+
+    add("run_duration_seconds", "gauge", "Duration of the run.", [({}, report["elapsed_seconds"])])
+    add("companies_total", "counter", "Companies written by the run.", [({}, report["companies"])])
+    add("companies_per_second", "gauge", "Companies written per second.", [({}, report["companies_per_second"])])
+
+    stages = report["stages"].items()
+    add("stage_calls_total", "counter", "Calls of each stage.", [({"stage": s}, v["calls"]) for s, v in stages])
+    add(
+        "stage_wall_seconds",
+        "gauge",
+        "Time from the first call of each stage starting to the last one ending.",
+        [({"stage": s}, v["wall_seconds"]) for s, v in stages],
+    )
+    add(
+        "stage_busy_seconds",
+        "counter",
+        "Total time spent in calls of each stage.",
+        [({"stage": s}, v["busy_seconds"]) for s, v in stages],
+    )
+
+    hosts = report["hosts"].items()
+    add(
+        "http_responses_total",
+        "counter",
+        "Requests sent to each host, by response status or error.",
+        [({"host": h, "status": status}, count) for h, v in hosts for status, count in v["statuses"].items()],
+    )
+    lines.append(f"# HELP {prefix}_http_request_duration_seconds Latency of the requests sent to each host.")
+    lines.append(f"# TYPE {prefix}_http_request_duration_seconds histogram")
+    for host, stats in hosts:
+        cumulative = 0
+        for bound, count in stats["latency_histogram"].items():
+            cumulative += count
+            labels = format_prometheus_labels(host=host, le=bound)
+            lines.append(f"{prefix}_http_request_duration_seconds_bucket{labels} {cumulative}")
+        labels = format_prometheus_labels(host=host)
+        lines.append(f"{prefix}_http_request_duration_seconds_sum{labels} {stats['total_seconds']}")
+        lines.append(f"{prefix}_http_request_duration_seconds_count{labels} {stats['requests']}")
+
+    add(
+        "llm_tokens_total",
+        "counter",
+        "Tokens used by each LLM, by type.",
+        [
+            ({"model": model, "type": kind}, v[f"{kind}_tokens"])
+            for model, v in report["llm_tokens"].items()
+            for kind in ("input", "output")
+        ],
+    )
+
+    caches = report["caches"].items()
+    add("cache_hits_total", "counter", "Hits of each cache.", [({"cache": c}, v["hits"]) for c, v in caches])
+    add("cache_misses_total", "counter", "Misses of each cache.", [({"cache": c}, v["misses"]) for c, v in caches])
+    add(
+        "events_total",
+        "counter",
+        "Other events counted during the run.",
+        [({"event": event}, count) for event, count in report["counters"].items()],
+    )
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_name(f".{path.name}.{os.getpid()}")
+    temporary_path.write_text("\n".join(lines) + "\n")
+    temporary_path.replace(path)
+
+
+metrics = Metrics()
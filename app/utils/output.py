@@ -0,0 +1,297 @@
+import csv
+from csv import DictReader
+from pathlib import Path
+from typing import Iterator, TextIO
+
+from app.schemas.company import CompanyRecord, CompanyWithJobCounts, company_fields
+
+
+class OutputWriter:
+    """
+    Write enriched companies to a file one row at a time, without keeping the rows written in memory.
+
+    The file is only created when the first company is written.
+    """
+
+    fieldnames = company_fields
+
+    # Whether rows can be added to a file written by an earlier run
+    appendable = False
+
+    def __init__(self, filename: str | Path, append: bool = False):
+        """
+        Args:
+            filename: The path of the file to write.
+            append: Whether to add rows to the file if it already exists, instead of overwriting it. Only supported
+                by appendable writers.
+        """
+        if append and not self.appendable:
+            raise ValueError(f"{type(self).__name__} can't append to an existing file")
+
+        self.filename = Path(filename)
+        self.append = append
+        self.rows = 0
+
+        self._opened = False
+
+    def write(self, company: CompanyRecord):
+        """
+        Write a company to the file.
+
+        Args:
+            company: The enriched company to write.
+        """
+        if not self._opened:
+            self.filename.parent.mkdir(parents=True, exist_ok=True)
+            self._open()
+            self._opened = True
+
+        self._write(company)
+        self.rows += 1
+
+    def close(self):
+        """
+        Close the file, if it was created.
+        """
+        if self._opened:
+            self._close()
+            self._opened = False
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _write(self, company: CompanyRecord):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+    def __enter__(self) -> "OutputWriter":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class CsvWriter(OutputWriter):
+    """
+    Write enriched companies to a CSV file one row at a time.
+
+    Every row is flushed as soon as it is written, so the file can be appended to when an interrupted run is resumed.
+    """
+
+    appendable = True
+
+    _file: TextIO
+
+    def _open(self):
+        if self.append and self.filename.exists():
+            # Drop the last row if the previous run was interrupted while writing it
+            content = self.filename.read_bytes()
+            if content and not content.endswith(b"\n"):
+                with open(self.filename, "r+b") as file:
+                    file.truncate(content.rfind(b"\n") + 1)
+
+            self._file = open(self.filename, "a", newline="")
+            self._writer = csv.writer(self._file)
+            if self._file.tell() == 0:
+                self._writer.writerow(self.fieldnames)
+        else:
+            self._file = open(self.filename, "w", newline="")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.fieldnames)
+
+    def _write(self, company: CompanyRecord):
+        self._writer.writerow(company.to_row())
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class XlsxWriter(OutputWriter):
+    """
+    Write enriched companies to an Excel XLSX file one row at a time.
+
+    The workbook is written in constant memory mode, where each row is flushed to a temporary file as soon as the next
+    one is written. The file is only complete once it is closed.
+    """
+
+    def _open(self):
+        import xlsxwriter
+
+        self._workbook = xlsxwriter.Workbook(self.filename, {"constant_memory": True})
+        self._worksheet = self._workbook.add_worksheet("Companies")
+
+        self._worksheet.write_row(0, 0, self.fieldnames, self._workbook.add_format({"bold": True}))
+        self._worksheet.freeze_panes(1, 0)
+        self._worksheet.set_column(0, len(self.fieldnames) - 1, 20)
+
+    def _write(self, company: CompanyRecord):
+        self._worksheet.write_row(self.rows + 1, 0, company.to_row())
+
+    def _close(self):
+        self._worksheet.autofilter(0, 0, self.rows, len(self.fieldnames) - 1)
+        self._workbook.close()
+
+
+class ParquetWriter(OutputWriter):
+    """
+    Write enriched companies to a Parquet file, in row groups of batch_size rows.
+
+    Job counts are stored as integer columns and every other field as a string column. Only the rows of the row group
+    being filled are kept in memory, as tuples turned into columns when the row group is written, and the file is only
+    complete once it is closed.
+    """
+
+    # Number of rows in each row group of the file
+    batch_size = 10000
+
+    def _open(self):
+        # pyarrow takes a while to import, so it is only loaded when a Parquet file is written
+        import pyarrow
+        from pyarrow import parquet
+
+        self._schema = pyarrow.schema(
+            [
+                (name, pyarrow.int64() if field.annotation is int else pyarrow.string())
+                for name, field in CompanyWithJobCounts.model_fields.items()
+            ]
+        )
+        self._pyarrow = pyarrow
+        self._writer = parquet.ParquetWriter(self.filename, self._schema)
+        self._batch: list[tuple] = []
+
+    def _write(self, company: CompanyRecord):
+        self._batch.append(company.to_row())
+        if len(self._batch) >= self.batch_size:
+            self._write_batch()
+
+    def _write_batch(self):
+        if self._batch:
+            columns = [
+                self._pyarrow.array(column, type=field.type) for column, field in zip(zip(*self._batch), self._schema)
+            ]
+            self._writer.write_batch(self._pyarrow.RecordBatch.from_arrays(columns, schema=self._schema))
+            self._batch = []
+
+    def _close(self):
+        self._write_batch()
+        self._writer.close()
+
+
+# The writer of each output format, by name
+output_writers: dict[str, type[OutputWriter]] = {"csv": CsvWriter, "xlsx": XlsxWriter, "parquet": ParquetWriter}
+
+
+class MultiWriter(OutputWriter):
+    """
+    Write enriched companies to a CSV file and to files in other formats at the same time.
+
+    The CSV file is the record of the companies written, used to resume an interrupted run. Files in formats that can't
+    be appended to are written again on resume, starting with the rows of the CSV file, copied one at a time.
+    """
+
+    appendable = True
+
+    def __init__(self, filename: str | Path, formats: list[str] = None, append: bool = False):
+        """
+        Args:
+            filename: The path of the CSV file to write. The files in the other formats are written next to it, with
+                the extension of their format.
+            formats: The formats to write besides CSV, from output_writers.
+            append: Whether to add rows to the files if the CSV file already exists, instead of overwriting them.
+        """
+        super().__init__(filename, append)
+
+        self.writers: list[OutputWriter] = [CsvWriter(self.filename, append)]
+        for output_format in dict.fromkeys(formats or []):
+            if output_format != "csv":
+                self.writers.append(output_writers[output_format](self.filename.with_suffix(f".{output_format}")))
+
+    @property
+    def filenames(self) -> list[Path]:
+        """
+        The paths of the files written.
+        """
+        return [writer.filename for writer in self.writers]
+
+    def _open(self):
+        if self.append:
+            # Start the files that can't be appended to with the companies written before the run was interrupted
+            for company in iter_written_companies(self.filename):
+                for writer in self.writers[1:]:
+                    writer.write(company)
+
+    def _write(self, company: CompanyRecord):
+        for writer in self.writers:
+            writer.write(company)
+
+    def _close(self):
+        for writer in self.writers:
+            writer.close()
+
+    def close(self):
+        # On resume, write the other files again even if no company was added, since they were left incomplete
+        if self.append and not self._opened:
+            self._open()
+            self._opened = True
+
+        super().close()
+
+
+def iter_written_rows(filename: str | Path) -> Iterator[dict[str, str]]:
+    """
+    Read the rows already written to a CSV file by an earlier run, one at a time.
+
+    A last row that was only partially written is ignored.
+
+    Args:
+        filename: The path of the CSV file.
+
+    Yields:
+        Each row of the file, by field name.
+    """
+    if not Path(filename).exists():
+        return
+
+    with open(filename, newline="") as file:
+        # Ignore the last row if it was not completely written
+        lines = (line for line in file if line.endswith("\n"))
+        yield from DictReader(lines)
+
+
+def iter_written_companies(filename: str | Path) -> Iterator[CompanyRecord]:
+    """
+    Read the companies already written to a CSV file by an earlier run, one at a time.
+
+    Args:
+        filename: The path of the CSV file.
+
+    Yields:
+        Each company in the file.
+    """
+    for row in iter_written_rows(filename):
+        yield CompanyRecord.from_row(row)
+
+
+def read_written_companies(filename: str | Path) -> tuple[set[str], set[str]]:
+    """
+    Read the companies already written to a CSV file by an earlier run.
+
+    A last row that was only partially written is ignored.
+
+    Args:
+        filename: The path of the CSV file.
+
+    Returns:
+        The URLs to the cience details pages of the companies in the file, and their LinkedIn slugs.
+    """
+    details_pages, slugs = set(), set()
+    for row in iter_written_rows(filename):
+        if row.get("cience_details_page"):
+            details_pages.add(row["cience_details_page"])
+        if row.get("linkedin_slug"):
+            slugs.add(row["linkedin_slug"])
+
+    return details_pages, slugs
@@ -0,0 +1,174 @@
+import re
+from dataclasses import dataclass
+
+from app.utils.listing_parser import details_link_pattern, get_company_spans
+
+# The version of the pruning and chunking of pages, part of the LLM cache key. Bump it whenever prune_page_content or
+# split_page_content changes the content sent to the LLM, so extractions of pages pruned the old way are not reused
+pruning_version = 2
+
+# Markdown image, dropped from the content sent to the LLM
+image_pattern = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+
+# Markdown link, capturing its text and its URL
+link_pattern = re.compile(r"(?<!!)\[([^\]]*)\]\(([^)\s]*)(?:\s+\"[^\"]*\")?\)")
+
+
+@dataclass(slots=True)
+class PruningStats:
+    """
+    The estimated tokens of the pages sent to the LLM, before and after pruning, over a run.
+    """
+
+    pages: int = 0
+    chunks: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    @property
+    def reduction(self) -> float:
+        """
+        The share of the tokens of the pages removed by pruning, from 0 to 1.
+        """
+        return 1 - self.tokens_after / self.tokens_before if self.tokens_before else 0.0
+
+    def describe(self) -> str:
+        """
+        Describe the token reduction, to print it at the end of a run.
+
+        Returns:
+            The tokens before and after pruning, and the share removed.
+        """
+        return (
+            f"LLM input pruned from {self.tokens_before} to {self.tokens_after} estimated tokens "
+            f"({self.reduction:.0%} less) over {self.pages} pages in {self.chunks} chunks"
+        )
+
+
+pruning_stats = PruningStats()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens of a text, at about 4 characters per token for English text and markdown.
+
+    Args:
+        text: The text.
+
+    Returns:
+        The estimated number of tokens.
+    """
+    return -(-len(text) // 4)
+
+
+def compact_links(line: str) -> str:
+    """
+    Drop the images of a line of markdown, and replace the links not going to a company details page by their text.
+
+    Args:
+        line: The line of markdown.
+
+    Returns:
+        The compacted line.
+    """
+    line = image_pattern.sub("", line)
+
+    return link_pattern.sub(
+        lambda link: link.group(0) if details_link_pattern.match(link.group(0)) else link.group(1), line
+    )
+
+
+def prune_page_content(page_content: str) -> str:
+    """
+    Keep only the company listing block of the markdown content of a results page, with compacted links.
+
+    The block starts where the first company starts, at the header of the table holding it or at the heading of its
+    card, and ends where the last company ends, see get_company_spans. Navigation, footers and marketing copy around
+    it are dropped. Pages without any company link are only compacted, since there is no block to find.
+
+    Args:
+        page_content: The markdown content of the page as a string.
+
+    Returns:
+        The pruned markdown content.
+    """
+    lines = [" ".join(compact_links(line).split()) for line in page_content.splitlines()]
+    lines = [line for line in lines if line]
+
+    spans = get_company_spans(lines)
+    if not spans:
+        return "\n".join(lines)
+
+    # Keep the header of the table the first company is listed in
+    start = spans[0][0]
+    while start > 0 and lines[start - 1].startswith("|"):
+        start -= 1
+
+    return "\n".join(lines[start : spans[-1][1]])
+
+
+def split_page_content(page_content: str, max_tokens: int) -> list[str]:
+    """
+    Split the pruned content of a page into chunks of at most about max_tokens tokens, between companies, each company
+    starting at its table row or card heading, see get_company_spans.
+
+    Each chunk starts with the lines before the first company, such as the header of the table listing the companies,
+    so every chunk can be read on its own. A company larger than max_tokens gets a chunk of its own.
+
+    Args:
+        page_content: The pruned markdown content of the page.
+        max_tokens: The maximum estimated number of tokens of a chunk.
+
+    Returns:
+        The chunks, in page order.
+    """
+    if estimate_tokens(page_content) <= max_tokens:
+        return [page_content]
+
+    lines = page_content.splitlines()
+    spans = get_company_spans(lines)
+    if not spans:
+        return [page_content]
+
+    header = lines[: spans[0][0]]
+    header_tokens = estimate_tokens("\n".join(header))
+    # The lines after the last company stay with it, so nothing is left out of the chunks
+    spans[-1] = (spans[-1][0], len(lines))
+    companies = ["\n".join(lines[a:b]) for a, b in spans]
+
+    chunks = []
+    chunk: list[str] = []
+    chunk_tokens = header_tokens
+    for company in companies:
+        company_tokens = estimate_tokens(company) + 1
+        if chunk and chunk_tokens + company_tokens > max_tokens:
+            chunks.append("\n".join([*header, *chunk]))
+            chunk, chunk_tokens = [], header_tokens
+
+        chunk.append(company)
+        chunk_tokens += company_tokens
+
+    chunks.append("\n".join([*header, *chunk]))
+
+    return chunks
+
+
+def merge_chunk_companies(chunk_companies: list[list[dict]]) -> list[dict]:
+    """
+    Merge the companies extracted from the chunks of a page, in page order, keeping each company once.
+
+    Companies are matched by their details page, or by their name when the LLM gave no details page.
+
+    Args:
+        chunk_companies: The details of the companies extracted from each chunk.
+
+    Returns:
+        The details of each company of the page.
+    """
+    merged = {}
+    for companies in chunk_companies:
+        for company in companies:
+            key = company.get("cience_details_page") or company.get("company_name")
+            merged.setdefault(key, company)
+
+    return list(merged.values())
@@ -0,0 +1,335 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Iterable
+
+import requests
+
+from app.core.config import settings
+from app.schemas.company import CompanyRecord, job_count_keywords
+from app.utils.cience import (
+    CienceFetcher,
+    extract_companies_from_page_content,
+    get_cience_page_content,
+    get_cience_page_url,
+    get_cience_pages,
+    get_linkedin_slug,
+    get_linkedin_slug_from_page_content,
+)
+from app.utils.coresignal import (
+    enrich_company_batch_with_coresignal_job_counts,
+    enrich_company_with_coresignal_job_counts,
+)
+from app.utils.job_cache import get_job_cache, get_new_job_counts
+from app.utils.journal import RunJournal
+from app.utils.metrics import metrics
+from app.utils.output import OutputWriter, read_written_companies
+
+# Put on a queue once the stage feeding it has finished
+DONE = object()
+
+
+async def run_workers(
+    inbox: asyncio.Queue,
+    outbox: asyncio.Queue | None,
+    workers: int,
+    handle: Callable[[Any], Awaitable[Iterable]],
+    batch_size: int = None,
+):
+    """
+    Run a pipeline stage, with a number of workers taking items from one queue and putting their results on the next.
+
+    Once every worker has finished, DONE is put on the next queue.
+
+    Args:
+        inbox: The queue the stage takes items from.
+        outbox: The queue the stage puts results on, or None if it is the last stage.
+        workers: The number of workers handling items at the same time.
+        handle: An async function handling an item and returning the results to pass on.
+        batch_size: If given, handle is passed a list of up to batch_size items instead of a single item, made of the
+            items waiting on the queue at the time.
+    """
+
+    async def worker():
+        while True:
+            item = await inbox.get()
+            if item is DONE:
+                # Put it back, so the other workers of the stage see it too
+                await inbox.put(DONE)
+                return
+
+            if batch_size is None:
+                results = await handle(item)
+            else:
+                # Take every item already waiting, up to the batch size
+                batch = [item]
+                while len(batch) < batch_size and not inbox.empty():
+                    item = inbox.get_nowait()
+                    if item is DONE:
+                        await inbox.put(DONE)
+                        break
+                    batch.append(item)
+
+                results = await handle(batch)
+
+            for result in results:
+                await outbox.put(result)
+
+    async with asyncio.TaskGroup() as group:
+        for _ in range(workers):
+            group.create_task(worker())
+
+    if outbox is not None:
+        await outbox.put(DONE)
+
+
+async def run_pipeline(
+    journal: RunJournal,
+    writer: OutputWriter,
+    enrich: Callable[[CompanyRecord, dict[str, int] | None], CompanyRecord] = enrich_company_with_coresignal_job_counts,
+    source: str = "coresignal",
+    enrich_batch: Callable[
+        [list[CompanyRecord], list[dict[str, int] | None]], list[CompanyRecord]
+    ] = enrich_company_batch_with_coresignal_job_counts,
+    fetch_engine: str = None,
+) -> int:
+    """
+    Fetch the companies for every industry group and revenue searched by a run from cience, enrich them with job
+    counts and write them to a file, streaming each company through all stages as soon as it is available.
+
+    The stages (fetching pages, extracting companies, resolving LinkedIn slugs, enriching and writing) run at the same
+    time, connected by bounded queues. The first companies are written while later pages are still being fetched, and
+    memory use does not grow with the number of pages. Every search of the run shares the same page fetcher, HTTP
+    connections and output file.
+
+    A company found by more than one search, by its cience details page or its LinkedIn slug, is only enriched and
+    written once.
+
+    Progress is recorded in the run journal. When a run is resumed, pages whose companies were all written are not
+    fetched again, companies already in the output file are not enriched again, and resolved slugs are reused.
+
+    A company whose slug or job counts can't be fetched is left out of the file, and the other companies are still
+    written. Its page is not recorded as done, so the company is tried again when the run is resumed.
+
+    Fresh job counts are looked up in the job count cache in batches before companies are enriched, and the fetched
+    counts are written back to it in batches as companies are written.
+
+    Args:
+        journal: The journal of the run, holding the searches and max_pages to fetch companies for.
+        writer: The writer to write the enriched companies to, writing to the CSV file of the run.
+        enrich: The blocking function enriching a company with job counts, given the counts already known for it,
+            defaults to using Coresignal.
+        source: The name of the source enrich fetches job counts from, used as the job count cache namespace.
+        enrich_batch: The blocking function enriching a batch of companies with job counts from the same source, given
+            the counts already known for each of them, used instead of enrich when the CORESIGNAL_BATCH_SIZE setting
+            is set. None to always enrich one company at a time.
+        fetch_engine: The engine to fetch results pages with, "browser" or "http", defaults to the CIENCE_FETCH_ENGINE
+            setting.
+
+    Returns:
+        The number of enriched companies written.
+    """
+    searches = journal.params["searches"]
+    max_pages = journal.params["max_pages"]
+
+    # Companies written before the run was interrupted, or found by an earlier page of the run
+    seen_companies, seen_slugs = read_written_companies(writer.filename)
+
+    # The number of companies from each page, by search and page index, that are not written yet
+    remaining_companies: dict[tuple[int, int], int] = {}
+
+    # Fetched job counts waiting to be written back to the job count cache
+    new_counts: dict[str, dict[str, int]] = {}
+
+    # The number of companies left out of the file because a request for them failed
+    failed_companies = 0
+
+    # Run blocking calls in a thread pool large enough for every page fetching, slug and enrichment worker
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=2 * settings.CIENCE_CONCURRENCY + settings.CORESIGNAL_CONCURRENCY + 1)
+    )
+
+    pages_queue = asyncio.Queue(maxsize=settings.PIPELINE_QUEUE_SIZE)
+    contents_queue = asyncio.Queue(maxsize=settings.PIPELINE_QUEUE_SIZE)
+    slugs_queue = asyncio.Queue(maxsize=settings.PIPELINE_QUEUE_SIZE)
+    lookup_queue = asyncio.Queue(maxsize=settings.PIPELINE_QUEUE_SIZE)
+    enrich_queue = asyncio.Queue(maxsize=settings.PIPELINE_QUEUE_SIZE)
+    output_queue = asyncio.Queue(maxsize=settings.PIPELINE_QUEUE_SIZE)
+
+    def company_done(page_key: tuple[int, int]):
+        # Once every company from the page is written, the page doesn't have to be fetched again on resume
+        remaining_companies[page_key] -= 1
+        if remaining_companies[page_key] == 0:
+            del remaining_companies[page_key]
+            journal.record_completed_page(*page_key)
+
+    def companies_failed(companies: list[CompanyRecord], error: requests.RequestException):
+        # The page of the companies is not recorded as done, so they are tried again when the run is resumed
+        nonlocal failed_companies
+        failed_companies += len(companies)
+        metrics.count("companies_failed", len(companies))
+        for company in companies:
+            print("Failed", company.company_name, "with", repr(error))
+
+    async def produce_pages():
+        for search, (industry_group, revenue) in enumerate(searches):
+            prefetched = {}
+            if search not in journal.page_counts:
+                pages, prefetched = await asyncio.to_thread(get_cience_pages, industry_group, revenue, max_pages)
+                journal.record_page_count(search, len(pages))
+                print("Found", len(pages), "pages for", industry_group, "with revenue", revenue)
+
+            for i in range(journal.page_counts[search]):
+                if (search, i) in journal.completed_pages:
+                    continue
+
+                page = get_cience_page_url(industry_group, revenue, i + 1)
+                await pages_queue.put(((search, i), page, prefetched.pop(page, None)))
+
+        await pages_queue.put(DONE)
+
+    async def fetch_content(item: tuple[tuple[int, int], str, str | None]) -> list[tuple[tuple[int, int], str]]:
+        page_key, page, prefetched = item
+        return [(page_key, await get_cience_page_content(fetcher, page, prefetched))]
+
+    async def extract_companies(item: tuple[tuple[int, int], str]) -> list[tuple[tuple[int, int], CompanyRecord]]:
+        page_key, page_content = item
+        search, i = page_key
+        companies, method = await extract_companies_from_page_content(page_content)
+        industry_group, revenue = searches[search]
+        print("Extracted", len(companies), "companies from page", i + 1, "of", industry_group, revenue, "with", method)
+
+        # Skip the companies already written, or found by another page of the run
+        companies = [
+            CompanyRecord(**company) for company in companies if company["cience_details_page"] not in seen_companies
+        ]
+        if not companies:
+            journal.record_completed_page(search, i)
+            return []
+
+        seen_companies.update(company.cience_details_page for company in companies)
+        remaining_companies[page_key] = len(companies)
+
+        # Take the slugs from the page where it links to them, so they don't have to be looked up
+        for company in companies:
+            company.linkedin_slug = get_linkedin_slug_from_page_content(page_content, company.cience_details_page)
+
+        return [(page_key, company) for company in companies]
+
+    async def resolve_slug(item: tuple[tuple[int, int], CompanyRecord]) -> list[tuple[tuple[int, int], CompanyRecord]]:
+        page_key, company = item
+        url = company.cience_details_page
+
+        if not company.linkedin_slug:
+            if url in journal.slugs:
+                company.linkedin_slug = journal.slugs[url]
+            else:
+                try:
+                    company.linkedin_slug = await asyncio.to_thread(get_linkedin_slug, url)
+                except requests.RequestException as e:
+                    companies_failed([company], e)
+                    return []
+
+                journal.record_slug(url, company.linkedin_slug)
+
+        # Skip the companies listed under another details page by another search of the run
+        slug = company.linkedin_slug
+        if slug:
+            if slug in seen_slugs:
+                print("Skipping", company.company_name, "because it was already found by another search")
+                metrics.count("duplicate_companies_skipped")
+                company_done(page_key)
+                return []
+
+            seen_slugs.add(slug)
+
+        return [(page_key, company)]
+
+    @metrics.timed("job_cache")
+    async def look_up_counts(
+        batch: list[tuple[tuple[int, int], CompanyRecord]]
+    ) -> list[tuple[tuple[int, int], CompanyRecord, dict[str, int] | None]]:
+        slugs = [company.linkedin_slug for _, company in batch if company.linkedin_slug]
+        cached_counts = await asyncio.to_thread(get_job_cache().get_many, source, slugs, list(job_count_keywords))
+
+        return [(page_key, company, cached_counts.get(company.linkedin_slug)) for page_key, company in batch]
+
+    async def enrich_company(
+        item: tuple[tuple[int, int], CompanyRecord, dict[str, int] | None]
+    ) -> list[tuple[tuple[int, int], CompanyRecord]]:
+        page_key, company, cached_counts = item
+        try:
+            enriched_company = await asyncio.to_thread(enrich, company, cached_counts)
+        except requests.RequestException as e:
+            companies_failed([company], e)
+            return []
+
+        if enriched_company.linkedin_slug:
+            new_counts[enriched_company.linkedin_slug] = get_new_job_counts(enriched_company, cached_counts)
+
+        return [(page_key, enriched_company)]
+
+    async def enrich_companies(
+        batch: list[tuple[tuple[int, int], CompanyRecord, dict[str, int] | None]]
+    ) -> list[tuple[tuple[int, int], CompanyRecord]]:
+        companies = [company for _, company, _ in batch]
+        try:
+            enriched_companies = await asyncio.to_thread(enrich_batch, companies, [counts for _, _, counts in batch])
+        except requests.RequestException as e:
+            companies_failed(companies, e)
+            return []
+
+        for enriched_company, (_, _, cached_counts) in zip(enriched_companies, batch):
+            if enriched_company.linkedin_slug:
+                new_counts[enriched_company.linkedin_slug] = get_new_job_counts(enriched_company, cached_counts)
+
+        return [(page_key, company) for (page_key, _, _), company in zip(batch, enriched_companies)]
+
+    def write_back_counts():
+        get_job_cache().set_many(source, new_counts)
+        new_counts.clear()
+
+    @metrics.timed("write")
+    async def write_output(item: tuple[tuple[int, int], CompanyRecord]) -> list:
+        page_key, company = item
+        writer.write(company)
+        print("Fetched job counts for", company.company_name, "(", writer.rows, "written )")
+
+        if len(new_counts) >= settings.PIPELINE_QUEUE_SIZE:
+            write_back_counts()
+
+        company_done(page_key)
+
+        return []
+
+    try:
+        async with CienceFetcher(fetch_engine) as fetcher, asyncio.TaskGroup() as group:
+            group.create_task(produce_pages())
+            group.create_task(run_workers(pages_queue, contents_queue, settings.CIENCE_CONCURRENCY, fetch_content))
+            group.create_task(run_workers(contents_queue, slugs_queue, settings.LLM_CONCURRENCY, extract_companies))
+            group.create_task(run_workers(slugs_queue, lookup_queue, settings.CIENCE_CONCURRENCY, resolve_slug))
+            group.create_task(
+                run_workers(lookup_queue, enrich_queue, 1, look_up_counts, batch_size=settings.PIPELINE_QUEUE_SIZE)
+            )
+            if enrich_batch is not None and settings.CORESIGNAL_BATCH_SIZE:
+                group.create_task(
+                    run_workers(
+                        enrich_queue,
+                        output_queue,
+                        settings.CORESIGNAL_CONCURRENCY,
+                        enrich_companies,
+                        batch_size=settings.CORESIGNAL_BATCH_SIZE,
+                    )
+                )
+            else:
+                group.create_task(
+                    run_workers(enrich_queue, output_queue, settings.CORESIGNAL_CONCURRENCY, enrich_company)
+                )
+            group.create_task(run_workers(output_queue, None, 1, write_output))
+    finally:
+        # Keep the counts fetched so far, even if the run was interrupted
+        write_back_counts()
+
+    if failed_companies:
+        print("\nFailed to fetch", failed_companies, "companies, try them again with: --resume", writer.filename)
+
+    return writer.rows
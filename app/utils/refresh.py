@@ -0,0 +1,133 @@
+import re
+from csv import DictWriter
+from datetime import datetime
+from pathlib import Path
+
+from app.schemas.company import company_fields, job_count_keywords
+from app.utils.job_cache import get_job_cache
+from app.utils.output import iter_written_rows
+
+# The suffix added to the name of a refreshed file, with the time it was refreshed at
+refresh_suffix_pattern = re.compile(r"\.\d{8}-\d{6}$")
+
+
+def get_refresh_filename(baseline: str | Path) -> str:
+    """
+    Get the path of the CSV file a refresh of an earlier run writes the updated list to.
+
+    The file is written next to the baseline, with the time of the refresh in its name instead of the time of the
+    refresh the baseline came from, if any.
+
+    Args:
+        baseline: The path of the CSV file of the earlier run.
+
+    Returns:
+        The path of the CSV file of the refresh.
+    """
+    baseline = Path(baseline)
+    stem = refresh_suffix_pattern.sub("", baseline.stem)
+
+    return str(baseline.with_name(f"{stem}.{datetime.now():%Y%m%d-%H%M%S}.csv"))
+
+
+def get_delta_filename(filename: str | Path) -> str:
+    """
+    Get the path of the delta file of a refresh.
+
+    Args:
+        filename: The path of the CSV file of the refresh.
+
+    Returns:
+        The path of the delta file, next to the CSV file.
+    """
+    return str(Path(filename).with_suffix(".delta.csv"))
+
+
+def read_baseline_slugs(baseline: str | Path) -> dict[str, str]:
+    """
+    Read the LinkedIn slugs of the companies of an earlier run, so they don't have to be looked up again.
+
+    Args:
+        baseline: The path of the CSV file of the earlier run.
+
+    Returns:
+        The LinkedIn slugs, by the URL of the cience details page of their company.
+    """
+    return {
+        row["cience_details_page"]: row["linkedin_slug"]
+        for row in iter_written_rows(baseline)
+        if row.get("cience_details_page") and row.get("linkedin_slug")
+    }
+
+
+def seed_job_cache(baseline: str | Path, source: str = "coresignal") -> int:
+    """
+    Store the job counts of the companies of an earlier run in the job count cache, so only the counts that are older
+    than the maximum age of the refresh are fetched again.
+
+    The counts are taken to be fetched when the CSV file of the earlier run was last written to. Counts already in the
+    cache are kept, since they hold the time they were actually fetched at.
+
+    Args:
+        baseline: The path of the CSV file of the earlier run.
+        source: The source the counts were fetched from.
+
+    Returns:
+        The number of companies whose counts were read.
+    """
+    counts = {}
+    for row in iter_written_rows(baseline):
+        try:
+            counts[row["linkedin_slug"]] = {keyword: int(row[field]) for keyword, field in job_count_keywords.items()}
+        except (KeyError, TypeError, ValueError):
+            # Skip the rows without a slug or with counts that can't be read, so they are fetched again
+            continue
+    counts.pop("", None)
+
+    get_job_cache().set_many(source, counts, fetched_at=Path(baseline).stat().st_mtime)
+
+    return len(counts)
+
+
+def write_delta(baseline: str | Path, filename: str | Path, delta_filename: str | Path) -> dict[str, int]:
+    """
+    Write the companies that were added, removed or changed by a refresh to a delta file.
+
+    Companies are matched by the URL of their cience details page. Added and changed companies are written with their
+    refreshed values, in the order of the refreshed file, and removed companies with their values in the baseline, in
+    the order of the baseline. The "change" column holds "added", "removed" or "changed", and the "changed_fields"
+    column the fields that changed, separated by spaces.
+
+    Args:
+        baseline: The path of the CSV file of the earlier run.
+        filename: The path of the CSV file of the refresh.
+        delta_filename: The path of the delta file to write.
+
+    Returns:
+        The number of companies added, removed and changed.
+    """
+    baseline_rows = {row["cience_details_page"]: row for row in iter_written_rows(baseline)}
+    changes = {"added": 0, "removed": 0, "changed": 0}
+
+    with open(delta_filename, "w", newline="") as file:
+        writer = DictWriter(file, fieldnames=["change", "changed_fields", *company_fields])
+        writer.writeheader()
+
+        for row in iter_written_rows(filename):
+            before = baseline_rows.pop(row["cience_details_page"], None)
+            if before is None:
+                change, changed_fields = "added", []
+            else:
+                changed_fields = [field for field in company_fields if row.get(field) != before.get(field)]
+                if not changed_fields:
+                    continue
+                change = "changed"
+
+            writer.writerow({"change": change, "changed_fields": " ".join(changed_fields), **row})
+            changes[change] += 1
+
+        for row in baseline_rows.values():
+            writer.writerow({"change": "removed", "changed_fields": "", **row})
+            changes["removed"] += 1
+
+    return changes
@@ -0,0 +1,228 @@
+import asyncio
+import os
+import socket
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any
+
+from app.core.config import settings
+from app.schemas.company import CompanyRecord, company_fields, job_count_keywords
+from app.utils.cience import (
+    CienceFetcher,
+    extract_companies_from_page_content,
+    get_cience_page_content,
+    get_cience_pages,
+    get_linkedin_slug,
+    get_linkedin_slug_from_page_content,
+)
+from app.utils.coresignal import enrich_company_with_coresignal_job_counts
+from app.utils.http import client
+from app.utils.job_cache import get_job_cache, get_new_job_counts
+from app.utils.output import MultiWriter
+from app.utils.work_queue import Task, WorkQueue
+
+# Seconds a worker waits before checking again for tasks, when every task left is being worked on by other workers
+poll_interval = 1.0
+
+
+def get_worker_id() -> str:
+    """
+    Get an ID for the worker running in this process, unique across the machines sharing a work queue.
+
+    Returns:
+        The host name and process ID of the worker.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def handle_search(queue: WorkQueue, task: Task) -> tuple[Any, list[Task]]:
+    """
+    Find the result pages of a search of the run.
+
+    Args:
+        queue: The work queue of the run.
+        task: The search task.
+
+    Returns:
+        The number of pages found, and a task for each of them.
+    """
+    industry_group, revenue = queue.params["searches"][task.search]
+    pages, _ = await asyncio.to_thread(get_cience_pages, industry_group, revenue, queue.params["max_pages"])
+    print("Found", len(pages), "pages for", industry_group, "with revenue", revenue)
+
+    new_tasks = [Task("page", f"{task.search}:{i}", task.search, i, payload=page) for i, page in enumerate(pages)]
+
+    return len(pages), new_tasks
+
+
+async def handle_page(fetcher: CienceFetcher, task: Task) -> tuple[Any, list[Task]]:
+    """
+    Extract the companies of a result page, taking their LinkedIn slugs from the page where it links to them.
+
+    Args:
+        fetcher: The fetcher fetching the page.
+        task: The page task, holding the URL of the page.
+
+    Returns:
+        The number of companies found, and a task for each of them, keyed by its cience details page so a company
+        listed on several pages is only enriched once.
+    """
+    page_content = await get_cience_page_content(fetcher, task.payload)
+    companies, method = await extract_companies_from_page_content(page_content)
+    print("Extracted", len(companies), "companies from page", task.page + 1, "of search", task.search, "with", method)
+
+    new_tasks = []
+    for position, company in enumerate(companies):
+        url = company["cience_details_page"]
+        company["linkedin_slug"] = get_linkedin_slug_from_page_content(page_content, url)
+        new_tasks.append(Task("company", url, task.search, task.page, position, payload=company))
+
+    return len(companies), new_tasks
+
+
+async def handle_company(task: Task) -> tuple[Any, list[Task]]:
+    """
+    Resolve the LinkedIn slug of a company if its page didn't link to it, and enrich it with job counts from
+    Coresignal, reusing the fresh counts of the job count cache.
+
+    Args:
+        task: The company task, holding the company extracted from its page.
+
+    Returns:
+        The enriched company by field name, and no new tasks.
+    """
+    company = CompanyRecord(**task.payload)
+    if not company.linkedin_slug:
+        company.linkedin_slug = await asyncio.to_thread(get_linkedin_slug, company.cience_details_page)
+
+    job_cache = get_job_cache()
+    cached_counts = None
+    if company.linkedin_slug:
+        cached_counts = job_cache.get_many("coresignal", [company.linkedin_slug], list(job_count_keywords)).get(
+            company.linkedin_slug
+        )
+
+    await asyncio.to_thread(enrich_company_with_coresignal_job_counts, company, cached_counts)
+    if company.linkedin_slug:
+        job_cache.set_many("coresignal", {company.linkedin_slug: get_new_job_counts(company, cached_counts)})
+
+    print("Fetched job counts for", company.company_name)
+
+    return dict(zip(company_fields, company.to_row())), []
+
+
+async def run_worker_async(queue: WorkQueue, worker: str, concurrency: int, fetch_engine: str = None):
+    """
+    Work on the tasks of a sharded run until none is left, renewing the leases of the claimed tasks meanwhile.
+
+    Args:
+        queue: The work queue of the run.
+        worker: The ID of the worker.
+        concurrency: The number of tasks to work on at the same time.
+        fetch_engine: The engine to fetch results pages with, defaults to the CIENCE_FETCH_ENGINE setting.
+    """
+
+    async def renew_leases():
+        while True:
+            await asyncio.sleep(queue.lease_seconds / 3)
+            await asyncio.to_thread(queue.renew, worker)
+
+    async def work():
+        while True:
+            task = await asyncio.to_thread(queue.claim, worker)
+            if task is None:
+                if await asyncio.to_thread(queue.is_finished):
+                    return
+
+                # Wait for the tasks claimed by other workers to add more tasks, or for their leases to expire
+                await asyncio.sleep(poll_interval)
+                continue
+
+            try:
+                if task.kind == "search":
+                    result, new_tasks = await handle_search(queue, task)
+                elif task.kind == "page":
+                    result, new_tasks = await handle_page(fetcher, task)
+                else:
+                    result, new_tasks = await handle_company(task)
+            except Exception as e:
+                print("Failed", task.kind, task.key, "with", repr(e))
+                await asyncio.to_thread(queue.release, task, worker, repr(e))
+                continue
+
+            await asyncio.to_thread(queue.complete, task, result, new_tasks)
+
+    async with CienceFetcher(fetch_engine) as fetcher:
+        renewer = asyncio.create_task(renew_leases())
+        try:
+            async with asyncio.TaskGroup() as group:
+                for _ in range(concurrency):
+                    group.create_task(work())
+        finally:
+            renewer.cancel()
+
+
+def run_worker(queue_path: str | Path, concurrency: int = None, fetch_engine: str = None, workers: int = 1):
+    """
+    Run a worker of a sharded run in this process, until every task of the run is done or was given up on.
+
+    Rate limits are kept by each process, so the workers started together split the per-host rate limits between them,
+    and send requests at the configured rate all together.
+
+    Args:
+        queue_path: The path of the work queue of the run.
+        concurrency: The number of tasks to work on at the same time, defaults to the SHARD_CONCURRENCY setting.
+        fetch_engine: The engine to fetch results pages with, "browser" or "http", defaults to the CIENCE_FETCH_ENGINE
+            setting.
+        workers: The number of workers started together with this one, on this machine.
+    """
+    client.rate_limit_share = 1 / workers
+
+    queue = WorkQueue(queue_path)
+    worker = get_worker_id()
+    print("Worker", worker, "joined", queue_path)
+
+    try:
+        asyncio.run(run_worker_async(queue, worker, concurrency or settings.SHARD_CONCURRENCY, fetch_engine))
+    finally:
+        queue.close()
+
+
+def merge_results(queue: WorkQueue) -> tuple[int, list[Path]]:
+    """
+    Write the companies enriched by every worker of a sharded run to the output files of the run.
+
+    Companies are written in the order of the search, page and position they were first found at, and a company found
+    under more than one details page is only written once, by its LinkedIn slug, so the output is the same whichever
+    workers did the work. The files are written next to the output files first and then moved in place, so merges
+    running at the same time on different machines don't corrupt each other.
+
+    Args:
+        queue: The finished work queue of the run.
+
+    Returns:
+        The number of companies written, and the paths of the files written.
+    """
+    params = queue.params
+    filename = Path(params["output"])
+    filename.parent.mkdir(parents=True, exist_ok=True)
+
+    seen_slugs = set()
+    filenames = []
+    with TemporaryDirectory(dir=filename.parent, prefix=".merge-") as directory:
+        with MultiWriter(Path(directory) / filename.name, params.get("formats")) as writer:
+            for result in queue.iter_results("company"):
+                company = CompanyRecord.from_row(result)
+                if company.linkedin_slug:
+                    if company.linkedin_slug in seen_slugs:
+                        continue
+                    seen_slugs.add(company.linkedin_slug)
+
+                writer.write(company)
+
+        for written in writer.filenames:
+            if written.exists():
+                os.replace(written, filename.with_name(written.name))
+                filenames.append(filename.with_name(written.name))
+
+    return writer.rows, filenames
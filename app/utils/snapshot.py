@@ -0,0 +1,234 @@
+import mmap
+import os
+import struct
+import zlib
+from hashlib import blake2b
+from pathlib import Path
+from threading import Lock
+
+# Start of the index file, followed by the number of entries sorted by key. Entries appended after them while
+# recording are not sorted until the snapshot is closed.
+index_magic = b"CSNAPIX1"
+index_header = struct.Struct("<8sQ")
+
+# An entry of the index: the key of the response, and the offset, size and HTTP status of its record in the data file
+index_entry = struct.Struct("<16sQIH2x")
+
+# The start of a record of the data file, followed by the URL and the compressed body of the response
+record_header = struct.Struct("<I")
+
+
+class SnapshotMissError(LookupError):
+    """
+    Raised when a run replaying a snapshot needs a response that was not recorded.
+    """
+
+
+def get_snapshot_key(kind: str, url: str) -> bytes:
+    """
+    Get the key of a response in the index of a snapshot.
+
+    Args:
+        kind: The kind of content, "html" for a response fetched over HTTP, or "markdown" for a page converted by the
+            browser.
+        url: The URL of the response.
+
+    Returns:
+        The 16 byte hash of the kind and URL.
+    """
+    return blake2b(f"{kind} {url}".encode(), digest_size=16).digest()
+
+
+class SnapshotStore:
+    """
+    An archive of the pages fetched by a run, to replay later runs from without fetching anything from cience.
+
+    A snapshot is a directory holding an append-only data file of zlib compressed responses, and an index of fixed
+    size entries mapping the hash of each URL to its record. When the snapshot is closed, the index is sorted so that
+    replaying runs look responses up with a binary search of the memory mapped index, without reading it. Recording to
+    an existing snapshot adds to it, and a URL recorded again replaces its earlier response.
+
+    Snapshots are recorded and replayed by a single process at a time.
+    """
+
+    def __init__(self):
+        self.path: Path | None = None
+        self.recording = False
+        self.replaying = False
+        self.recorded = 0
+        self.replayed = 0
+
+        self._lock = Lock()
+        self._data = None
+        self._index = None
+        self._data_map: mmap.mmap | None = None
+        self._index_map: mmap.mmap | None = None
+        self._sorted = 0
+        # Entries of the index that are not sorted, by key, read when the snapshot is opened for replay
+        self._unsorted: dict[bytes, tuple[int, int, int]] = {}
+
+    def open(self, path: str | Path, replay: bool = False):
+        """
+        Start recording the responses of the run to a snapshot, or replaying the run from it.
+
+        Args:
+            path: The directory of the snapshot.
+            replay: Whether to replay from the snapshot instead of recording to it.
+
+        Raises:
+            FileNotFoundError: If the snapshot to replay does not exist.
+        """
+        self.path = Path(path)
+        data_path, index_path = self.path / "pages.dat", self.path / "pages.idx"
+
+        if replay:
+            if not index_path.exists():
+                raise FileNotFoundError(f"No snapshot found in {self.path}")
+
+            self._data = open(data_path, "rb")
+            self._index = open(index_path, "rb")
+            # An empty file can't be mapped, and has no records to look up anyway
+            if data_path.stat().st_size:
+                self._data_map = mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ)
+            self._index_map = mmap.mmap(self._index.fileno(), 0, access=mmap.ACCESS_READ)
+
+            _, self._sorted = index_header.unpack_from(self._index_map)
+            entries = (len(self._index_map) - index_header.size) // index_entry.size
+            for i in range(self._sorted, entries):
+                key, offset, size, status = index_entry.unpack_from(self._index_map, self._get_entry_offset(i))
+                self._unsorted[key] = (offset, size, status)
+
+            self.replaying = True
+        else:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._data = open(data_path, "ab")
+            self._index = open(index_path, "ab")
+            if self._index.tell() == 0:
+                self._index.write(index_header.pack(index_magic, 0))
+            else:
+                # Drop the end of an entry the run recording the snapshot was interrupted while writing, so the
+                # entries added now are not shifted from their place
+                size = self._index.tell()
+                self._index.truncate(size - (size - index_header.size) % index_entry.size)
+
+            self.recording = True
+
+    def put(self, url: str, status: int, body: str, kind: str = "html"):
+        """
+        Record a response to the snapshot.
+
+        Args:
+            url: The URL of the response.
+            status: The HTTP status of the response.
+            body: The body of the response.
+            kind: The kind of content, see get_snapshot_key.
+        """
+        encoded_url = url.encode()
+        record = record_header.pack(len(encoded_url)) + encoded_url + zlib.compress(body.encode())
+
+        with self._lock:
+            offset = self._data.tell()
+            self._data.write(record)
+            self._index.write(index_entry.pack(get_snapshot_key(kind, url), offset, len(record), status))
+            self.recorded += 1
+
+    def find(self, url: str, kind: str = "html") -> tuple[int, str] | None:
+        """
+        Look up a recorded response.
+
+        Args:
+            url: The URL of the response.
+            kind: The kind of content, see get_snapshot_key.
+
+        Returns:
+            The HTTP status and body of the response, or None if it was not recorded.
+        """
+        key = get_snapshot_key(kind, url)
+        entry = self._unsorted.get(key) or self._search(key)
+        if entry is None:
+            return None
+
+        offset, size, status = entry
+        (url_size,) = record_header.unpack_from(self._data_map, offset)
+        body = zlib.decompress(self._data_map[offset + record_header.size + url_size : offset + size])
+        self.replayed += 1
+
+        return status, body.decode()
+
+    def get(self, url: str, kind: str = "html") -> tuple[int, str]:
+        """
+        Get a recorded response, for a run replaying the snapshot.
+
+        Args:
+            url: The URL of the response.
+            kind: The kind of content, see get_snapshot_key.
+
+        Returns:
+            The HTTP status and body of the response.
+
+        Raises:
+            SnapshotMissError: If the response was not recorded.
+        """
+        response = self.find(url, kind)
+        if response is None:
+            raise SnapshotMissError(f"{url} is not in the snapshot {self.path}")
+
+        return response
+
+    def close(self):
+        """
+        Stop recording or replaying. A recorded snapshot has its index sorted, keeping the latest response of each URL.
+        """
+        if self.recording:
+            self._data.close()
+            self._index.close()
+            self._sort_index(self.path / "pages.idx")
+        elif self.replaying:
+            if self._data_map is not None:
+                self._data_map.close()
+            self._index_map.close()
+            self._data.close()
+            self._index.close()
+
+        self.recording = self.replaying = False
+        self._unsorted = {}
+
+    @staticmethod
+    def _get_entry_offset(i: int) -> int:
+        return index_header.size + i * index_entry.size
+
+    def _search(self, key: bytes) -> tuple[int, int, int] | None:
+        # Binary search the sorted entries of the memory mapped index
+        low, high = 0, self._sorted
+        while low < high:
+            middle = (low + high) // 2
+            offset = self._get_entry_offset(middle)
+            middle_key = self._index_map[offset : offset + 16]
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return index_entry.unpack_from(self._index_map, offset)[1:]
+
+        return None
+
+    @staticmethod
+    def _sort_index(index_path: Path):
+        content = index_path.read_bytes()
+        entries = {}
+        # Later entries of a key replace earlier ones
+        for i in range((len(content) - index_header.size) // index_entry.size):
+            entry = index_entry.unpack_from(content, index_header.size + i * index_entry.size)
+            entries[entry[0]] = entry
+
+        sorted_path = index_path.with_suffix(".idx.tmp")
+        with open(sorted_path, "wb") as file:
+            file.write(index_header.pack(index_magic, len(entries)))
+            for key in sorted(entries):
+                file.write(index_entry.pack(*entries[key]))
+
+        os.replace(sorted_path, index_path)
+
+
+snapshots = SnapshotStore()
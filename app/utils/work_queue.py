@@ -0,0 +1,349 @@
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Any, Iterator
+
+from app.core.config import settings
+
+# The kinds of tasks of a sharded run, by the order they are claimed in. Companies are claimed first so the work
+# already found is finished before more is found, and the queue stays short.
+task_priorities = {"company": 0, "page": 1, "search": 2}
+
+
+@dataclass(slots=True)
+class Task:
+    """
+    A unit of work of a sharded run: finding the result pages of a search, extracting the companies of a result page,
+    or enriching a company.
+
+    Tasks are ordered by the search, page and position in the page they were first found at, which is the order their
+    results are merged in.
+    """
+
+    kind: str
+    key: str
+    search: int
+    page: int = 0
+    position: int = 0
+    payload: Any = None
+
+
+class WorkQueue:
+    """
+    A queue of the tasks of a sharded run, backed by SQLite, shared by every worker process of the run.
+
+    Workers claim tasks for a lease, which they renew while they are alive. A task whose lease expires, because its
+    worker died or hung, is handed to the next worker claiming a task, until it has been claimed max_attempts times.
+    Completing a task stores its result and adds the tasks it found, so the queue also holds the results of the run
+    until they are merged.
+
+    Every worker opens the queue file itself, so workers can run in separate processes, or in separate containers
+    sharing the directory of the file.
+    """
+
+    def __init__(self, path: str | Path, lease_seconds: float = None, max_attempts: int = None):
+        """
+        Open the queue in a database file, creating it if it does not exist yet.
+
+        Args:
+            path: The path of the SQLite database file.
+            lease_seconds: The number of seconds a claimed task is held for without being renewed, defaults to the
+                SHARD_LEASE_SECONDS setting.
+            max_attempts: The number of times a task is claimed before it is given up on, defaults to the
+                SHARD_MAX_ATTEMPTS setting.
+        """
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds or settings.SHARD_LEASE_SECONDS
+        self.max_attempts = max_attempts or settings.SHARD_MAX_ATTEMPTS
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Transactions are started explicitly, so that claiming a task locks the queue against other workers
+        self._connection = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._lock = Lock()
+
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        with self._transaction():
+            self._connection.execute("CREATE TABLE IF NOT EXISTS params (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tasks (
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    search INTEGER NOT NULL,
+                    page INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    payload TEXT,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    worker TEXT,
+                    lease_until REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    result TEXT,
+                    PRIMARY KEY (kind, key)
+                )
+                """
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS tasks_by_state ON tasks (state, priority, search, page, position)"
+            )
+
+    @classmethod
+    def create(cls, path: str | Path, searches: list[list[str]], **params: Any) -> "WorkQueue":
+        """
+        Start the queue of a new sharded run, with a task for every search.
+
+        If workers on several machines start the run at the same time, the parameters of the first one are kept.
+
+        Args:
+            path: The path of the SQLite database file.
+            searches: Every [industry group, revenue range] pair to search for.
+            **params: The other parameters of the run.
+
+        Returns:
+            The new queue.
+        """
+        queue = cls(path)
+        with queue._lock, queue._transaction():
+            queue._connection.executemany(
+                "INSERT OR IGNORE INTO params VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in {"searches": searches, **params}.items()],
+            )
+            queue._add(queue._connection, [Task("search", str(search), search) for search in range(len(searches))])
+
+        return queue
+
+    @property
+    def params(self) -> dict[str, Any]:
+        """
+        The parameters of the run.
+        """
+        with self._lock:
+            return {key: json.loads(value) for key, value in self._connection.execute("SELECT key, value FROM params")}
+
+    @contextmanager
+    def _transaction(self):
+        # Lock the database for writing from the start, so two workers can't claim the same task
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    @staticmethod
+    def _add(connection: sqlite3.Connection, tasks: list[Task]):
+        # A task found again keeps its state, and moves to the earliest place it was found at, so the order of the
+        # results does not depend on which worker found it first
+        connection.executemany(
+            """
+            INSERT INTO tasks (kind, key, priority, search, page, position, payload) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (kind, key) DO UPDATE SET search = excluded.search, page = excluded.page,
+                position = excluded.position, payload = excluded.payload
+            WHERE (excluded.search, excluded.page, excluded.position) < (tasks.search, tasks.page, tasks.position)
+            """,
+            [
+                (
+                    task.kind,
+                    task.key,
+                    task_priorities[task.kind],
+                    task.search,
+                    task.page,
+                    task.position,
+                    json.dumps(task.payload),
+                )
+                for task in tasks
+            ],
+        )
+
+    def claim(self, worker: str) -> Task | None:
+        """
+        Claim the next task for a worker, handing back the tasks of workers whose lease expired first.
+
+        Args:
+            worker: The ID of the worker.
+
+        Returns:
+            The claimed task, or None if no task is waiting to be worked on.
+        """
+        now = time.time()
+        with self._lock, self._transaction():
+            self._connection.execute(
+                """
+                UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, worker = NULL,
+                    error = 'The lease of worker ' || worker || ' expired'
+                WHERE state = 'claimed' AND lease_until < ?
+                """,
+                (self.max_attempts, now),
+            )
+
+            row = self._connection.execute(
+                """
+                SELECT kind, key, search, page, position, payload FROM tasks WHERE state = 'pending'
+                ORDER BY priority, search, page, position LIMIT 1
+                """
+            ).fetchone()
+            if row is None:
+                return None
+
+            kind, key, search, page, position, payload = row
+            self._connection.execute(
+                """
+                UPDATE tasks SET state = 'claimed', worker = ?, lease_until = ?, attempts = attempts + 1
+                WHERE kind = ? AND key = ?
+                """,
+                (worker, now + self.lease_seconds, kind, key),
+            )
+
+        return Task(kind, key, search, page, position, json.loads(payload))
+
+    def renew(self, worker: str):
+        """
+        Renew the lease of every task claimed by a worker.
+
+        Args:
+            worker: The ID of the worker.
+        """
+        with self._lock, self._transaction():
+            self._connection.execute(
+                "UPDATE tasks SET lease_until = ? WHERE state = 'claimed' AND worker = ?",
+                (time.time() + self.lease_seconds, worker),
+            )
+
+    def complete(self, task: Task, result: Any = None, new_tasks: list[Task] = None) -> bool:
+        """
+        Mark a task as done, storing its result and adding the tasks it found.
+
+        A task is only completed once. If its lease expired and another worker completed it first, the result is
+        dropped.
+
+        Args:
+            task: The claimed task.
+            result: The result of the task.
+            new_tasks: The tasks found while working on it.
+
+        Returns:
+            Whether the task was completed by this call.
+        """
+        with self._lock, self._transaction():
+            completed = self._connection.execute(
+                """
+                UPDATE tasks SET state = 'done', result = ?, lease_until = NULL, error = NULL
+                WHERE kind = ? AND key = ? AND state != 'done'
+                """,
+                (json.dumps(result), task.kind, task.key),
+            ).rowcount
+            if completed:
+                self._add(self._connection, new_tasks or [])
+
+        return bool(completed)
+
+    def release(self, task: Task, worker: str, error: str):
+        """
+        Hand a task that failed back to the queue, or give up on it once it has been claimed max_attempts times.
+
+        Args:
+            task: The claimed task.
+            worker: The ID of the worker that claimed it.
+            error: A description of the error the task failed with.
+        """
+        with self._lock, self._transaction():
+            self._connection.execute(
+                """
+                UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, worker = NULL,
+                    lease_until = NULL, error = ?
+                WHERE kind = ? AND key = ? AND state = 'claimed' AND worker = ?
+                """,
+                (self.max_attempts, error, task.kind, task.key, worker),
+            )
+
+    def retry_failed(self) -> int:
+        """
+        Hand every task that was given up on back to the queue, to resume a run.
+
+        Returns:
+            The number of tasks handed back.
+        """
+        with self._lock, self._transaction():
+            return self._connection.execute(
+                "UPDATE tasks SET state = 'pending', attempts = 0 WHERE state = 'failed'"
+            ).rowcount
+
+    def is_finished(self) -> bool:
+        """
+        Check whether every task of the run is done or was given up on.
+
+        Returns:
+            True if no task is waiting or being worked on.
+        """
+        with self._lock:
+            return not self._connection.execute(
+                "SELECT 1 FROM tasks WHERE state IN ('pending', 'claimed') LIMIT 1"
+            ).fetchone()
+
+    def get_counts(self) -> dict[str, dict[str, int]]:
+        """
+        Count the tasks of the run.
+
+        Returns:
+            The number of tasks by kind and then by state.
+        """
+        counts: dict[str, dict[str, int]] = {}
+        with self._lock:
+            for kind, state, count in self._connection.execute(
+                "SELECT kind, state, COUNT(*) FROM tasks GROUP BY kind, state"
+            ):
+                counts.setdefault(kind, {})[state] = count
+
+        return counts
+
+    def get_failures(self) -> list[tuple[Task, str]]:
+        """
+        Get the tasks that were given up on.
+
+        Returns:
+            Each failed task, with the error it last failed with.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                """
+                SELECT kind, key, search, page, position, payload, error FROM tasks WHERE state = 'failed'
+                ORDER BY priority DESC, search, page, position
+                """
+            ).fetchall()
+
+        return [(Task(*row[:5], json.loads(row[5])), row[6]) for row in rows]
+
+    def iter_results(self, kind: str) -> Iterator[Any]:
+        """
+        Read the results of the done tasks of a kind, one at a time, in the order they were first found in.
+
+        Args:
+            kind: The kind of the tasks.
+
+        Yields:
+            The result of each task.
+        """
+        # Use a connection of its own, so results can be read while the queue is in use
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            rows = connection.execute(
+                "SELECT result FROM tasks WHERE kind = ? AND state = 'done' ORDER BY search, page, position", (kind,)
+            )
+            for (result,) in rows:
+                yield json.loads(result)
+        finally:
+            connection.close()
+
+    def close(self):
+        """
+        Close the database file.
+        """
+        with self._lock:
+            self._connection.close()
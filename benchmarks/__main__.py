@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from benchmarks.fake_servers import FakeCienceServer, FakeCoresignalServer, FakeLlmServer
+from benchmarks.scenario import scenarios
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parse the command line arguments.
+
+    Returns:
+        The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Measure the throughput and peak memory of the scraper against local stand-ins for its services",
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="numbers of companies to benchmark with"
+    )
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(scenarios), default=list(scenarios), help="scenarios to benchmark"
+    )
+    parser.add_argument("--cience-latency", type=float, default=0.02, help="seconds each cience response takes")
+    parser.add_argument("--coresignal-latency", type=float, default=0.05, help="seconds each Coresignal response takes")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds each LLM response takes")
+    parser.add_argument(
+        "--throttle-share", type=float, default=0.02, help="share of Coresignal searches rate limited once"
+    )
+    parser.add_argument(
+        "--llm-share", type=float, default=0.1, help="share of results pages the listing parser can't read"
+    )
+    parser.add_argument(
+        "--coresignal-batch-size",
+        type=int,
+        default=0,
+        help="CORESIGNAL_BATCH_SIZE to run with, the number of companies counted with each Coresignal query",
+    )
+    parser.add_argument(
+        "--fetch-engine",
+        choices=["browser", "http"],
+        default="browser",
+        help="CIENCE_FETCH_ENGINE to run with, the engine fetching the cience results pages",
+    )
+    parser.add_argument(
+        "--rate-limit", type=float, default=1000, help="HTTP_RATE_LIMIT to run with, in requests per second per host"
+    )
+    parser.add_argument(
+        "--output", type=Path, help="JSON file to write the results to, defaults to data/benchmarks/<timestamp>.json"
+    )
+    parser.add_argument("--baseline", type=Path, help="JSON results of an earlier benchmark to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="share by which throughput can drop, or peak memory grow, compared to the baseline before failing",
+    )
+    parser.add_argument("--verbose", action="store_true", help="show the output of the scraper")
+
+    return parser.parse_args()
+
+
+def run_scenario(scenario: str, companies: int, environment: dict[str, str], verbose: bool) -> dict:
+    """
+    Run a scenario in a process of its own, so its peak memory is measured on its own and no cache is shared.
+
+    Args:
+        scenario: The name of the scenario.
+        companies: The number of companies to run it with.
+        environment: The environment variables pointing the scraper at the stand-in services.
+        verbose: Whether to show the output of the scraper.
+
+    Returns:
+        The results of the scenario.
+    """
+    with TemporaryDirectory() as directory:
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.scenario", scenario, str(companies), directory],
+            env={**environment, "CACHE_DIR": str(Path(directory) / "cache")},
+            stdout=None if verbose else subprocess.DEVNULL,
+            check=True,
+        )
+
+        return json.loads((Path(directory) / "result.json").read_text())
+
+
+def compare_with_baseline(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    """
+    Find the regressions of a benchmark compared to an earlier one.
+
+    Args:
+        results: The results of the benchmark.
+        baseline: The results of the earlier benchmark.
+        tolerance: The share by which throughput can drop, or peak memory grow, before it is a regression.
+
+    Returns:
+        A description of each regression.
+    """
+    baseline_results = {(result["scenario"], result["size"]): result for result in baseline}
+
+    regressions = []
+    for result in results:
+        before = baseline_results.get((result["scenario"], result["size"]))
+        if before is None:
+            continue
+
+        name = f"{result['scenario']} with {result['size']} companies"
+        if result["companies_per_second"] < before["companies_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['companies_per_second']:.1f} companies/s, down from "
+                f"{before['companies_per_second']:.1f}"
+            )
+        if result["peak_memory_bytes"] > before["peak_memory_bytes"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: {result['peak_memory_bytes'] / 2**20:.0f} MB peak memory, up from "
+                f"{before['peak_memory_bytes'] / 2**20:.0f} MB"
+            )
+
+    return regressions
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    cience = FakeCienceServer(args.cience_latency, args.llm_share).start()
+    coresignal = FakeCoresignalServer(args.coresignal_latency, args.throttle_share).start()
+    llm = FakeLlmServer(args.llm_latency).start()
+
+    environment = {
+        **os.environ,
+        "CIENCE_URL": cience.url,
+        "CORESIGNAL_URL": coresignal.url,
+        "OPENAI_BASE_URL": f"{llm.url}/v1",
+        "OPENAI_API_KEY": "benchmark",
+        "CORESIGNAL_API_KEY": "benchmark",
+        "HTTP_RATE_LIMIT": str(args.rate_limit),
+        "CORESIGNAL_BATCH_SIZE": str(args.coresignal_batch_size),
+        "CIENCE_FETCH_ENGINE": args.fetch_engine,
+        "HTTP_RATE_LIMITS": "{}",
+    }
+
+    results = []
+    try:
+        print(f"{'scenario':<10} {'companies':>9} {'seconds':>8} {'companies/s':>11} {'peak MB':>8} {'wrong':>6}")
+        for size in args.sizes:
+            for scenario in args.scenarios:
+                requests_before = (cience.requests, coresignal.requests, llm.requests)
+                result = run_scenario(scenario, size, environment, args.verbose)
+
+                result.update(
+                    scenario=scenario,
+                    size=size,
+                    companies_per_second=result["companies"] / result["seconds"],
+                    requests={
+                        name: server.requests - before
+                        for name, server, before in zip(
+                            ("cience", "coresignal", "llm"), (cience, coresignal, llm), requests_before
+                        )
+                    },
+                )
+                results.append(result)
+
+                print(
+                    f"{scenario:<10} {result['companies']:>9} {result['seconds']:>8.1f} "
+                    f"{result['companies_per_second']:>11.1f} {result['peak_memory_bytes'] / 2**20:>8.0f} "
+                    f"{result['wrong_job_counts']:>6}"
+                )
+    finally:
+        for server in (cience, coresignal, llm):
+            server.stop()
+
+    output = args.output or Path("data/benchmarks") / f"{datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2) + "\n")
+    print("\nResults written to", output)
+
+    failures = [
+        f"{result['scenario']} with {result['size']} companies: {result['companies']} companies found, "
+        f"{result['wrong_job_counts']} with wrong job counts"
+        for result in results
+        if result["companies"] != result["size"] or result["wrong_job_counts"]
+    ]
+    if args.baseline:
+        failures += compare_with_baseline(results, json.loads(args.baseline.read_text()), args.tolerance)
+
+    if failures:
+        print("\nBenchmark failed:")
+        for failure in failures:
+            print("-", failure)
+        raise SystemExit(1)
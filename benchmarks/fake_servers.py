@@ -0,0 +1,487 @@
+import json
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from urllib.parse import parse_qs, urlsplit
+from zlib import crc32
+
+# Number of companies listed on each fake cience results page
+companies_per_page = 25
+
+# Number of pages linked from the pagination control of a fake results page, after the page itself
+pagination_links = 4
+
+# Navigation and marketing copy around the listing of a fake results page, like on the real pages
+page_header = (
+    "<nav>"
+    + "".join(f'<a href="/solutions/{i}">Solution {i}</a>' for i in range(30))
+    + "</nav>"
+    + ("<p>Grow your pipeline with outbound sales development, data and lead generation services.</p>" * 10)
+)
+page_footer = "<footer>" + "".join(f'<a href="/resources/{i}">Resource {i}</a>' for i in range(50)) + "</footer>"
+
+industry_group_pattern = re.compile(r"/companies-database/united-states/bench-(\d+)/revenue-[^/?]+$")
+details_page_pattern = re.compile(r"/company/company-(\d+)/(\d+)$")
+collect_pattern = re.compile(r"^/cdapi/v1/linkedin/job/collect/(\d+)$")
+
+
+def get_company(index: int) -> dict[str, str]:
+    """
+    Generate the details of a fake company.
+
+    Args:
+        index: The index of the company, from 0.
+
+    Returns:
+        The details of the company, without its details page URL.
+    """
+    return {
+        "company_name": f"Company {index}",
+        "industry": ("Internet", "Software", "Computer Hardware")[index % 3],
+        "location": ("Austin, TX", "New York, NY", "San Francisco, CA")[index % 3],
+        "revenue": "Over $1B",
+        "employees": f"{(index % 50 + 1) * 100}",
+    }
+
+
+# Titles of the jobs of fake companies
+job_titles = [
+    "AI Engineer",
+    "IT Support Specialist",
+    "Software Engineer",
+    "Data Scientist",
+    "Sales Manager",
+    "Designer",
+]
+
+
+# Descriptions of the jobs of fake companies, holding the keywords in forms a keyword_description search matches,
+# and in forms it doesn't, like "engineers" or "it's"
+job_descriptions = [
+    "Build AI models and data pipelines with the platform team.",
+    "Support the IT infrastructure of our offices.",
+    "Join our engineering team as a software engineer.",
+    "Engineers wanted for our AI-driven products.",
+    "It's a sales role, with quotas and travel.",
+    "Design the product with the rest of the team.",
+]
+
+# A word of a text, as split by Elasticsearch's standard analyzer
+word_pattern = re.compile(r"\w+(?:[.'’]\w+)*")
+
+
+def get_jobs(slug: str) -> list[dict]:
+    """
+    Generate the active jobs of a fake company. Half of the companies have none, like on LinkedIn.
+
+    Args:
+        slug: The LinkedIn slug of the company.
+
+    Returns:
+        The jobs of the company, with their ID, title and description, the same every time for the same slug.
+    """
+    seed = crc32(slug.encode())
+    if seed % 2 == 0:
+        return []
+
+    return [
+        {
+            "id": seed * 100 + i,
+            "title": job_titles[crc32(f"{slug}:{i}".encode()) % len(job_titles)],
+            "description": job_descriptions[crc32(f"{slug}:{i}:description".encode()) % len(job_descriptions)],
+        }
+        for i in range(seed // 2 % 20)
+    ]
+
+
+def matches_keyword(job: dict, keyword: str) -> bool:
+    """
+    Check whether a job matches a keyword_description search, which matches the keyword as a phrase of the job's
+    description, ignoring case.
+
+    Args:
+        job: The job.
+        keyword: The keyword searched for, or an empty string for any job.
+
+    Returns:
+        Whether the job matches.
+    """
+    words = word_pattern.findall(job["description"].lower())
+    phrase = word_pattern.findall(keyword.lower())
+
+    return any(words[i : i + len(phrase)] == phrase for i in range(len(words) - len(phrase) + 1))
+
+
+def get_job_count(slug: str, keyword: str) -> int:
+    """
+    Count the jobs of a fake company for a keyword, see matches_keyword.
+
+    Args:
+        slug: The LinkedIn slug of the company.
+        keyword: The keyword searched for, or an empty string for any job.
+
+    Returns:
+        The number of jobs, the same every time for the same slug and keyword.
+    """
+    return sum(1 for job in get_jobs(slug) if matches_keyword(job, keyword))
+
+
+class FakeServer(ThreadingHTTPServer):
+    """
+    A local HTTP server standing in for an external service, handling each request in a thread of its own.
+    """
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, handler: type[BaseHTTPRequestHandler], latency: float = 0.0):
+        """
+        Args:
+            handler: The request handler class of the service.
+            latency: The number of seconds each response is delayed by.
+        """
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = latency
+        self.requests = 0
+
+        self._lock = Lock()
+        self._thread = Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        """
+        The base URL of the server.
+        """
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeServer":
+        """
+        Start serving requests in the background.
+
+        Returns:
+            The server.
+        """
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving requests and close the server.
+        """
+        self.shutdown()
+        self.server_close()
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    server: FakeServer
+
+    # Keep connections alive, like the real services
+    protocol_version = "HTTP/1.1"
+
+    def send(self, status: int, body: str, content_type: str = "text/html", headers: dict[str, str] = None):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        encoded = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(encoded)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def read_json(self) -> dict:
+        return json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+    def log_message(self, *_):
+        # Keep the benchmark output readable
+        pass
+
+
+class FakeCienceHandler(FakeHandler):
+    """
+    Serve templated cience results and company details pages.
+
+    The number of companies of a search is taken from its industry group, "bench-<companies>", and the results pages
+    list companies_per_page companies each. A share of the results pages, set by the server's llm_share, lists them
+    without labels, so the listing parser can't read them and they have to go through the LLM.
+    """
+
+    server: "FakeCienceServer"
+
+    def do_GET(self):
+        self.server.count_request()
+        url = urlsplit(self.path)
+
+        if match := industry_group_pattern.fullmatch(url.path):
+            page = int(parse_qs(url.query).get("page", ["1"])[0])
+            return self.send_results_page(int(match.group(1)), page)
+
+        if match := details_page_pattern.fullmatch(url.path):
+            return self.send_details_page(int(match.group(1)))
+
+        self.send(404, "<html><body><h1>404 Not Found</h1></body></html>")
+
+    def send_results_page(self, companies: int, page: int):
+        pages = max(1, -(-companies // companies_per_page))
+        if page > pages:
+            return self.send(404, "<html><body><h1>404 Not Found</h1></body></html>")
+
+        listing = []
+        for i in range((page - 1) * companies_per_page, min(page * companies_per_page, companies)):
+            company = get_company(i)
+            link = f'<a href="/company/company-{i}/{i}">{company["company_name"]}</a>'
+            if self.is_llm_page(page):
+                # Values without labels, which only the LLM can tell apart
+                listing.append(
+                    f'<div class="card">{link}<p>{company["industry"]}</p><p>{company["location"]}</p>'
+                    f'<p>{company["revenue"]}</p><p>{company["employees"]} people</p></div>'
+                )
+            else:
+                listing.append(
+                    f'<tr><td>{link}</td><td>{company["industry"]}</td><td>{company["location"]}</td>'
+                    f'<td>{company["revenue"]}</td><td>{company["employees"]}</td></tr>'
+                )
+
+        listing = "".join(listing)
+        if not self.is_llm_page(page):
+            listing = (
+                "<table><thead><tr><th>Company</th><th>Industry</th><th>Location</th><th>Revenue</th>"
+                f"<th>Employees</th></tr></thead><tbody>{listing}</tbody></table>"
+            )
+
+        pagination = "".join(
+            f'<a href="?page={linked}">{linked}</a>' for linked in range(1, min(page + pagination_links, pages) + 1)
+        )
+        self.send(
+            200,
+            f"<html><body>{page_header}<h1>Companies</h1>{listing}<nav>{pagination}</nav>{page_footer}</body></html>",
+        )
+
+    def is_llm_page(self, page: int) -> bool:
+        # Spread the pages the parser can't read evenly across the results
+        return int(page * self.server.llm_share) != int((page - 1) * self.server.llm_share)
+
+    def send_details_page(self, index: int):
+        company = get_company(index)
+
+        # Put the LinkedIn link after some content, like on the real pages, so the page is streamed in more than one
+        # chunk before the slug is found
+        filler = "<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>" * 400
+        self.send(
+            200,
+            f"<html><body><h1>{company['company_name']}</h1>{filler}"
+            f'<a href="https://www.linkedin.com/company/company-{index}">LinkedIn</a></body></html>',
+        )
+
+
+class FakeCienceServer(FakeServer):
+    def __init__(self, latency: float = 0.0, llm_share: float = 0.1):
+        """
+        Args:
+            latency: The number of seconds each response is delayed by.
+            llm_share: The share of results pages that the listing parser can't read.
+        """
+        super().__init__(FakeCienceHandler, latency)
+        self.llm_share = llm_share
+
+
+class FakeCoresignalHandler(FakeHandler):
+    """
+    Serve the Coresignal job search endpoint, returning the IDs of the jobs found and their number in the
+    x-total-results header, the Elasticsearch DSL job search endpoint, counting jobs by company and keyword, and the
+    job collect endpoint.
+
+    A share of the searches, set by the server's throttle_share, is rate limited the first time it is sent. Retries
+    are never rate limited, so every search eventually succeeds.
+    """
+
+    server: "FakeCoresignalServer"
+
+    def do_GET(self):
+        self.server.count_request()
+        match = collect_pattern.search(urlsplit(self.path).path)
+        if not match:
+            return self.send(404, "{}", "application/json")
+
+        job_id = int(match.group(1))
+        # Job IDs are made of the seed of their company's slug and their index, see get_jobs
+        for slug in self.server.slugs.get(job_id // 100, []):
+            for job in get_jobs(slug):
+                if job["id"] == job_id:
+                    return self.send(200, json.dumps(job), "application/json")
+
+        self.send(404, "{}", "application/json")
+
+    def do_POST(self):
+        self.server.count_request()
+        path = urlsplit(self.path).path
+        if path == "/cdapi/v1/linkedin/job/search/es_dsl":
+            return self.send_batch_job_counts()
+        if path != "/cdapi/v1/linkedin/job/search/filter":
+            return self.send(404, "{}", "application/json")
+
+        search = self.read_json()
+        slug = search.get("company_linkedin_url", "").rstrip("/").rsplit("/", 1)[-1]
+        keyword = search.get("keyword_description", "")
+
+        if self.server.should_throttle(f"{slug}:{keyword}"):
+            return self.send(429, '{"message": "Too many requests"}', "application/json", {"Retry-After": "0"})
+
+        self.server.add_slug(slug)
+        job_ids = [job["id"] for job in get_jobs(slug) if matches_keyword(job, keyword)]
+        self.send(200, json.dumps(job_ids), "application/json", {"x-total-results": str(len(job_ids))})
+
+    def send_batch_job_counts(self):
+        """
+        Answer an Elasticsearch DSL query counting the jobs of several companies for each keyword, as sent by
+        get_batch_job_counts, with the same counts as the searches for each company and keyword.
+        """
+        query = self.read_json()
+        urls = query["query"]["bool"]["filter"][0]["terms"]["company_url"]
+        keyword_filters = query["aggs"]["companies"]["aggs"]["keywords"]["filters"]["filters"]
+        keywords = {
+            name: keyword_filter["match_phrase"]["description"] for name, keyword_filter in keyword_filters.items()
+        }
+
+        if self.server.should_throttle(json.dumps(urls)):
+            return self.send(429, '{"message": "Too many requests"}', "application/json", {"Retry-After": "0"})
+
+        buckets = []
+        for url in urls:
+            slug = url.rstrip("/").rsplit("/", 1)[-1]
+            total = get_job_count(slug, "")
+            if total:
+                keyword_buckets = {
+                    name: {"doc_count": get_job_count(slug, keyword)} for name, keyword in keywords.items()
+                }
+                buckets.append({"key": url, "doc_count": total, "keywords": {"buckets": keyword_buckets}})
+
+        total = sum(bucket["doc_count"] for bucket in buckets)
+        body = {"hits": {"total": {"value": total}, "hits": []}, "aggregations": {"companies": {"buckets": buckets}}}
+        self.send(200, json.dumps(body), "application/json", {"x-total-results": str(total)})
+
+
+class FakeCoresignalServer(FakeServer):
+    def __init__(self, latency: float = 0.0, throttle_share: float = 0.0):
+        """
+        Args:
+            latency: The number of seconds each response is delayed by.
+            throttle_share: The share of searches rate limited the first time they are sent.
+        """
+        super().__init__(FakeCoresignalHandler, latency)
+        self.throttle_share = throttle_share
+        self.throttled = 0
+        # The slugs searched for, by the seed of their job IDs, to find the jobs to collect
+        self.slugs: dict[int, list[str]] = {}
+
+        self._throttled_searches: set[str] = set()
+
+    def add_slug(self, slug: str):
+        """
+        Remember a slug searched for, so its jobs can be collected.
+
+        Args:
+            slug: The LinkedIn slug of the company.
+        """
+        with self._lock:
+            slugs = self.slugs.setdefault(crc32(slug.encode()), [])
+            if slug not in slugs:
+                slugs.append(slug)
+
+    def should_throttle(self, search: str) -> bool:
+        """
+        Decide whether to rate limit a search.
+
+        Args:
+            search: The key of the search.
+
+        Returns:
+            True the first time a search picked for rate limiting is sent.
+        """
+        if crc32(search.encode()) % 1000 >= self.throttle_share * 1000:
+            return False
+
+        with self._lock:
+            if search in self._throttled_searches:
+                return False
+
+            self._throttled_searches.add(search)
+            self.throttled += 1
+            return True
+
+
+class FakeLlmHandler(FakeHandler):
+    """
+    Serve an OpenAI compatible chat completions endpoint that extracts the companies linked from the prompt.
+
+    It answers with a tool call when the request offers tools, and with JSON content otherwise, so it works with every
+    structured output method. Token usage is estimated from the length of the prompt and the answer.
+    """
+
+    def do_POST(self):
+        self.server.count_request()
+        if not urlsplit(self.path).path.endswith("/chat/completions"):
+            return self.send(404, "{}", "application/json")
+
+        completion = self.read_json()
+        prompt = "".join(
+            message["content"] if isinstance(message["content"], str) else json.dumps(message["content"])
+            for message in completion.get("messages", [])
+        )
+
+        companies = []
+        for match in dict.fromkeys(re.findall(r"(https?://[^\s)\"'<>]+/company/company-(\d+)/\d+)", prompt)):
+            url, index = match
+            companies.append({**get_company(int(index)), "cience_details_page": url})
+        arguments = json.dumps({"companies": companies})
+
+        message = {"role": "assistant", "content": arguments}
+        finish_reason = "stop"
+        if completion.get("tools"):
+            tool = completion["tools"][0]["function"]["name"]
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {"id": "call_0", "type": "function", "function": {"name": tool, "arguments": arguments}}
+                ],
+            }
+            finish_reason = "tool_calls"
+
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(arguments) // 4
+        self.send(
+            200,
+            json.dumps(
+                {
+                    "id": "chatcmpl-benchmark",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": completion.get("model", "gpt-4o"),
+                    "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                }
+            ),
+            "application/json",
+        )
+
+
+class FakeLlmServer(FakeServer):
+    def __init__(self, latency: float = 0.0):
+        """
+        Args:
+            latency: The number of seconds each response is delayed by.
+        """
+        super().__init__(FakeLlmHandler, latency)
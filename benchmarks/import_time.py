@@ -0,0 +1,132 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+# Modules that only the backends of some runs need, which must not be imported when the CLI starts
+lazy_modules = [
+    "crawl4ai",
+    "langchain_core",
+    "langchain_openai",
+    "openai",
+    "selenium",
+    "webdriver_manager",
+    "pyarrow",
+    "xlsxwriter",
+]
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parse the command line arguments.
+
+    Returns:
+        The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.import_time",
+        description="Measure how long the CLI takes to start, and check that no backend is loaded before it is needed",
+    )
+    parser.add_argument("--runs", type=int, default=5, help="number of times to start the CLI, the fastest one counts")
+    parser.add_argument(
+        "--budget", type=float, default=0.5, help="seconds the CLI may take to start on top of the interpreter"
+    )
+    parser.add_argument("--top", type=int, default=0, help="show the modules taking the longest to import")
+
+    return parser.parse_args()
+
+
+def time_command(command: list[str], runs: int) -> float:
+    """
+    Time a command, keeping the fastest of several runs to leave out the noise of the machine.
+
+    Args:
+        command: The command to run.
+        runs: The number of times to run it.
+
+    Returns:
+        The number of seconds the fastest run took.
+    """
+    fastest = float("inf")
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        fastest = min(fastest, time.perf_counter() - started_at)
+
+    return fastest
+
+
+def get_loaded_modules() -> list[str]:
+    """
+    Get the modules loaded by importing the CLI.
+
+    Returns:
+        The names of the top level packages of the loaded modules.
+    """
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import json, sys, app.__main__; print(json.dumps(sorted({name.split('.')[0] for name in sys.modules})))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+    return json.loads(output)
+
+
+def get_slowest_imports(top: int) -> list[tuple[float, str]]:
+    """
+    Find the modules taking the longest to import when the CLI starts, with python -X importtime.
+
+    Args:
+        top: The number of modules to return.
+
+    Returns:
+        The cumulative seconds each module took to import, with its name, slowest first.
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.__main__"], capture_output=True, text=True, check=True
+    ).stderr
+
+    # Lines look like "import time:       self [us] |  cumulative | imported package"
+    imports = []
+    for line in output.splitlines()[1:]:
+        _, cumulative, name = line.split("|")
+        imports.append((int(cumulative) / 1e6, name.rstrip()))
+
+    return sorted(imports, reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    interpreter_seconds = time_command([sys.executable, "-c", "pass"], args.runs)
+    cli_seconds = time_command([sys.executable, "-m", "app", "--help"], args.runs)
+    startup_seconds = cli_seconds - interpreter_seconds
+
+    print(f"Interpreter starts in {interpreter_seconds:.3f}s")
+    print(f"CLI starts in {cli_seconds:.3f}s, {startup_seconds:.3f}s of it importing the scraper")
+
+    if args.top:
+        print("\nSlowest imports:")
+        for seconds, name in get_slowest_imports(args.top):
+            print(f"{seconds:>8.3f}s {name}")
+
+    failures = []
+    if startup_seconds > args.budget:
+        failures.append(f"the scraper takes {startup_seconds:.3f}s to import, over the budget of {args.budget:.3f}s")
+
+    loaded_modules = set(get_loaded_modules())
+    for module in lazy_modules:
+        if module in loaded_modules:
+            failures.append(f"{module} is imported when the CLI starts")
+
+    if failures:
+        print("\nImport time check failed:")
+        for failure in failures:
+            print("-", failure)
+        raise SystemExit(1)
@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import json
+import resource
+import sys
+import time
+from pathlib import Path
+
+from app.schemas.company import CompanyRecord
+from app.utils.cience import get_companies
+from app.utils.coresignal import enrich_companies_with_coresignal_job_counts
+from app.utils.journal import RunJournal
+from app.utils.output import CsvWriter, iter_written_companies
+from app.utils.pipeline import run_pipeline
+from benchmarks.fake_servers import get_job_count
+
+# Revenue range searched by every scenario, the stand-in cience serves the same companies for every range
+revenue = "over-1b"
+
+
+def get_peak_memory() -> int:
+    """
+    Get the peak resident memory of this process.
+
+    Returns:
+        The peak resident memory in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports it in kilobytes, macOS in bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def count_wrong_job_counts(companies: list[CompanyRecord]) -> int:
+    """
+    Count the companies whose job counts differ from the ones the stand-in Coresignal serves.
+
+    Args:
+        companies: The enriched companies.
+
+    Returns:
+        The number of companies with a wrong job count.
+    """
+    return sum(
+        any(
+            count != get_job_count(company.linkedin_slug, keyword)
+            for keyword, count in company.get_job_counts().items()
+        )
+        for company in companies
+    )
+
+
+def run_batch(companies: int, directory: Path) -> dict:
+    """
+    Fetch every company with get_companies, then enrich them all with enrich_companies_with_coresignal_job_counts.
+
+    Args:
+        companies: The number of companies the stand-in cience lists.
+        directory: The working directory of the scenario, unused since nothing is written.
+
+    Returns:
+        The number of companies enriched, the number with a wrong job count, and the time each step took.
+    """
+    started_at = time.perf_counter()
+    found = get_companies(f"bench-{companies}", revenue)
+    extracted_at = time.perf_counter()
+    enriched = list(enrich_companies_with_coresignal_job_counts(found))
+    ended_at = time.perf_counter()
+
+    return {
+        "companies": len(enriched),
+        "wrong_job_counts": count_wrong_job_counts(enriched),
+        "seconds": ended_at - started_at,
+        "extract_seconds": extracted_at - started_at,
+        "enrich_seconds": ended_at - extracted_at,
+    }
+
+
+def run_streaming(companies: int, directory: Path) -> dict:
+    """
+    Fetch and enrich every company with the streaming pipeline of the CLI, writing them to a CSV file.
+
+    Args:
+        companies: The number of companies the stand-in cience lists.
+        directory: The directory to write the CSV file and the run journal to.
+
+    Returns:
+        The number of companies written, the number with a wrong job count, and the time the run took.
+    """
+    filename = directory / "companies.csv"
+    journal = RunJournal.create(
+        f"{filename}.journal", searches=[[f"bench-{companies}", revenue]], max_pages=None, output=str(filename)
+    )
+
+    started_at = time.perf_counter()
+    with CsvWriter(filename) as writer:
+        asyncio.run(run_pipeline(journal, writer))
+    ended_at = time.perf_counter()
+    journal.close()
+
+    written = list(iter_written_companies(filename))
+
+    return {
+        "companies": len(written),
+        "wrong_job_counts": count_wrong_job_counts(written),
+        "seconds": ended_at - started_at,
+    }
+
+
+scenarios = {"batch": run_batch, "streaming": run_streaming}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.scenario")
+    parser.add_argument("scenario", choices=list(scenarios))
+    parser.add_argument("companies", type=int)
+    parser.add_argument("directory", type=Path)
+    args = parser.parse_args()
+
+    result = scenarios[args.scenario](args.companies, args.directory)
+    result["peak_memory_bytes"] = get_peak_memory()
+
+    (args.directory / "result.json").write_text(json.dumps(result))
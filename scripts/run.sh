@@ -3,4 +3,4 @@
 set +x
 
 # Run the docker container
-docker run -it -v ./data:/data --env-file .env linkedin-scraper
\ No newline at end of file
+docker run -it -v ./data:/data --env-file .env linkedin-scraper "$@"
\ No newline at end of file
@@ -0,0 +1,31 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from app.utils.cache import DiskCache
+
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = DiskCache(tempfile.mkdtemp(), max_size=1024 * 1024, max_age=60 * 60)
+
+    def test_hit(self):
+        self.cache.set("key", {"value": 1})
+
+        self.assertEqual(self.cache.get("key"), {"value": 1})
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_entry_evicted_after_it_was_read_is_still_a_hit(self):
+        self.cache.set("key", {"value": 1})
+
+        with mock.patch("os.utime", side_effect=FileNotFoundError):
+            self.assertEqual(self.cache.get("key"), {"value": 1})
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_miss(self):
+        self.assertIsNone(self.cache.get("key"))
+        self.assertEqual(self.cache.misses, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
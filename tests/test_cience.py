@@ -0,0 +1,63 @@
+import unittest
+from unittest import mock
+
+from app.core.config import settings
+from app.utils import cience
+from app.utils.cience import get_linkedin_slug_from_page_content
+
+
+def details_page(slug: str) -> str:
+    return f"{settings.CIENCE_URL}/company/{slug}/1"
+
+
+card_page = "\n".join(
+    [
+        "# Companies",
+        "### Acme Corp",
+        "Software, 50 employees",
+        f"[View profile]({details_page('acme')})",
+        "[LinkedIn](https://www.linkedin.com/company/acme-corp)",
+        "### Beta Inc",
+        "Retail, 120 employees",
+        f"[View profile]({details_page('beta')})",
+        "",
+        "Copyright CIENCE",
+        "[Follow us](https://www.linkedin.com/company/cience-footer)",
+        "[LinkedIn](https://www.linkedin.com/company/cience)",
+    ]
+)
+
+
+class GetLinkedinSlugFromPageContentTest(unittest.TestCase):
+    def test_slug_of_the_company(self):
+        self.assertEqual(get_linkedin_slug_from_page_content(card_page, details_page("acme")), "acme-corp")
+
+    def test_last_company_does_not_take_the_footer_links(self):
+        self.assertEqual(get_linkedin_slug_from_page_content(card_page, details_page("beta")), "")
+
+    def test_cience_is_not_a_slug(self):
+        page = card_page.replace("acme-corp", "cience")
+
+        self.assertEqual(get_linkedin_slug_from_page_content(page, details_page("acme")), "")
+
+    def test_company_not_on_the_page(self):
+        self.assertEqual(get_linkedin_slug_from_page_content(card_page, details_page("gamma")), "")
+
+
+class GetLlmCacheKeyTest(unittest.TestCase):
+    def test_whitespace_does_not_change_the_key(self):
+        self.assertEqual(cience.get_llm_cache_key("# Companies\n\nAcme"), cience.get_llm_cache_key("# Companies Acme"))
+
+    def test_key_changes_with_the_pruning(self):
+        key = cience.get_llm_cache_key(card_page)
+
+        with mock.patch.object(settings, "LLM_PRUNE_PAGES", False):
+            self.assertNotEqual(cience.get_llm_cache_key(card_page), key)
+        with mock.patch.object(settings, "LLM_CHUNK_MAX_TOKENS", settings.LLM_CHUNK_MAX_TOKENS + 1):
+            self.assertNotEqual(cience.get_llm_cache_key(card_page), key)
+        with mock.patch.object(cience, "pruning_version", cience.pruning_version + 1):
+            self.assertNotEqual(cience.get_llm_cache_key(card_page), key)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import json
+import unittest
+from unittest import mock
+
+from app.core.config import settings
+from app.utils import coresignal
+
+# The active jobs of a company, with keywords in forms a keyword_description search matches and in forms it doesn't
+jobs = [
+    {"id": 1, "title": "AI Engineer", "description": "Support the IT infrastructure of our offices."},
+    {"id": 2, "title": "Engineering Manager", "description": "Engineers wanted for our AI-driven products."},
+    {"id": 3, "title": "Account Executive", "description": "It's a sales role, with quotas and travel."},
+    {"id": 4, "title": "Data Scientist", "description": "Join as a senior software engineer on machine learning."},
+    {"id": 5, "title": "SRE", "description": "Keep our node.js services running."},
+]
+
+keywords = ["AI", "Engineer", "IT", "machine learning", "node", "Sales"]
+
+# The counts Coresignal gives for each keyword, matching it as a phrase of the description only
+search_counts = {"AI": 1, "Engineer": 1, "IT": 1, "machine learning": 1, "node": 0, "Sales": 1}
+
+
+class FakeResponse:
+    def __init__(self, body, total: int = None):
+        self.body = body
+        self.headers = {"x-total-results": str(total)} if total is not None else {}
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeClient:
+    """
+    Answer job searches with search_counts, and collect the jobs of the fixture.
+    """
+
+    def __init__(self):
+        self.searches = 0
+        self.collected = 0
+
+    def post(self, url, headers=None, data=None):
+        self.searches += 1
+        keyword = json.loads(data).get("keyword_description")
+        if keyword is None:
+            return FakeResponse([job["id"] for job in jobs], len(jobs))
+
+        return FakeResponse([], search_counts[keyword])
+
+    def get(self, url, headers=None):
+        self.collected += 1
+        job_id = int(url.rsplit("/", 1)[-1])
+        return FakeResponse(next(job for job in jobs if job["id"] == job_id))
+
+
+class GetJobCountsTest(unittest.TestCase):
+    def get_job_counts(self, collect_max_jobs: int) -> tuple[dict[str, int], FakeClient]:
+        client = FakeClient()
+        with (
+            mock.patch.object(coresignal, "client", client),
+            mock.patch.object(settings, "JOB_COUNT_PROBE", True),
+            mock.patch.object(settings, "CORESIGNAL_COLLECT_MAX_JOBS", collect_max_jobs),
+        ):
+            return coresignal.get_job_counts("acme", keywords), client
+
+    def test_searching_each_keyword(self):
+        job_counts, client = self.get_job_counts(collect_max_jobs=0)
+
+        self.assertEqual(job_counts, search_counts)
+        self.assertEqual(client.collected, 0)
+
+    def test_collecting_the_jobs_gives_the_counts_of_the_searches(self):
+        job_counts, client = self.get_job_counts(collect_max_jobs=len(jobs))
+
+        self.assertEqual(job_counts, search_counts)
+        self.assertEqual((client.searches, client.collected), (1, len(jobs)))
+
+
+class CountKeywordMatchesTest(unittest.TestCase):
+    def test_title_is_not_searched(self):
+        self.assertEqual(count_matches("AI Engineer", "Design the product."), {"AI": 0, "Engineer": 0})
+
+    def test_keyword_is_matched_as_whole_words_ignoring_case(self):
+        self.assertEqual(count_matches("", "An ai-first team of engineers."), {"AI": 1, "Engineer": 0})
+
+
+def count_matches(title: str, description: str) -> dict[str, int]:
+    return coresignal.count_keyword_matches([{"title": title, "description": description}], ["AI", "Engineer"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+from app.utils.html_markdown import MarkdownConverter, html_to_markdown
+
+base_url = "https://www.cience.com/companies/page/1"
+
+page = """
+<html>
+<head><title>Companies</title><script>document.write("<p>Hidden</p>")</script></head>
+<body>
+<nav><a href="/solutions">Solutions</a> <a href="javascript:void(0)">Menu</a></nav>
+<h2>Acme   <b>Corp</b></h2>
+<p>Software,<br>50 employees <img src="/logo.png" alt="Acme logo"></p>
+<ul><li>Austin</li><li><a href="https://acme.com">Website</a></li></ul>
+<ol><li>First</li></ol>
+</body>
+</html>
+"""
+
+
+class HtmlToMarkdownTest(unittest.TestCase):
+    def test_blocks_links_and_images(self):
+        self.assertEqual(
+            html_to_markdown(page, base_url).split("\n\n"),
+            [
+                "[Solutions](https://www.cience.com/solutions) Menu",
+                "## Acme **Corp**",
+                "Software,\n50 employees ![Acme logo](https://www.cience.com/logo.png)",
+                "- Austin",
+                "- [Website](https://acme.com)",
+                "1. First",
+            ],
+        )
+
+    def test_table_is_a_pipe_table(self):
+        html = """
+            <table>
+            <tr><th>Company</th><th>Revenue</th></tr>
+            <tr><td><a href="/company/acme/1">Acme</a></td><td>$10M | $20M</td></tr>
+            <tr><td>Beta<td>$5M
+            </table>
+        """
+
+        self.assertEqual(
+            html_to_markdown(html, base_url).splitlines(),
+            [
+                "| Company | Revenue |",
+                "|---|---|",
+                "| [Acme](https://www.cience.com/company/acme/1) | $10M \\| $20M |",
+                "| Beta | $5M |",
+            ],
+        )
+
+    def test_page_fed_in_pieces_is_converted_the_same(self):
+        converter = MarkdownConverter(base_url)
+        for start in range(0, len(page), 7):
+            converter.feed(page[start : start + 7])
+        converter.close()
+
+        self.assertEqual("\n\n".join(converter.blocks), html_to_markdown(page, base_url))
+
+
+if __name__ == "__main__":
+    unittest.main()
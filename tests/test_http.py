@@ -0,0 +1,167 @@
+import unittest
+from unittest import mock
+
+import requests
+from requests.adapters import BaseAdapter
+
+from app.core.config import settings
+from app.utils import coresignal, http
+from app.utils.http import CircuitBreaker, CircuitOpenError, HttpClient, RateLimiter, ThrottledError
+
+url = "https://api.example.com/search"
+
+
+class StubAdapter(BaseAdapter):
+    """
+    Answer requests with the given statuses in order, or raise the given exceptions.
+    """
+
+    def __init__(self, *answers: int | tuple[int, dict[str, str]] | Exception):
+        super().__init__()
+        self.answers = list(answers)
+        self.sent = 0
+
+    def send(self, request, **kwargs):
+        self.sent += 1
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+
+        status, headers = answer if isinstance(answer, tuple) else (answer, {})
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response._content = b"[]"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class HttpClientTest(unittest.TestCase):
+    def setUp(self):
+        for patch in [
+            mock.patch.object(settings, "HTTP_MAX_RETRIES", 2),
+            mock.patch.object(settings, "HTTP_RATE_LIMIT", 10),
+            mock.patch.object(settings, "HTTP_RATE_LIMITS", {}),
+            mock.patch.object(settings, "CIRCUIT_BREAKER_THRESHOLD", 3),
+            mock.patch.object(settings, "CIRCUIT_BREAKER_COOLDOWN", 60),
+            mock.patch.object(http, "get_retry_delay", return_value=0),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        # Record the waits instead of sleeping
+        sleep = mock.patch("time.sleep")
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+        self.client = HttpClient(pool_size=1)
+
+    def mount(self, *answers: int | tuple[int, dict[str, str]] | Exception) -> StubAdapter:
+        adapter = StubAdapter(*answers)
+        self.client.session.mount("https://", adapter)
+        return adapter
+
+    def test_rate_limited_request_halves_the_rate_and_waits_for_retry_after(self):
+        adapter = self.mount((429, {"Retry-After": "30"}), 200)
+
+        response = self.client.get(url)
+
+        self.assertEqual((response.status_code, adapter.sent), (200, 2))
+        # Halved by the 429, then grown back a step by the success
+        self.assertAlmostEqual(self.client.get_limiter("api.example.com").rate, 10 / 2 * RateLimiter.increase)
+        self.assertGreaterEqual(max(call.args[0] for call in self.sleep.call_args_list), 30)
+
+    def test_request_still_rate_limited_after_every_retry_raises(self):
+        adapter = self.mount(429, 429, 429)
+
+        with self.assertRaises(ThrottledError):
+            self.client.get(url)
+        self.assertEqual(adapter.sent, 3)
+
+    def test_server_error_is_retried(self):
+        adapter = self.mount(503, 200)
+
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(adapter.sent, 2)
+
+    def test_server_error_after_every_retry_raises(self):
+        adapter = self.mount(500, 502, 503)
+
+        with self.assertRaises(requests.HTTPError) as context:
+            self.client.get(url)
+        self.assertEqual(context.exception.response.status_code, 503)
+        self.assertEqual(adapter.sent, 3)
+
+    def test_connection_error_is_retried(self):
+        adapter = self.mount(requests.ConnectionError(), 200)
+
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(adapter.sent, 2)
+
+    def test_client_error_is_returned_without_retrying(self):
+        adapter = self.mount(404)
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(adapter.sent, 1)
+
+    def test_host_failing_too_many_times_is_not_sent_more_requests(self):
+        adapter = self.mount(500, 500, 500)
+        with self.assertRaises(requests.HTTPError):
+            self.client.get(url)
+
+        with self.assertRaises(CircuitOpenError):
+            self.client.get(url)
+        self.assertEqual(adapter.sent, 3)
+
+    def test_throttled_search_is_not_counted_as_no_jobs(self):
+        self.mount(429, 429, 429)
+
+        with mock.patch.object(coresignal, "client", self.client), self.assertRaises(ThrottledError):
+            coresignal.search_jobs("acme", "AI")
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_rate_grows_back_up_to_the_maximum(self):
+        limiter = RateLimiter(10)
+        limiter.throttled(0)
+        self.assertEqual(limiter.rate, 5)
+
+        for _ in range(100):
+            limiter.succeeded()
+        self.assertEqual(limiter.rate, 10)
+
+    def test_requests_wait_for_retry_after(self):
+        limiter = RateLimiter(10, burst=10)
+        limiter.throttled(30)
+
+        self.assertGreaterEqual(limiter.reserve(), 30)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(threshold=2, cooldown=60)
+        self.breaker.failed()
+        self.breaker.failed()
+
+    def test_open_circuit_fails_requests(self):
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.check("api.example.com")
+
+    def test_one_request_is_let_through_after_the_cooldown(self):
+        with mock.patch("time.monotonic", return_value=http.time.monotonic() + 61):
+            self.breaker.check("api.example.com")
+            with self.assertRaises(CircuitOpenError):
+                self.breaker.check("api.example.com")
+
+    def test_successful_request_closes_the_circuit(self):
+        self.breaker.succeeded()
+
+        self.breaker.check("api.example.com")
+
+
+if __name__ == "__main__":
+    unittest.main()
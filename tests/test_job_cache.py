@@ -0,0 +1,55 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from app.schemas.company import CompanyRecord, job_count_keywords
+from app.utils.job_cache import JobCountCache, get_new_job_counts
+
+
+class JobCountCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = JobCountCache(Path(tempfile.mkdtemp()) / "job_counts.sqlite3", ttl=60 * 60)
+
+    def test_counts_are_kept_by_source_and_keyword(self):
+        self.cache.set_many("coresignal", {"acme": {"AI": 1, "IT": 2}})
+        self.cache.set_many("linkedin", {"acme": {"AI": 3}})
+
+        self.assertEqual(
+            self.cache.get_many("coresignal", ["acme", "beta"], ["AI", "IT"]), {"acme": {"AI": 1, "IT": 2}}
+        )
+        self.assertEqual(self.cache.get_many("coresignal", ["acme"], ["AI"]), {"acme": {"AI": 1}})
+        self.assertEqual(self.cache.get_many("linkedin", ["acme"], ["AI", "IT"]), {"acme": {"AI": 3}})
+        self.assertEqual((self.cache.hits, self.cache.misses), (4, 3))
+
+    def test_counts_older_than_the_ttl_are_missing(self):
+        self.cache.set_many("coresignal", {"acme": {"AI": 1}}, fetched_at=time.time() - 2 * 60 * 60)
+        self.cache.set_many("coresignal", {"beta": {"AI": 2}}, fetched_at=time.time() - 30 * 60)
+
+        self.assertEqual(self.cache.get_many("coresignal", ["acme", "beta"], ["AI"]), {"beta": {"AI": 2}})
+
+    def test_counts_fetched_again_replace_the_stored_ones(self):
+        self.cache.set_many("coresignal", {"acme": {"AI": 1}})
+        self.cache.set_many("coresignal", {"acme": {"AI": 5}})
+
+        self.assertEqual(self.cache.get_many("coresignal", ["acme"], ["AI"]), {"acme": {"AI": 5}})
+
+    def test_counts_with_a_fetch_time_keep_the_stored_ones(self):
+        self.cache.set_many("coresignal", {"acme": {"AI": 1}})
+        self.cache.set_many("coresignal", {"acme": {"AI": 5}, "beta": {"AI": 2}}, fetched_at=time.time() - 60)
+
+        self.assertEqual(
+            self.cache.get_many("coresignal", ["acme", "beta"], ["AI"]), {"acme": {"AI": 1}, "beta": {"AI": 2}}
+        )
+
+    def test_new_job_counts_leave_out_the_cached_ones(self):
+        company = CompanyRecord("Acme", "Software", "Austin, TX", "$10M", "50", "https://cience.com/company/acme/1")
+        company.set_job_counts({keyword: 1 for keyword in job_count_keywords})
+        first, *others = job_count_keywords
+
+        self.assertEqual(get_new_job_counts(company, {first: 1}), {keyword: 1 for keyword in others})
+        self.assertEqual(get_new_job_counts(company, None), {keyword: 1 for keyword in job_count_keywords})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+
+from app.core.config import settings
+from app.utils.page_pruning import prune_page_content, split_page_content
+
+
+def details_page(slug: str) -> str:
+    return f"{settings.CIENCE_URL}/company/{slug}/1"
+
+
+table_page = "\n".join(
+    [
+        "[Home](https://www.cience.com/) [Solutions](https://www.cience.com/solutions)",
+        "# Companies",
+        "| Company | Industry | Location | Revenue | Employees |",
+        "|---|---|---|---|---|",
+        f"| [Acme Corp]({details_page('acme')}) | Software | Austin, TX | $10M | 50 |",
+        f"| [Beta Inc]({details_page('beta')}) | Retail | Boston, MA | $20M | 120 |",
+        f"| [Gamma LLC]({details_page('gamma')}) | Banking | Denver, CO | $5M | 30 |",
+        "",
+        "Copyright CIENCE [Privacy](https://www.cience.com/privacy)",
+    ]
+)
+
+card_page = "\n".join(
+    [
+        "[Home](https://www.cience.com/) [Solutions](https://www.cience.com/solutions)",
+        "# Companies",
+        "### Acme Corp",
+        "Software, 50 employees",
+        f"[View profile]({details_page('acme')})",
+        "### Beta Inc",
+        "Retail, 120 employees",
+        f"[View profile]({details_page('beta')})",
+        "### Gamma LLC",
+        "Banking, 30 employees",
+        f"[View profile]({details_page('gamma')})",
+        "Copyright CIENCE",
+        "[Follow us](https://www.linkedin.com/company/cience)",
+    ]
+)
+
+
+class PrunePageContentTest(unittest.TestCase):
+    def test_table_keeps_header_and_rows(self):
+        pruned = prune_page_content(table_page).splitlines()
+
+        self.assertEqual(pruned[0], "| Company | Industry | Location | Revenue | Employees |")
+        self.assertEqual(len(pruned), 5)
+        self.assertIn("[Gamma LLC]", pruned[-1])
+
+    def test_cards_start_at_the_heading_of_the_first_company(self):
+        pruned = prune_page_content(card_page).splitlines()
+
+        self.assertEqual(pruned[:2], ["### Acme Corp", "Software, 50 employees"])
+
+    def test_cards_end_with_the_last_company(self):
+        pruned = prune_page_content(card_page).splitlines()
+
+        self.assertEqual(pruned[-1], f"[View profile]({details_page('gamma')})")
+        self.assertNotIn("Copyright", "\n".join(pruned))
+
+    def test_last_card_stops_at_the_next_section(self):
+        page = card_page.replace("Copyright CIENCE", "## Related searches\nSoftware companies in Texas")
+        pruned = prune_page_content(page)
+
+        self.assertNotIn("Related", pruned)
+        self.assertTrue(pruned.endswith(f"[View profile]({details_page('gamma')})"))
+
+    def test_page_without_companies_is_only_compacted(self):
+        self.assertEqual(prune_page_content("Hello  [world](https://example.com)\n\n![logo](x.png)"), "Hello world")
+
+
+class SplitPageContentTest(unittest.TestCase):
+    def test_small_page_is_one_chunk(self):
+        pruned = prune_page_content(card_page)
+
+        self.assertEqual(split_page_content(pruned, 1000), [pruned])
+
+    def test_table_chunks_repeat_the_header(self):
+        chunks = split_page_content(prune_page_content(table_page), 40)
+
+        self.assertEqual(len(chunks), 3)
+        for chunk, name in zip(chunks, ["Acme Corp", "Beta Inc", "Gamma LLC"]):
+            self.assertTrue(chunk.startswith("| Company | Industry"))
+            self.assertIn(name, chunk)
+
+    def test_card_chunks_keep_each_company_whole(self):
+        chunks = split_page_content(prune_page_content(card_page), 20)
+
+        self.assertEqual(len(chunks), 3)
+        for chunk, (name, slug) in zip(chunks, [("Acme Corp", "acme"), ("Beta Inc", "beta"), ("Gamma LLC", "gamma")]):
+            self.assertTrue(chunk.startswith(f"### {name}"))
+            self.assertEqual(chunk.count("### "), 1)
+            self.assertTrue(chunk.endswith(f"({details_page(slug)})"))
+
+
+if __name__ == "__main__":
+    unittest.main()
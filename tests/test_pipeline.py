@@ -0,0 +1,121 @@
+import asyncio
+import csv
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import requests
+
+from app.core.config import settings
+from app.schemas.company import job_count_keywords
+from app.utils import pipeline
+from app.utils.job_cache import JobCountCache
+from app.utils.journal import RunJournal
+from app.utils.output import CsvWriter
+
+search = ["software", "over-1b"]
+page = f"{settings.CIENCE_URL}/page/1"
+
+
+def get_company(name: str) -> dict[str, str]:
+    return {
+        "company_name": name,
+        "industry": "Software",
+        "location": "Austin, TX",
+        "revenue": "$10M",
+        "employees": "50",
+        "cience_details_page": f"{settings.CIENCE_URL}/company/{name.lower()}/1",
+    }
+
+
+companies = [get_company(name) for name in ["Acme", "Beta", "Gamma"]]
+
+
+class FakeFetcher:
+    def __init__(self, fetch_engine=None):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+async def get_page_content(fetcher, url, prefetched=None):
+    return "page"
+
+
+async def extract_companies(page_content):
+    return [dict(company) for company in companies], "parser"
+
+
+# The names of the companies whose job counts can't be fetched
+failing = set()
+
+
+def enrich(company, cached_counts):
+    if company.company_name in failing:
+        raise requests.HTTPError("500 Server Error")
+
+    return company.set_job_counts({keyword: 1 for keyword in job_count_keywords})
+
+
+class RunPipelineTest(unittest.TestCase):
+    def setUp(self):
+        directory = Path(tempfile.mkdtemp())
+        self.filename = directory / "companies.csv"
+        self.journal_path = directory / "companies.csv.journal"
+        RunJournal.create(self.journal_path, searches=[search], max_pages=None, output=str(self.filename)).close()
+
+        job_cache = JobCountCache(directory / "job_counts.sqlite3", ttl=60 * 60)
+        for patch in [
+            mock.patch.object(pipeline, "CienceFetcher", FakeFetcher),
+            mock.patch.object(pipeline, "get_cience_pages", return_value=([page], {})),
+            mock.patch.object(pipeline, "get_cience_page_content", get_page_content),
+            mock.patch.object(pipeline, "extract_companies_from_page_content", extract_companies),
+            mock.patch.object(
+                pipeline, "get_linkedin_slug_from_page_content", side_effect=lambda _, url: url.split("/")[-2]
+            ),
+            mock.patch.object(pipeline, "get_job_cache", return_value=job_cache),
+            mock.patch.object(settings, "CORESIGNAL_BATCH_SIZE", 0),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(failing.clear)
+
+    def run_pipeline(self) -> RunJournal:
+        journal = RunJournal.load(self.journal_path)
+        with CsvWriter(self.filename, append=True) as writer:
+            asyncio.run(pipeline.run_pipeline(journal, writer, enrich=enrich))
+        journal.close()
+
+        return journal
+
+    def get_written_names(self) -> list[str]:
+        with open(self.filename, newline="") as file:
+            return [row["company_name"] for row in csv.DictReader(file)]
+
+    def test_failed_company_does_not_stop_the_others(self):
+        failing.add("Beta")
+
+        with mock.patch("builtins.print"):
+            journal = self.run_pipeline()
+
+        self.assertEqual(sorted(self.get_written_names()), ["Acme", "Gamma"])
+        self.assertEqual(journal.completed_pages, set())
+
+    def test_failed_company_is_written_when_the_run_is_resumed(self):
+        failing.add("Beta")
+        with mock.patch("builtins.print"):
+            self.run_pipeline()
+            failing.clear()
+            journal = self.run_pipeline()
+
+        self.assertEqual(sorted(self.get_written_names()), ["Acme", "Beta", "Gamma"])
+        self.assertEqual(journal.completed_pages, {(0, 0)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import csv
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from app.schemas.company import CompanyRecord, job_count_keywords
+from app.utils import refresh
+from app.utils.job_cache import JobCountCache
+from app.utils.output import CsvWriter
+from app.utils.refresh import get_refresh_filename, read_baseline_slugs, seed_job_cache, write_delta
+
+
+def get_company(name: str, slug: str, job_count: int, employees: str = "50") -> CompanyRecord:
+    company = CompanyRecord(
+        name, "Software", "Austin, TX", "$10M", employees, f"https://www.cience.com/company/{name}/1", slug
+    )
+    return company.set_job_counts({keyword: job_count for keyword in job_count_keywords})
+
+
+class RefreshTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.baseline = self.write(
+            "companies.csv",
+            get_company("acme", "acme-corp", 1),
+            get_company("beta", "beta-inc", 2),
+            get_company("gamma", "", 3),
+        )
+
+    def write(self, name: str, *companies: CompanyRecord) -> Path:
+        with CsvWriter(self.directory / name) as writer:
+            for company in companies:
+                writer.write(company)
+
+        return self.directory / name
+
+    def test_refresh_file_replaces_the_time_of_an_earlier_refresh(self):
+        filename = get_refresh_filename(self.directory / "companies.20250101-000000.csv")
+
+        self.assertRegex(Path(filename).name, r"^companies\.\d{8}-\d{6}\.csv$")
+        self.assertNotIn("20250101-000000", filename)
+
+    def test_slugs_of_the_baseline_are_reused(self):
+        self.assertEqual(
+            read_baseline_slugs(self.baseline),
+            {"https://www.cience.com/company/acme/1": "acme-corp", "https://www.cience.com/company/beta/1": "beta-inc"},
+        )
+
+    def test_delta_holds_the_added_removed_and_changed_companies(self):
+        filename = self.write(
+            "refreshed.csv",
+            get_company("delta", "delta-co", 0),
+            get_company("beta", "beta-inc", 5, employees="60"),
+            get_company("acme", "acme-corp", 1),
+        )
+
+        changes = write_delta(self.baseline, filename, self.directory / "refreshed.delta.csv")
+
+        self.assertEqual(changes, {"added": 1, "removed": 1, "changed": 1})
+        with open(self.directory / "refreshed.delta.csv", newline="") as file:
+            rows = [(row["change"], row["company_name"], row["changed_fields"]) for row in csv.DictReader(file)]
+        changed_fields = " ".join(["employees", *job_count_keywords.values()])
+        self.assertEqual(rows, [("added", "delta", ""), ("changed", "beta", changed_fields), ("removed", "gamma", "")])
+
+    def test_job_counts_of_the_baseline_are_as_old_as_its_file(self):
+        job_cache = JobCountCache(self.directory / "job_counts.sqlite3", ttl=60 * 60)
+        # Beta's counts were fetched again since the baseline was written
+        job_cache.set_many("coresignal", {"beta-inc": {keyword: 7 for keyword in job_count_keywords}})
+        written_at = time.time() - 2 * 60 * 60
+        os.utime(self.baseline, (written_at, written_at))
+
+        with mock.patch.object(refresh, "get_job_cache", return_value=job_cache):
+            self.assertEqual(seed_job_cache(self.baseline), 2)
+
+        counts = job_cache.get_many("coresignal", ["acme-corp", "beta-inc"], list(job_count_keywords))
+        self.assertEqual(counts, {"beta-inc": {keyword: 7 for keyword in job_count_keywords}})
+
+        job_cache.ttl = 3 * 60 * 60
+        counts = job_cache.get_many("coresignal", ["acme-corp"], list(job_count_keywords))
+        self.assertEqual(counts, {"acme-corp": {keyword: 1 for keyword in job_count_keywords}})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import csv
+import tempfile
+import unittest
+from pathlib import Path
+
+from app.schemas.company import CompanyRecord, company_fields, job_count_keywords
+from app.utils.sharding import merge_results
+from app.utils.work_queue import Task, WorkQueue
+
+
+def get_result(name: str, slug: str) -> dict:
+    company = CompanyRecord(name, "Software", "Austin, TX", "$10M", "50", f"https://cience.com/company/{name}/1", slug)
+    company.set_job_counts({keyword: 1 for keyword in job_count_keywords})
+
+    return dict(zip(company_fields, company.to_row()))
+
+
+class MergeResultsTest(unittest.TestCase):
+    def setUp(self):
+        self.filename = Path(tempfile.mkdtemp()) / "companies.csv"
+        self.queue = WorkQueue.create(
+            self.filename.with_suffix(".queue"), searches=[["software", "over-1b"]], output=str(self.filename)
+        )
+        self.addCleanup(self.queue.close)
+
+    def complete_companies(self, *companies: tuple[int, int, str, str]):
+        # Add the company tasks, then complete them in the reverse order, like workers finishing at different times
+        self.queue.complete(
+            self.queue.claim("a"),
+            new_tasks=[Task("company", name, 0, page, position) for page, position, name, _ in companies],
+        )
+        slugs = {name: slug for _, _, name, slug in companies}
+        tasks = [self.queue.claim("a") for _ in companies]
+        for task in reversed(tasks):
+            self.queue.complete(task, result=get_result(task.key, slugs[task.key]))
+
+    def get_written_names(self) -> list[str]:
+        with open(self.filename, newline="") as file:
+            return [row["company_name"] for row in csv.DictReader(file)]
+
+    def test_companies_are_written_in_the_order_they_were_found_in(self):
+        self.complete_companies((1, 0, "Gamma", "gamma"), (0, 1, "Beta", "beta"), (0, 0, "Acme", "acme"))
+
+        rows, filenames = merge_results(self.queue)
+
+        self.assertEqual((rows, filenames), (3, [self.filename]))
+        self.assertEqual(self.get_written_names(), ["Acme", "Beta", "Gamma"])
+
+    def test_company_found_under_two_details_pages_is_written_first_time_only(self):
+        self.complete_companies(
+            (0, 0, "Acme", "acme"), (0, 1, "Acme Corp", "acme"), (0, 2, "Beta", ""), (0, 3, "Gamma", "")
+        )
+
+        rows, _ = merge_results(self.queue)
+
+        self.assertEqual(rows, 3)
+        self.assertEqual(self.get_written_names(), ["Acme", "Beta", "Gamma"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from app.utils.snapshot import SnapshotMissError, SnapshotStore
+
+urls = [f"https://www.cience.com/company/{i}/1" for i in range(50)]
+
+
+class SnapshotStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.path = Path(tempfile.mkdtemp()) / "snapshot"
+
+    def record(self, responses: dict[str, str], close: bool = True):
+        store = SnapshotStore()
+        store.open(self.path)
+        for url, body in responses.items():
+            store.put(url, 200, body)
+
+        if close:
+            store.close()
+        else:
+            # Stop like a crashed run, without sorting the index
+            store._data.close()
+            store._index.close()
+
+    def replay(self) -> SnapshotStore:
+        store = SnapshotStore()
+        store.open(self.path, replay=True)
+        self.addCleanup(store.close)
+        return store
+
+    def test_recorded_responses_are_replayed(self):
+        self.record({url: f"page {url}" for url in urls})
+
+        store = self.replay()
+
+        for url in urls:
+            self.assertEqual(store.find(url), (200, f"page {url}"))
+        self.assertEqual(store.replayed, len(urls))
+
+    def test_kinds_of_content_are_kept_apart(self):
+        store = SnapshotStore()
+        store.open(self.path)
+        store.put(urls[0], 200, "<p>html</p>")
+        store.put(urls[0], 200, "markdown", kind="markdown")
+        store.close()
+
+        store = self.replay()
+
+        self.assertEqual(store.find(urls[0]), (200, "<p>html</p>"))
+        self.assertEqual(store.find(urls[0], kind="markdown"), (200, "markdown"))
+
+    def test_response_not_recorded_is_a_miss(self):
+        self.record({urls[0]: "page"})
+
+        store = self.replay()
+
+        self.assertIsNone(store.find(urls[1]))
+        with self.assertRaises(SnapshotMissError):
+            store.get(urls[1])
+
+    def test_recording_a_url_again_replaces_its_response(self):
+        self.record({url: "old" for url in urls})
+        self.record({urls[3]: "new"})
+
+        store = self.replay()
+
+        self.assertEqual(store.find(urls[3]), (200, "new"))
+        self.assertEqual(store.find(urls[4]), (200, "old"))
+        self.assertEqual((self.path / "pages.idx").stat().st_size, 16 + len(urls) * 32)
+
+    def test_snapshot_not_closed_is_replayed_from_its_unsorted_entries(self):
+        self.record({url: "old" for url in urls})
+        self.record({urls[3]: "new", urls[-1] + "/more": "more"}, close=False)
+        # The run crashed while writing an index entry
+        with open(self.path / "pages.idx", "ab") as file:
+            file.write(b"\0" * 10)
+
+        store = self.replay()
+
+        self.assertEqual(store.find(urls[3]), (200, "new"))
+        self.assertEqual(store.find(urls[-1] + "/more"), (200, "more"))
+        self.assertEqual(store.find(urls[4]), (200, "old"))
+
+    def test_recording_to_a_snapshot_not_closed_sorts_every_entry(self):
+        self.record({urls[0]: "first"}, close=False)
+        self.record({urls[1]: "second"})
+
+        store = self.replay()
+
+        self.assertEqual(store._unsorted, {})
+        self.assertEqual(store.find(urls[0]), (200, "first"))
+        self.assertEqual(store.find(urls[1]), (200, "second"))
+
+    def test_recording_after_a_crash_in_the_middle_of_an_index_entry(self):
+        self.record({urls[0]: "first"}, close=False)
+        with open(self.path / "pages.idx", "ab") as file:
+            file.write(b"\0" * 10)
+        self.record({urls[1]: "second"})
+
+        store = self.replay()
+
+        self.assertEqual(store.find(urls[0]), (200, "first"))
+        self.assertEqual(store.find(urls[1]), (200, "second"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from app.utils.work_queue import Task, WorkQueue
+
+
+class WorkQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.path = Path(tempfile.mkdtemp()) / "run.queue"
+        WorkQueue.create(self.path, searches=[["software", "over-1b"], ["internet", "over-1b"]]).close()
+
+        self.queue = WorkQueue(self.path, lease_seconds=60, max_attempts=2)
+        self.addCleanup(self.queue.close)
+
+    def expire_leases(self):
+        with sqlite3.connect(self.path) as connection:
+            connection.execute("UPDATE tasks SET lease_until = 0 WHERE state = 'claimed'")
+        connection.close()
+
+    def test_companies_are_claimed_before_pages_and_searches(self):
+        search = self.queue.claim("a")
+        self.queue.complete(search, new_tasks=[Task("page", "p1", 0), Task("company", "c1", 0, 0, 3)])
+
+        self.assertEqual(self.queue.claim("a").key, "c1")
+        self.assertEqual(self.queue.claim("a").key, "p1")
+        self.assertEqual(self.queue.claim("a").key, "1")
+
+    def test_task_of_an_expired_lease_is_claimed_by_another_worker(self):
+        task = self.queue.claim("a")
+        self.assertEqual(self.queue.claim("b").key, "1")
+
+        self.expire_leases()
+
+        self.assertEqual(self.queue.claim("b").key, task.key)
+
+    def test_renewed_lease_is_kept(self):
+        self.queue.claim("a")
+        self.queue.claim("a")
+        self.expire_leases()
+
+        self.queue.renew("a")
+
+        self.assertIsNone(self.queue.claim("b"))
+
+    def test_result_of_an_expired_lease_is_dropped_once_the_task_is_done(self):
+        task = self.queue.claim("a")
+        self.expire_leases()
+        self.assertTrue(self.queue.complete(self.queue.claim("b"), result="b"))
+
+        self.assertFalse(self.queue.complete(task, result="a"))
+        self.assertEqual(list(self.queue.iter_results("search")), ["b"])
+
+    def test_task_released_max_attempts_times_is_given_up_on(self):
+        for _ in range(2):
+            task = self.queue.claim("a")
+            self.assertEqual(task.key, "0")
+            self.queue.release(task, "a", "RuntimeError()")
+
+        self.assertEqual(self.queue.claim("a").key, "1")
+        self.assertEqual([(task.key, error) for task, error in self.queue.get_failures()], [("0", "RuntimeError()")])
+
+    def test_failed_tasks_are_tried_again(self):
+        for _ in range(2):
+            self.queue.release(self.queue.claim("a"), "a", "RuntimeError()")
+
+        self.assertEqual(self.queue.retry_failed(), 1)
+        self.assertEqual(self.queue.claim("a").key, "0")
+
+    def test_run_is_finished_once_every_task_is_done_or_given_up_on(self):
+        search = self.queue.claim("a")
+        for _ in range(2):
+            self.queue.release(self.queue.claim("b"), "b", "RuntimeError()")
+        self.assertFalse(self.queue.is_finished())
+
+        self.queue.complete(search)
+
+        self.assertTrue(self.queue.is_finished())
+
+
+if __name__ == "__main__":
+    unittest.main()